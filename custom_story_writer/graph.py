@@ -0,0 +1,351 @@
+from google.adk.agents import LlmAgent, BaseAgent
+from story_common.config import StoryConfig
+from story_common.routing import get_router
+from story_common.replay import with_llm_trace
+from story_common.refinement import RefinementLoopAgent
+from story_common.drafts import with_multi_draft
+from story_common.critics import with_critic_panel
+from story_common.longform import with_long_form
+from story_common.story_index import get_story_index, with_story_reuse
+from story_common.patching import with_patch_refiner
+from story_common.streaming import stream_output, no_stream
+from story_common.metrics import instrument_agent_tree
+from story_common.ratelimit import label_agent_tree
+from story_common.prompts import compile_agent_tree
+from story_common.history import compact_agent_tree
+from story_common.tracing import EventTracer
+from story_common.checkpoint import CheckpointedSequentialAgent, Checkpointer, get_checkpoint_store
+from story_common.topics import extract_topic_locally, parse_story_topic
+from story_common.user_input import get_input_channel, input_timeout
+from google.adk.models.llm_response import LlmResponse
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from typing import AsyncGenerator
+from typing_extensions import override
+from google.genai import types
+import logging
+
+logger = logging.getLogger(__name__)
+# Events are serialized only when the trace level is enabled; recent ones are dumped on errors
+tracer = EventTracer.from_env(logger)
+
+# --- Constants ---
+APP_NAME = "story_writing_agent" # New App Name
+USER_ID = "user_01"
+SESSION_ID_BASE = "loop_exit_tool_session" # New Base Session ID
+# Routes each agent to its configured models (see story_common/routing.py); shared across the packages.
+# STORY_LLM_RECORD / STORY_LLM_REPLAY record the traffic to a trace file or serve it from one
+LLM_MODEL = with_llm_trace(get_router())
+# --- State Keys ---
+STATE_CURRENT_TOPIC = "current_topic"
+STATE_REFINED_TOPIC = "refined_topic"
+STATE_CURRENT_DOC = "current_document"
+STATE_CURRENT_TITLE = "current_title"
+STATE_CRITICISM = "criticism"
+# Plain-text completion signal, still accepted by the refinement loop besides the JSON verdict
+COMPLETION_PHRASE = "No major issues found."
+# Drafts, critics, refine mode, chapters, deadlines and history limits (STORY_* environment variables)
+CONFIG = StoryConfig.from_env()
+
+# --- Agent Definitions ---
+
+# --- Custom Orchestrator Agent ---
+class VibeWritingAgent(BaseAgent):
+    """
+    Custom agent for a story generation and refinement workflow.
+    I use custom agent because I need the first agent to interact with the user to collect topic and theme.
+    """
+
+    # --- Field Declarations for Pydantic ---
+    # Declare the agents passed during initialization as class attributes with type hints
+    topic_collector_agent: LlmAgent
+    initial_writer_agent: BaseAgent
+    critic_agent_in_loop: LlmAgent
+    refiner_agent_in_loop: BaseAgent
+
+    story_refinement_loop: RefinementLoopAgent
+    story_writing_pipeline: CheckpointedSequentialAgent
+
+    # model_config allows setting Pydantic configurations if needed, e.g., arbitrary_types_allowed
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        topic_collector_agent: LlmAgent,
+        initial_writer_agent: BaseAgent,
+        critic_agent_in_loop: LlmAgent,
+        refiner_agent_in_loop: BaseAgent
+    ):
+        """
+        Initializes the VibeWritingAgent.
+
+        Args:
+            name: The name of the agent.
+            topic_collector_agent: An LlmAgent to collect topic and theme.
+            initial_writer_agent: An agent to generate the initial story (an LlmAgent, or a MultiDraftWriterAgent).
+            critic_agent_in_loop: An LlmAgent to critique the story.
+            refiner_agent_in_loop: An agent to refine the story (an LlmAgent, or a PatchRefinerAgent).
+        """
+        # Create internal agents *before* calling super().__init__
+        # STEP 2: Refinement Loop Agent
+        # The loop ends locally on the critic verdict, without a refiner call to exit_loop
+        story_refinement_loop = RefinementLoopAgent(
+            name="StoryRefinementLoop",
+            # Several specialized critics per round, if enabled, merged into one criticism
+            critic_agent=with_critic_panel(critic_agent_in_loop, CONFIG.critics, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC),
+            refiner_agent=refiner_agent_in_loop,
+            max_iterations=5, # Limit loops
+            criticism_key=STATE_CRITICISM,
+            document_key=STATE_CURRENT_DOC,
+            completion_phrase=COMPLETION_PHRASE,
+            convergence_threshold=CONFIG.convergence_threshold,
+            latency_budget=CONFIG.latency_budget,
+        )
+        # Long-form mode: outline, then write and refine the chapters concurrently
+        writing_steps = with_long_form(
+            [initial_writer_agent, story_refinement_loop], CONFIG.num_chapters, LLM_MODEL,
+            story_refinement_loop.critic_agent, story_refinement_loop.refiner_agent,
+            topic_key=STATE_CURRENT_TOPIC, document_key=STATE_CURRENT_DOC, criticism_key=STATE_CRITICISM,
+            max_iterations=5, completion_phrase=COMPLETION_PHRASE,
+            convergence_threshold=CONFIG.convergence_threshold, latency_budget=CONFIG.latency_budget,
+        )
+        # Reuse or adapt finished stories on near-duplicate topics, if enabled
+        writing_steps = with_story_reuse(writing_steps, get_story_index(), LLM_MODEL, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC)
+
+        # STEP 3: Overall Sequential Pipeline
+        # For ADK tools compatibility, the root agent must be named `root_agent`
+        # Saves a checkpoint after each stage; the root agent restores it after a restart
+        story_writing_pipeline = CheckpointedSequentialAgent(
+            name="StoryWritingPipeline",
+            resume=False,
+            sub_agents=[
+                *writing_steps, # Create the initial doc, then run the critique/refine loop (or write the chapters)
+            ],
+            description="Writes an initial document and then iteratively refines it with critique using an exit tool."
+        )
+        # Define the sub_agents list for the framework
+        sub_agents_list = [
+            topic_collector_agent,
+            story_writing_pipeline,
+        ]
+
+        # STEP 4: Initialize the root agent
+        # Pydantic will validate and assign them based on the class annotations.
+        super().__init__(
+            name=name,
+            topic_collector_agent=topic_collector_agent,
+            initial_writer_agent=initial_writer_agent,
+            critic_agent_in_loop=critic_agent_in_loop,
+            refiner_agent_in_loop=refiner_agent_in_loop,
+            story_refinement_loop=story_refinement_loop,
+            story_writing_pipeline=story_writing_pipeline,
+            sub_agents=sub_agents_list, # Pass the sub_agents list directly
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        """
+        Implements the custom orchestration logic for the vibe story writing workflow.
+        Uses the instance attributes assigned by Pydantic (e.g., self.story_generator).
+        """
+        try:
+            async for event in self._run_workflow(ctx):
+                yield event
+        except Exception as e:
+            tracer.dump(ctx.session.id, f"{type(e).__name__}: {e}")
+            raise
+
+    async def _run_workflow(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        logger.info(f"[{self.name}] Starting story generation workflow.")
+        ctx.session.state["init_topic"] = ""
+        # Restores the state of an interrupted session with the same id, if any
+        checkpointer = Checkpointer(self.name, get_checkpoint_store())
+        if event := await checkpointer.begin(ctx):
+            yield event
+ 
+        # 1. Initial Story topic collection (skipped if completed before a restart)
+        logger.info(f"[{self.name}] Running TopicCollectorAgent...")
+        topic_collected = checkpointer.is_completed(ctx, self.topic_collector_agent.name)
+        while not topic_collected:
+            async for event in self.topic_collector_agent.run_async(ctx):
+                tracer.trace(ctx.session.id, "TopicCollectorAgent", event)
+                yield event
+
+            # Check if story was generated before proceeding
+            topic = ctx.session.state.get("current_topic", "")
+            if topic == "":
+                logger.error(f"[{self.name}] Failed to generate initial story. Aborting workflow.")
+                tracer.dump(ctx.session.id, "no topic collected")
+                return # Stop processing if initial story failed
+            elif parse_story_topic(topic):
+                logger.info(f"[{self.name}] Topic collected: {topic}")
+                if event := checkpointer.complete(ctx, self.topic_collector_agent.name):
+                    yield event
+                    await checkpointer.save(ctx, self.topic_collector_agent.name)
+                break
+            else:
+                # Wait for the answer without blocking other sessions, if an input channel is configured.
+                # Otherwise end the turn: the collector's question has been yielded, and the user's
+                # next message re-runs this agent with the whole conversation in the collector's history.
+                channel = get_input_channel()
+                user_input = await channel.ask(ctx.session.id, "[user]:", input_timeout()) if channel else None
+                if user_input is None:
+                    logger.info(f"[{self.name}] Topic collection not complete. Waiting for the next user turn.")
+                    return
+                logger.info(f"[{self.name}] Topic collection not complete. Retrying...")
+                ctx.session.state["init_topic"] = ctx.session.state["init_topic"] + "\n and: " + user_input
+
+        logger.info(f"[{self.name}] Story state after topic collection: {ctx.session.state.get('current_topic')}")
+
+
+        # 2. Story Writing Pipeline (includes initial writer and refinement loop)
+        logger.info(f"[{self.name}] Generating story and refining in loop...")
+        async for event in self.story_writing_pipeline.run_async(ctx):
+            tracer.trace(ctx.session.id, "StoryWritingPipeline", event)
+            yield event
+
+        logger.info(f"[{self.name}] Story state after loop: {ctx.session.state.get('current_document')}")
+        await checkpointer.finish(ctx)
+        # The story is written; its events are only kept for a failure dump
+        tracer.discard(ctx.session.id)
+
+        logger.info(f"[{self.name}] Workflow finished.")
+
+# STEP 0: Topic Collector Agent
+topic_collector_agent = LlmAgent(
+    name="TopicCollectorAgent",
+    model=LLM_MODEL,
+    include_contents='default',
+    instruction=f"""You are collecting topic and theme for a story.
+                Look at the conversation history and "{{init_topic}}" to extract topic and theme.
+                Example topics: a person who wants to save the city with his friends, a programmer was rejected by his girlfriend.
+                Example themes: fantasy, science fiction, horror, romance, comedy, drama, thriller, mystery, young adult, middle grade.
+
+                IF you can identify BOTH a clear topic and valid theme from the conversation:
+                - You must respond with "STORY: [topic: [user's topic], theme: [user's theme]]". 
+                - Topic and theme cannot be the same. If they are the same, you must ask for a different topic or theme.
+                - Do not output any additional text.
+
+                ELSE if either topic or theme is missing:
+                - Ask specifically for the missing parts (topic or theme or both).
+                """,
+    output_key=STATE_CURRENT_TOPIC,
+    # Well-formed input (e.g. "a horror story about ...") is turned into the STORY line without an LLM call
+    before_model_callback=extract_topic_locally,
+)
+
+# STEP 1: Initial Writer Agent (Runs ONCE at the beginning)
+initial_writer_agent = LlmAgent(
+    name="InitialWriterAgent",
+    model=LLM_MODEL,
+    include_contents= 'none',
+    instruction=f"""You are a Creative Writing Assistant tasked with starting a flash short story.
+    Write the *first draft* of a short story (aim for 3-6 sentences) based only on the topic and theme below.
+    Try to introduce a specific element (like a character, a setting detail, or a starting action) to make it engaging.
+    Output *only* the story document text. Do not add introductions or explanations.
+    
+    Topic and Theme: ```{{current_topic}}```
+
+    Make sure the story is interesting and engaging.
+    """,
+    description="Writes the initial document draft based on the topic, aiming for some initial substance.",
+    output_key=STATE_CURRENT_DOC,
+    before_model_callback=stream_output, # Stream the draft to the user as it is written
+)
+
+# STEP 1b: Optionally write several drafts concurrently and promote the best one
+initial_writer_step = with_multi_draft(initial_writer_agent, CONFIG.num_drafts, CONFIG.draft_selection, STATE_CURRENT_TOPIC)
+
+# STEP 2a: Critic Agent (Inside the Refinement Loop)
+critic_agent_in_loop = LlmAgent(
+    name="CriticAgent",
+    model=LLM_MODEL,
+    include_contents='none',
+    instruction=f"""You are a Constructive Critic AI reviewing a short story draft (typically 3-6 sentences) for a flash story. Your goal is to help the writer improve the story.
+
+    **Topic and Theme:**
+    ```{{current_topic}}```
+
+    **Story to Review:**
+    ```
+    {{current_document}}
+    ```
+
+    **Task:**
+    Review the story for clarity, engagement, and  coherence according to the initial topic and theme.
+
+    IF you identify 1-2 *clear and actionable* ways the story could be improved to better capture the topic or enhance reader engagement 
+    (e.g., "Needs a stronger opening sentence", 
+    "Clarify the character's goal", 
+    "Plot twist is too simple", 
+    "Need more conflicts", 
+    "Closing statement is not a real cliffhanger"):
+    Respond with {{"done": false, "issues": ["<suggestion 1>", "<suggestion 2>"]}}, one concise suggestion per item.
+
+
+    ELSE IF the story is coherent, addresses the topic adequately for its length, and has no glaring errors or obvious omissions:
+    Respond with {{"done": true, "issues": []}}.
+
+    Output *only* the JSON object. Do not add explanations or code fences.
+""",
+    description="Reviews the current story and returns a JSON verdict: done, or the issues to fix.",
+    output_key=STATE_CRITICISM,
+    before_model_callback=no_stream, # The verdict is parsed by the loop, never shown while streaming
+)
+
+
+# STEP 2b: Refiner/Exiter Agent (Inside the Refinement Loop)
+refiner_agent_in_loop = LlmAgent(
+    name="RefinerAgent",
+    model=LLM_MODEL,
+    # Relies solely on state via placeholders
+    include_contents='none',
+    instruction=f"""You are a Creative Writing Assistant refining a story based on critique.
+
+    **Topic and Theme:**
+    ```{{current_topic}}```
+    
+    **Current Story:**
+    ```
+    {{current_document}}
+    ```
+    
+    **Critique/Suggestions:**
+    ```
+    {{criticism}}
+    ```
+    **Task:**
+    Carefully apply the suggestions to improve the 'Current Story'. Output *only* the refined story text.
+
+    Do not add explanations.
+""",
+    description="Refines the story based on critique. Only runs when the critic has found issues.",
+    output_key=STATE_CURRENT_DOC, # Overwrites state['current_document'] with the refined version
+    before_model_callback=stream_output, # Stream the revision to the user as it is written
+)
+
+# STEP 2b: Sentence-level patch refiner, if enabled (falls back to the refiner above)
+refiner_step = with_patch_refiner(refiner_agent_in_loop, CONFIG.refine_mode, STATE_CURRENT_TOPIC, STATE_CRITICISM)
+
+root_agent = VibeWritingAgent(
+    name="VibeWritingAgent",
+    topic_collector_agent=topic_collector_agent,
+    initial_writer_agent=initial_writer_step,
+    critic_agent_in_loop=critic_agent_in_loop,
+    refiner_agent_in_loop=refiner_step,
+)
+
+# Keep the conversation history the agents reading it send within a fixed number of turns and tokens
+compact_agent_tree(root_agent, CONFIG.history_turns, CONFIG.history_token_budget)
+# Move the state placeholders of every instruction after its static text, so the provider
+# can serve the prefix from its prompt cache
+compile_agent_tree(root_agent)
+# Record LLM latency and token metrics for every agent in the tree, and label its
+# LLM calls with the session priority and tenant for the rate limiter
+instrument_agent_tree(root_agent)
+label_agent_tree(root_agent)
@@ -0,0 +1,313 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from story_common.config import StoryConfig
+from story_common.routing import get_router
+from story_common.replay import with_llm_trace
+from story_common.refinement import RefinementLoopAgent
+from story_common.drafts import with_multi_draft
+from story_common.critics import with_critic_panel
+from story_common.longform import with_long_form
+from story_common.story_index import get_story_index, with_story_reuse
+from story_common.patching import with_patch_refiner
+from story_common.streaming import stream_output, no_stream
+from story_common.metrics import instrument_agent_tree, MeteredLoopAgent
+from story_common.ratelimit import label_agent_tree
+from story_common.prompts import compile_agent_tree
+from story_common.history import compact_agent_tree
+from story_common.topics import extract_topic_locally, parse_story_topic
+from story_common.user_input import STATE_AWAITING_INPUT, TurnAwareSequentialAgent, get_input_channel, input_timeout
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+import logging
+from google.adk.agents.callback_context import CallbackContext
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+APP_NAME = "story_writing_assistant" # New App Name
+USER_ID = "user_01"
+SESSION_ID_BASE = "loop_exit_tool_session" # New Base Session ID
+# Routes each agent to its configured models (see story_common/routing.py); shared across the packages.
+# STORY_LLM_RECORD / STORY_LLM_REPLAY record the traffic to a trace file or serve it from one
+LLM_MODEL = with_llm_trace(get_router())
+# --- State Keys ---
+STATE_CURRENT_TOPIC = "current_topic"
+STATE_REFINED_TOPIC = "refined_topic"
+STATE_CURRENT_DOC = "current_document"
+STATE_CURRENT_TITLE = "current_title"
+STATE_CRITICISM = "criticism"
+# Plain-text completion signal, still accepted by the refinement loop besides the JSON verdict
+COMPLETION_PHRASE = "No major issues found."
+# Drafts, critics, refine mode, chapters, deadlines and history limits (STORY_* environment variables)
+CONFIG = StoryConfig.from_env()
+
+def topic_collection(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmRequest]:
+
+    """Inspects/modifies the LLM request or skips the call."""
+    agent_name = callback_context.agent_name
+    logger.info(f"[Callback] Before model call for agent: {agent_name}")
+
+    # Inspect the last user message in the request contents
+    last_user_message = ""
+    if llm_request.contents and llm_request.contents[-1].role == 'user':
+         if llm_request.contents[-1].parts:
+            last_user_message = llm_request.contents[-1].parts[0].text
+            logger.info(f"[Callback] Inspecting last user message: '{last_user_message}'")
+            topic = callback_context.state.get(STATE_CURRENT_TOPIC, "")
+
+            if callback_context.state.get(STATE_AWAITING_INPUT):
+                # The user answered our clarification request in a new turn: merge it into the topic
+                topic = merge_topic(topic, last_user_message.strip())
+                callback_context.state[STATE_CURRENT_TOPIC] = topic
+                callback_context.state[STATE_AWAITING_INPUT] = False
+
+            if last_user_message and "EXIT" not in last_user_message.upper() and topic != "":
+                logger.info(f"[Callback] Changing last user message: '{topic}'")
+                llm_request.contents[-1].parts[0].text = topic
+                # should not return llm_request here, because ADK thinks it's llm_response.
+
+    # Return None to allow the (modified) request to go to the LLM
+    return None
+
+def merge_topic(topic: str, additional_info: str) -> str:
+    """Appends the user's answer to the topic collected so far ('exit' replaces it)."""
+    if 'exit' == additional_info:
+        return additional_info
+    return topic + ". With additional information: " + additional_info
+
+def clarification_question(topic: str) -> str:
+    """Returns the question that asks the user to complete the topic collected so far."""
+    return f"Your originial info is incomplete. {topic}\nPlease provide the missing part."
+
+class TopicConfirmationAgent(BaseAgent):
+    """
+    Checks the STORY format of the collected topic locally, without an LLM call.
+
+    A complete topic ends TopicCollectorLoop. For an incomplete one the agent asks the
+    user for the missing part. With an input channel it waits for the answer, without
+    blocking other sessions, and merges it into the topic for the next round; otherwise,
+    or if no answer arrives in time, it leaves the loop with awaiting_user_input set,
+    which ends the turn, and topic_collection merges the user's next message.
+    """
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        topic = ctx.session.state.get(STATE_CURRENT_TOPIC, "")
+        if parse_story_topic(topic):
+            logger.info(f"[{self.name}] Topic confirmed locally: '{topic}'")
+        else:
+            yield Event(
+                invocation_id=ctx.invocation_id,
+                author=self.name,
+                branch=ctx.branch,
+                content=types.Content(role="model", parts=[types.Part(text=clarification_question(topic))]),
+                actions=EventActions(state_delta={STATE_AWAITING_INPUT: True}),
+            )
+            channel = get_input_channel()
+            answer = await channel.ask(ctx.session.id, "[user]:", input_timeout()) if channel is not None else None
+            if answer is not None:
+                yield Event(
+                    invocation_id=ctx.invocation_id,
+                    author=self.name,
+                    branch=ctx.branch,
+                    actions=EventActions(state_delta={STATE_CURRENT_TOPIC: merge_topic(topic, answer), STATE_AWAITING_INPUT: False}),
+                )
+                return
+            logger.info(f"[{self.name}] No answer yet. Ending the turn.")
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(escalate=True),
+        )
+
+# --- Agent Definitions ---
+# STEP 0a: Topic Collector Agent
+topic_collector_agent = LlmAgent(
+    name="TopicCollectorAgent",
+    model=LLM_MODEL,
+    include_contents='default',
+    instruction=f"""You are collecting topic and theme for a flash story.
+                Look at the full conversation history and the following requirements to extract topic and theme from the user input.
+                Example topics: a person who wants to save the city with his friends, a programmer was rejected by his girlfriend.
+                Example themes: fantasy, science fiction, horror, romance, comedy, drama, thriller, mystery, young adult, middle grade.
+
+                IF the user provides BOTH a clear topic and a valid theme,
+                - You should respond in the form of "STORY: [topic: [user's topic], theme: [user's theme]]". 
+                - Topic should not be a simple phrase like "a man smoking".
+                - Theme should not be the same as the topic.
+                - Don't output any other text.
+
+                ELSE if the user cannot provide either topic or theme:
+                - Respond with "Original input: [user's input]". Nothing else.
+                - Don't output any other text.
+                """,
+    output_key=STATE_CURRENT_TOPIC,
+    # Well-formed input (e.g. "a horror story about ...") is turned into the STORY line without an LLM call
+    before_model_callback=[topic_collection, extract_topic_locally],
+)
+
+# STEP 0b: Topic Confirmation Agent (checks the STORY format locally)
+topic_confirm_agent = TopicConfirmationAgent(
+    name="TopicConfirmationAgent",
+    description="Leaves the topic loop once the topic is complete, or asks the user for the missing part.",
+)
+
+# STEP 0: Loop agent to control the interaction with topic collector agent
+topic_collector_loop = MeteredLoopAgent(
+    name="TopicCollectorLoop",
+    sub_agents=[
+        topic_collector_agent,
+        topic_confirm_agent,
+    ],
+    max_iterations=5 # Limit loops
+)
+
+
+# STEP 1: Initial Writer Agent (Runs ONCE at the beginning)
+initial_writer_agent = LlmAgent(
+    name="InitialWriterAgent",
+    model=LLM_MODEL,
+    include_contents= 'none',
+    instruction=f"""You are a Creative Writing Assistant tasked with starting a flash short story.
+    Write the *first draft* of a short story (aim for 3-6 sentences) based only on the topic below.
+    
+    Topic: ```{{current_topic}}```
+
+    Try to introduce a specific element (like a character, a setting detail, or a starting action) to make it engaging.
+    Output *only* the story text. Do not add introductions or explanations.
+    Make sure the story is interesting and engaging.
+    """,
+    description="Writes the initial story based on the topic, aiming for some initial substance.",
+    output_key=STATE_CURRENT_DOC,
+    before_model_callback=stream_output, # Stream the draft to the user as it is written
+)
+
+# STEP 1b: Optionally write several drafts concurrently and promote the best one
+initial_writer_step = with_multi_draft(initial_writer_agent, CONFIG.num_drafts, CONFIG.draft_selection, STATE_CURRENT_TOPIC)
+
+# STEP 2a: Critic Agent (Inside the Refinement Loop)
+critic_agent_in_loop = LlmAgent(
+    name="CriticAgent",
+    model=LLM_MODEL,
+    include_contents='none',
+    instruction=f"""You are a Constructive Critic AI reviewing a short story draft (typically 3-6 sentences) for a flash story. Your goal is to help the writer improve the story.
+    **Story to Review:**
+    ```
+    {{current_document}}
+    ```
+
+    **Task:**
+    Review the story for clarity, engagement, and  coherence according to the initial topic and theme.
+
+    IF you identify 1-2 *clear and actionable* ways the story could be improved to better capture the topic or enhance reader engagement 
+    (e.g., "Needs a stronger opening sentence", 
+    "Clarify the character's goal", 
+    "Plot twist is too simple", 
+    "Need more conflicts", 
+    "Closing statement is not a real cliffhanger"):
+    Respond with {{"done": false, "issues": ["<suggestion 1>", "<suggestion 2>"]}}, one concise suggestion per item.
+
+
+    ELSE IF the story is coherent, addresses the topic adequately for its length, and has no glaring errors or obvious omissions:
+    Respond with {{"done": true, "issues": []}}.
+
+    Output *only* the JSON object. Do not add explanations or code fences.
+""",
+    description="Reviews the current story and returns a JSON verdict: done, or the issues to fix.",
+    output_key=STATE_CRITICISM,
+    before_model_callback=no_stream, # The verdict is parsed by the loop, never shown while streaming
+)
+
+# STEP 2a: Optionally review each round with concurrent specialized critics, merged into one criticism
+critic_step = with_critic_panel(critic_agent_in_loop, CONFIG.critics, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC)
+
+
+# STEP 2b: Refiner/Exiter Agent (Inside the Refinement Loop)
+refiner_agent_in_loop = LlmAgent(
+    name="RefinerAgent",
+    model=LLM_MODEL,
+    # Relies solely on state via placeholders
+    include_contents='none',
+    instruction=f"""You are a Creative Writing Assistant refining a story based on critique.
+
+    **Topic and Theme:**
+    ```{{current_topic}}```
+    
+    **Current Story:**
+    ```
+    {{current_document}}
+    ```
+    
+    **Critique/Suggestions:**
+    ```
+    {{criticism}}
+    ```
+    **Task:**
+    Carefully apply the suggestions to improve the 'Current Story'. Output *only* the refined story text.
+
+    Do not add explanations.
+""",
+    description="Refines the story based on critique. Only runs when the critic has found issues.",
+    output_key=STATE_CURRENT_DOC, # Overwrites state['current_document'] with the refined version
+    before_model_callback=stream_output, # Stream the revision to the user as it is written
+)
+
+# STEP 2b: Sentence-level patch refiner, if enabled (falls back to the refiner above)
+refiner_step = with_patch_refiner(refiner_agent_in_loop, CONFIG.refine_mode, STATE_CURRENT_TOPIC, STATE_CRITICISM)
+
+
+# Create internal agents *before* calling super().__init__
+# STEP 2: Refinement Loop Agent
+# The loop ends locally on the critic verdict, without a refiner call to exit_loop
+story_refinement_loop = RefinementLoopAgent(
+    name="StoryRefinementLoop",
+    critic_agent=critic_step,
+    refiner_agent=refiner_step,
+    max_iterations=5, # Limit loops
+    criticism_key=STATE_CRITICISM,
+    document_key=STATE_CURRENT_DOC,
+    completion_phrase=COMPLETION_PHRASE,
+    convergence_threshold=CONFIG.convergence_threshold,
+    latency_budget=CONFIG.latency_budget,
+)
+
+# STEP 2c: Long-form mode: outline, then write and refine the chapters concurrently
+writing_steps = with_long_form(
+    [initial_writer_step, story_refinement_loop], CONFIG.num_chapters, LLM_MODEL,
+    critic_step, refiner_step,
+    topic_key=STATE_CURRENT_TOPIC, document_key=STATE_CURRENT_DOC, criticism_key=STATE_CRITICISM,
+    max_iterations=5, completion_phrase=COMPLETION_PHRASE,
+    convergence_threshold=CONFIG.convergence_threshold, latency_budget=CONFIG.latency_budget,
+)
+
+# STEP 2d: Reuse or adapt finished stories on near-duplicate topics, if enabled
+writing_steps = with_story_reuse(writing_steps, get_story_index(), LLM_MODEL, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC)
+
+# STEP 3: Overall Sequential Pipeline
+# For ADK tools compatibility, the root agent must be named `root_agent`
+# It ends the turn early while the topic collection waits for the user's answer
+story_writing_pipeline = TurnAwareSequentialAgent(
+    name="StoryWritingPipeline",
+    sub_agents=[
+        topic_collector_loop, # Run first to collect topic and theme
+        *writing_steps, # Then create the initial doc and run the critique/refine loop (or write the chapters)
+    ],
+    description="Writes an initial document and then iteratively refines it with critique using an exit tool."
+)
+
+
+# Bound the conversation history the topic collector sends, move the state placeholders of
+# every instruction after its static text, so the provider can serve the prefix from its
+# prompt cache; record LLM latency and token metrics for every
+# agent in the tree, and label its LLM calls with the session priority and tenant for the rate limiter
+root_agent = label_agent_tree(instrument_agent_tree(compile_agent_tree(
+    compact_agent_tree(story_writing_pipeline, CONFIG.history_turns, CONFIG.history_token_budget)
+)))
@@ -0,0 +1,213 @@
+"""Batch story generation for the story writing pipeline.
+
+Reads topic/theme records from a JSONL file, runs each one as an independent session
+of ``story_writing_pipeline`` with bounded concurrency, and streams the finished
+stories to an output JSONL file as they complete.
+
+Usage:
+    python -m llm_story_writer.batch topics.jsonl stories.jsonl --concurrency 8
+    python -m llm_story_writer.batch topics.jsonl stories.jsonl --run-id 3f2a9c1b07de
+
+Every run has its own id, printed in the summary; the sessions of a run are named
+after it, so checkpoints never leak between runs. Passing the id of an interrupted
+run with --run-id resumes its unfinished records from their checkpoints; records
+already written to the output file are skipped.
+
+Each input line is a JSON object with "topic" and "theme" (or a preformatted
+"current_topic"), and optionally an "id" and a "latency_budget" in seconds.
+"""
+from google.adk.agents import BaseAgent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from typing import Optional
+import argparse, asyncio, json, logging, time, uuid
+
+from .agent import (
+    APP_NAME, USER_ID, SESSION_ID_BASE,
+    STATE_CURRENT_TOPIC, STATE_CURRENT_DOC,
+    story_writing_pipeline,
+)
+from story_common.refinement import STATE_REFINEMENT_ITERATION, STATE_REFINEMENT_EXIT_REASON, STATE_LATENCY_BUDGET
+from story_common.ratelimit import STATE_PRIORITY, PRIORITY_BATCH
+
+logger = logging.getLogger(__name__)
+
+# Sentinel that tells a worker or the writer to stop
+_DONE = None
+
+
+def format_topic(record: dict) -> str:
+    """Builds the "STORY: [topic: ..., theme: ...]" line the pipeline expects in state."""
+    if record.get(STATE_CURRENT_TOPIC):
+        return record[STATE_CURRENT_TOPIC]
+    return f"STORY: [topic: {record['topic']}, theme: {record['theme']}]"
+
+
+def finished_ids(output_path: str) -> set[str]:
+    """Returns the ids of the records the output file already has a story for (failed records are retried)."""
+    ids = set()
+    try:
+        with open(output_path, encoding="utf-8") as output_file:
+            for line in output_file:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line of an interrupted run may be cut short
+                    continue
+                if "error" not in result:
+                    ids.add(str(result["id"]))
+    except FileNotFoundError:
+        pass
+    return ids
+
+
+async def write_story(
+    runner: Runner, record_id: str, current_topic: str, latency_budget: Optional[float] = None, run_id: str = ""
+) -> dict:
+    """Runs one record as its own session and returns the story with its stats."""
+    session_service = runner.session_service
+    session_id = f"{SESSION_ID_BASE}_{run_id}_{record_id}"
+    # Batch calls queue behind interactive sessions when the rate limiter is saturated
+    state = {STATE_CURRENT_TOPIC: current_topic, STATE_PRIORITY: PRIORITY_BATCH}
+    if latency_budget is not None:
+        state[STATE_LATENCY_BUDGET] = latency_budget
+    await session_service.create_session(
+        app_name=APP_NAME, user_id=USER_ID, session_id=session_id, state=state,
+    )
+    stats = {"llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    started = time.perf_counter()
+    try:
+        message = types.Content(role="user", parts=[types.Part(text=current_topic)])
+        async for event in runner.run_async(user_id=USER_ID, session_id=session_id, new_message=message):
+            if event.partial:
+                continue
+            if event.content and event.content.role == "model":
+                stats["llm_calls"] += 1
+            if event.usage_metadata:
+                stats["prompt_tokens"] += event.usage_metadata.prompt_token_count or 0
+                stats["completion_tokens"] += event.usage_metadata.candidates_token_count or 0
+        session = await session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+        state = session.state
+    finally:
+        # Sessions are not needed after the story is written; keep memory flat
+        await session_service.delete_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    stats["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    stats["iterations"] = state.get(STATE_REFINEMENT_ITERATION, 0)
+    stats["exit_reason"] = state.get(STATE_REFINEMENT_EXIT_REASON)
+    return {
+        "id": record_id,
+        STATE_CURRENT_TOPIC: current_topic,
+        STATE_CURRENT_DOC: state.get(STATE_CURRENT_DOC, ""),
+        "stats": stats,
+    }
+
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int = 4,
+    agent: Optional[BaseAgent] = None,
+    latency_budget: Optional[float] = None,
+    run_id: Optional[str] = None,
+) -> dict:
+    """
+    Writes a story for every record of the input file.
+
+    At most ``concurrency`` sessions run at a time, and at most twice that many
+    records are read ahead, so memory use does not depend on the size of the input.
+
+    Args:
+        input_path: JSONL file with the topic/theme records.
+        output_path: JSONL file the results are appended to, one line per record.
+        concurrency: The maximum number of sessions running at once.
+        agent: The agent to run for each record. Defaults to story_writing_pipeline.
+        latency_budget: Seconds each story may take, for records without their own
+          "latency_budget". None means no deadline.
+        run_id: The id of an interrupted run to resume; the records already in the
+          output file are skipped. Defaults to a new id.
+
+    Returns: A summary with the run id, the number of stories, failures, skipped records and the wall time.
+    """
+    done = finished_ids(output_path) if run_id else set()
+    run_id = run_id or uuid.uuid4().hex[:12]
+    runner = Runner(
+        agent=agent or story_writing_pipeline,
+        app_name=APP_NAME,
+        session_service=InMemorySessionService(),
+    )
+    pending: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    finished: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    summary = {"run_id": run_id, "stories": 0, "failed": 0, "skipped": 0}
+    started = time.perf_counter()
+
+    async def read_records():
+        with open(input_path, encoding="utf-8") as input_file:
+            for line_number, line in enumerate(input_file, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    record_id = str(record.get("id", line_number))
+                    if record_id in done:
+                        summary["skipped"] += 1
+                        continue
+                    budget = record.get("latency_budget", latency_budget)
+                    await pending.put((record_id, format_topic(record), budget))
+                except (json.JSONDecodeError, KeyError) as e:
+                    await finished.put({"id": str(line_number), "error": f"Invalid record: {e}"})
+        for _ in range(concurrency):
+            await pending.put(_DONE)
+
+    async def work():
+        while (item := await pending.get()) is not _DONE:
+            record_id, current_topic, budget = item
+            try:
+                result = await write_story(runner, record_id, current_topic, budget, run_id)
+            except Exception as e:
+                logger.exception(f"[Batch] Story {record_id} failed")
+                result = {"id": record_id, STATE_CURRENT_TOPIC: current_topic, "error": repr(e)}
+            await finished.put(result)
+
+    async def write_results():
+        with open(output_path, "a", encoding="utf-8") as output_file:
+            while (result := await finished.get()) is not _DONE:
+                summary["failed" if "error" in result else "stories"] += 1
+                output_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                output_file.flush()
+
+    writer = asyncio.create_task(write_results())
+    tasks = [asyncio.create_task(read_records()), *(asyncio.create_task(work()) for _ in range(concurrency))]
+    try:
+        await asyncio.gather(*tasks)
+        await finished.put(_DONE)
+        await writer
+    finally:
+        # A failed read (e.g. a missing input file) leaves the workers and the writer waiting
+        for task in (*tasks, writer):
+            task.cancel()
+        await asyncio.gather(*tasks, writer, return_exceptions=True)
+
+    summary["wall_seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"[Batch] Finished: {summary}")
+    return summary
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Write a story for every topic/theme record of a JSONL file.")
+    parser.add_argument("input", help="JSONL file with topic/theme records")
+    parser.add_argument("output", help="JSONL file to append the stories to")
+    parser.add_argument("--concurrency", type=int, default=4, help="maximum number of concurrent sessions")
+    parser.add_argument("--latency-budget", type=float, help="seconds each story may take before refinement stops")
+    parser.add_argument("--run-id", help="resume the interrupted run with this id, skipping the records already in the output")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    summary = asyncio.run(run_batch(
+        args.input, args.output, concurrency=args.concurrency, latency_budget=args.latency_budget, run_id=args.run_id
+    ))
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    main()
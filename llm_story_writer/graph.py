@@ -0,0 +1,211 @@
+from google.adk.agents import LlmAgent, BaseAgent
+from story_common.config import StoryConfig
+from story_common.routing import get_router
+from story_common.replay import with_llm_trace
+from story_common.refinement import RefinementLoopAgent
+from story_common.drafts import with_multi_draft
+from story_common.critics import with_critic_panel
+from story_common.longform import with_long_form
+from story_common.story_index import get_story_index, with_story_reuse
+from story_common.patching import with_patch_refiner
+from story_common.streaming import stream_output, no_stream
+from story_common.metrics import instrument_agent_tree
+from story_common.ratelimit import label_agent_tree
+from story_common.prompts import compile_agent_tree
+from story_common.history import compact_agent_tree
+from story_common.checkpoint import CheckpointedSequentialAgent
+from google.adk.models.llm_response import LlmResponse
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from typing import AsyncGenerator
+from typing_extensions import override
+from google.genai import types
+import logging
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+APP_NAME = "story_writing_assistant" # New App Name
+USER_ID = "user_01"
+SESSION_ID_BASE = "loop_exit_tool_session" # New Base Session ID
+# Routes each agent to its configured models (see story_common/routing.py); shared across the packages.
+# STORY_LLM_RECORD / STORY_LLM_REPLAY record the traffic to a trace file or serve it from one
+LLM_MODEL = with_llm_trace(get_router())
+# --- State Keys ---
+STATE_CURRENT_TOPIC = "current_topic"
+STATE_REFINED_TOPIC = "refined_topic"
+STATE_CURRENT_DOC = "current_document"
+STATE_CURRENT_TITLE = "current_title"
+STATE_CRITICISM = "criticism"
+# Plain-text completion signal, still accepted by the refinement loop besides the JSON verdict
+COMPLETION_PHRASE = "No major issues found."
+# Drafts, critics, refine mode, chapters, deadlines and history limits (STORY_* environment variables)
+CONFIG = StoryConfig.from_env()
+
+# --- Agent Definitions ---
+
+# STEP 1: Initial Writer Agent (Runs ONCE at the beginning)
+initial_writer_agent = LlmAgent(
+    name="InitialWriterAgent",
+    model=LLM_MODEL,
+    include_contents= 'none',
+    instruction=f"""You are a Creative Writing Assistant tasked with starting a flash short story.
+    Write the *first draft* of a short story (aim for 3-6 sentences) based only on the topic and theme below.
+
+    Topic and Theme: ```{{current_topic}}```
+
+    Try to introduce a specific element (like a character, a setting detail, or a starting action) to make it engaging.
+    Output *only* the story text. Do not add introductions or explanations.
+    Make sure the story is interesting and engaging.
+    """,
+    description="Writes the initial story based on the topic, aiming for some initial substance.",
+    output_key=STATE_CURRENT_DOC,
+    before_model_callback=stream_output, # Stream the draft to the user as it is written
+)
+
+# STEP 1b: Optionally write several drafts concurrently and promote the best one
+initial_writer_step = with_multi_draft(initial_writer_agent, CONFIG.num_drafts, CONFIG.draft_selection, STATE_CURRENT_TOPIC)
+
+# STEP 2a: Critic Agent (Inside the Refinement Loop)
+critic_agent_in_loop = LlmAgent(
+    name="CriticAgent",
+    model=LLM_MODEL,
+    include_contents='none',
+    instruction=f"""You are a Constructive Critic AI reviewing a short story draft (typically 3-6 sentences) for a flash story. Your goal is to help the writer improve the story.
+    **Story to Review:**
+    ```
+    {{current_document}}
+    ```
+
+    **Task:**
+    Review the story for clarity, engagement, and  coherence according to the initial topic and theme.
+
+    IF you identify 1-2 *clear and actionable* ways the story could be improved to better capture the topic or enhance reader engagement 
+    (e.g., "Needs a stronger opening sentence", 
+    "Clarify the character's goal", 
+    "Plot twist is too simple", 
+    "Need more conflicts", 
+    "Closing statement is not a real cliffhanger"):
+    Respond with {{"done": false, "issues": ["<suggestion 1>", "<suggestion 2>"]}}, one concise suggestion per item.
+
+
+    ELSE IF the story is coherent, addresses the topic adequately for its length, and has no glaring errors or obvious omissions:
+    Respond with {{"done": true, "issues": []}}.
+
+    Output *only* the JSON object. Do not add explanations or code fences.
+""",
+    description="Reviews the current story and returns a JSON verdict: done, or the issues to fix.",
+    output_key=STATE_CRITICISM,
+    before_model_callback=no_stream, # The verdict is parsed by the loop, never shown while streaming
+)
+
+# STEP 2a: Optionally review each round with concurrent specialized critics, merged into one criticism
+critic_step = with_critic_panel(critic_agent_in_loop, CONFIG.critics, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC)
+
+
+# STEP 2b: Refiner/Exiter Agent (Inside the Refinement Loop)
+refiner_agent_in_loop = LlmAgent(
+    name="RefinerAgent",
+    model=LLM_MODEL,
+    # Relies solely on state via placeholders
+    include_contents='none',
+    instruction=f"""You are a Creative Writing Assistant refining a story based on critique.
+
+    **Topic and Theme:**
+    ```{{current_topic}}```
+    
+    **Current Story:**
+    ```
+    {{current_document}}
+    ```
+    
+    **Critique/Suggestions:**
+    ```
+    {{criticism}}
+    ```
+    **Task:**
+    Carefully apply the suggestions to improve the 'Current Story'. Output *only* the refined story text.
+
+    Do not add explanations.
+""",
+    description="Refines the story based on critique. Only runs when the critic has found issues.",
+    output_key=STATE_CURRENT_DOC, # Overwrites state['current_document'] with the refined version
+    before_model_callback=stream_output, # Stream the revision to the user as it is written
+)
+
+# STEP 2b: Sentence-level patch refiner, if enabled (falls back to the refiner above)
+refiner_step = with_patch_refiner(refiner_agent_in_loop, CONFIG.refine_mode, STATE_CURRENT_TOPIC, STATE_CRITICISM)
+
+
+# Create internal agents *before* calling super().__init__
+# STEP 2: Refinement Loop Agent
+# The loop ends locally on the critic verdict, without a refiner call to exit_loop
+story_refinement_loop = RefinementLoopAgent(
+    name="StoryRefinementLoop",
+    critic_agent=critic_step,
+    refiner_agent=refiner_step,
+    max_iterations=5, # Limit loops
+    criticism_key=STATE_CRITICISM,
+    document_key=STATE_CURRENT_DOC,
+    completion_phrase=COMPLETION_PHRASE,
+    convergence_threshold=CONFIG.convergence_threshold,
+    latency_budget=CONFIG.latency_budget,
+)
+
+# STEP 2c: Long-form mode: outline, then write and refine the chapters concurrently
+writing_steps = with_long_form(
+    [initial_writer_step, story_refinement_loop], CONFIG.num_chapters, LLM_MODEL,
+    critic_step, refiner_step,
+    topic_key=STATE_CURRENT_TOPIC, document_key=STATE_CURRENT_DOC, criticism_key=STATE_CRITICISM,
+    max_iterations=5, completion_phrase=COMPLETION_PHRASE,
+    convergence_threshold=CONFIG.convergence_threshold, latency_budget=CONFIG.latency_budget,
+)
+
+# STEP 2d: Reuse or adapt finished stories on near-duplicate topics, if enabled
+writing_steps = with_story_reuse(writing_steps, get_story_index(), LLM_MODEL, STATE_CURRENT_TOPIC, STATE_CURRENT_DOC)
+
+# STEP 3: Overall Sequential Pipeline
+# For ADK tools compatibility, the root agent must be named `root_agent`
+# Checkpoints the state after each stage; a restarted session with the same id resumes from there
+story_writing_pipeline = CheckpointedSequentialAgent(
+    name="StoryWritingPipeline",
+    sub_agents=[
+        *writing_steps, # Create the initial doc, then run the critique/refine loop (or write the chapters)
+    ],
+    description="Writes an initial document and then iteratively refines it with critique using an exit tool."
+)
+
+
+ # Story writing assistant
+root_agent = LlmAgent(
+    name="StoryWritingAssistant",
+    model=LLM_MODEL,
+    include_contents='default',
+    instruction=f"""You are a story writing assistant to help the user write a flash story.
+                Your main task is to look at the conversation history with the user to extract story topic and theme.
+                Example topics: a person who wants to save the city with his friends, a programmer was rejected by his girlfriend.
+                Example themes: fantasy, science fiction, horror, romance, comedy, drama, thriller, mystery, young adult, middle grade.
+
+                If either topic or theme is missing from the conversation:
+                - Ask the user specifically to get the missing parts (topic or theme or both).
+                If you have identified BOTH a clear topic and a valid theme from the conversation:
+                - You must output the topic and theme to get user's ok.
+                If you've got the user's ok, then you should pass the topic and theme to your sub-agent story_writing_pipeline, who will generate the story. 
+                - The format is "STORY: [topic: [user's topic], theme: [user's theme]]". Do not output any additional text.
+                """,
+    description="A flash story writing assistant to help the user write a flash story.",
+    sub_agents=[
+        story_writing_pipeline
+    ],
+    output_key=STATE_CURRENT_TOPIC,
+)
+
+# Keep the conversation history the agents reading it send within a fixed number of turns and tokens
+compact_agent_tree(root_agent, CONFIG.history_turns, CONFIG.history_token_budget)
+# Move the state placeholders of every instruction after its static text, so the provider
+# can serve the prefix from its prompt cache
+compile_agent_tree(root_agent)
+# Record LLM latency and token metrics for every agent in the tree, and label its
+# LLM calls with the session priority and tenant for the rate limiter
+instrument_agent_tree(root_agent)
+label_agent_tree(root_agent)
@@ -0,0 +1 @@
+"""Shared building blocks used by the three story writer agent packages."""
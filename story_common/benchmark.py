@@ -0,0 +1,277 @@
+"""Benchmark suite comparing the three story writer designs on the same workload.
+
+Runs a fixed corpus of topic/theme inputs through every package, one session at a
+time, with every LlmAgent pointed at a deterministic MockLlm (constant latency, fixed
+seed). Reports, per package, the LLM calls and tokens per story (in total and per
+agent), the loop iterations, the end-to-end latency, the time spent waiting for the
+model and the orchestration overhead (everything else) as JSON. Calls, tokens and
+iterations are exact and repeatable, so a stored report can be compared with the next
+one to catch regressions.
+
+Usage:
+    python -m story_common.benchmark --output benchmark.json
+    python -m story_common.benchmark --latency-ms 0 --baseline benchmark.json
+"""
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from pydantic import PrivateAttr
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import argparse, asyncio, importlib, json, logging, os, sys, time, uuid
+
+from .loadtest import summarize
+from .metrics import LOOP_ITERATIONS
+from .mock_llm import MockLlm, install_model
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+BENCHMARK_VERSION = 1
+# The user's first message of every story: well-formed requests, which the topic
+# collectors parse locally, and free-form ones, which need the LLM
+BENCHMARK_CORPUS = [
+    "a horror story about a lighthouse keeper who finds a map of a harbor that does not exist",
+    "topic: a programmer who teaches her old laptop to dream, theme: science fiction",
+    "a romance story about two rival bakers forced to share one oven for a night",
+    "something spooky with an old librarian who hears whispers between the shelves",
+    "I want a funny one where a retired wizard opens a very bad driving school",
+    "maybe a mystery on a night train, where every passenger has the same ticket",
+]
+# Entry agent of each package and the user's messages after the first one:
+# llm_story_writer's assistant proposes the topic and starts the pipeline once it is confirmed
+VARIANTS = {
+    "llm_story_writer": ("root_agent", ["Yes, please write it."]),
+    "interact_story_writer": ("root_agent", []),
+    "custom_story_writer": ("root_agent", []),
+}
+# Report fields compared with a baseline: counts must not grow, timings may grow by the tolerance
+COUNT_METRICS = ("llm_calls_per_story", "prompt_tokens_per_story", "completion_tokens_per_story")
+TIMING_METRICS = (("latency", "p50_ms"), ("latency", "p95_ms"), ("orchestration_overhead", "p50_ms"))
+
+
+class TimedLlm(BaseLlm):
+    """A BaseLlm that passes every call to the wrapped model and records when it was in flight."""
+
+    inner: BaseLlm
+
+    _intervals: list[tuple[float, float]] = PrivateAttr(default_factory=list)
+
+    def __init__(self, inner: BaseLlm, **kwargs):
+        super().__init__(model=kwargs.pop("model", inner.model), inner=inner, **kwargs)
+
+    @property
+    def calls(self) -> dict[str, int]:
+        """The number of calls per agent of the wrapped model."""
+        return dict(getattr(self.inner, "calls", {}))
+
+    def busy_seconds(self, since: float) -> float:
+        """Returns the time since ``since`` during which at least one call was in flight."""
+        busy, end = 0.0, since
+        for started, finished in sorted(self._intervals):
+            if finished <= end:
+                continue
+            busy += finished - max(started, end)
+            end = finished
+        return busy
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        started = time.perf_counter()
+        finished = None
+        try:
+            async for response in self.inner.generate_content_async(llm_request, stream=stream):
+                # The clock stops before ADK handles the response, which is orchestration
+                finished = time.perf_counter()
+                yield response
+        except Exception:
+            finished = time.perf_counter()
+            raise
+        finally:
+            self._intervals.append((started, finished or started))
+
+
+async def run_story(runner: Runner, model: TimedLlm, messages: list[str]) -> dict:
+    """Runs one story session, sending the messages one turn after the other.
+
+    Returns: The duration, the model time, and the calls and tokens per agent of the session.
+    """
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id="benchmark", session_id=f"benchmark_{uuid.uuid4().hex}"
+    )
+    calls_before = model.calls
+    tokens: dict[str, list[int]] = {}
+    started = time.perf_counter()
+    for text in messages:
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        async for event in runner.run_async(user_id="benchmark", session_id=session.id, new_message=message):
+            usage = event.usage_metadata
+            if usage and not event.partial:
+                counts = tokens.setdefault(event.author, [0, 0, 0])
+                counts[0] += usage.prompt_token_count or 0
+                counts[1] += usage.candidates_token_count or 0
+                counts[2] += usage.cached_content_token_count or 0
+    seconds = time.perf_counter() - started
+    await runner.session_service.delete_session(
+        app_name=runner.app_name, user_id="benchmark", session_id=session.id
+    )
+    calls = {agent: count - calls_before.get(agent, 0) for agent, count in model.calls.items()}
+    return {
+        "seconds": seconds,
+        "llm_seconds": model.busy_seconds(started),
+        "calls": {agent: count for agent, count in calls.items() if count},
+        "tokens": tokens,
+    }
+
+
+def _per_story(values: dict[str, float], stories: int) -> dict[str, float]:
+    return {key: round(value / stories, 3) for key, value in sorted(values.items())}
+
+
+async def run_variant(package: str, corpus: list[str], latency_ms: float = 100.0, seed: int = 0) -> dict:
+    """
+    Runs every input of the corpus through one package, one story at a time.
+
+    Args:
+        package: One of VARIANTS, e.g. "llm_story_writer".
+        corpus: The first user message of every story.
+        latency_ms: The constant latency of every LLM call.
+        seed: The seed of the MockLlm.
+
+    Returns: The variant's report: calls, tokens, loop iterations and latencies per story.
+    """
+    attribute, follow_ups = VARIANTS[package]
+    agent = getattr(importlib.import_module(f"{package}.agent"), attribute)
+    model = TimedLlm(MockLlm(latency_ms=latency_ms, seed=seed))
+    install_model(agent, model)
+    runner = Runner(agent=agent, app_name=package, session_service=InMemorySessionService())
+
+    loops_before = LOOP_ITERATIONS.totals()
+    samples: list[dict] = []
+    errors: dict[str, int] = {}
+    for text in corpus:
+        try:
+            samples.append(await run_story(runner, model, [text, *follow_ups]))
+        except Exception as e:
+            logger.warning(f"[Benchmark] {package} failed on '{text}': {e!r}")
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    stories = max(len(samples), 1)
+    calls: dict[str, float] = {}
+    tokens: dict[str, list[int]] = {}
+    for sample in samples:
+        for agent_name, count in sample["calls"].items():
+            calls[agent_name] = calls.get(agent_name, 0) + count
+        for agent_name, counts in sample["tokens"].items():
+            totals = tokens.setdefault(agent_name, [0, 0, 0])
+            for index, count in enumerate(counts):
+                totals[index] += count
+    loops = {}
+    for key, (total, count) in LOOP_ITERATIONS.totals().items():
+        total_before, count_before = loops_before.get(key, (0.0, 0))
+        if count > count_before:
+            loops[dict(key).get("loop", "")] = {
+                "runs_per_story": round((count - count_before) / stories, 3),
+                "mean_iterations": round((total - total_before) / (count - count_before), 3),
+            }
+
+    return {
+        "stories": len(corpus),
+        "completed": len(samples),
+        "errors": errors,
+        "llm_calls_per_story": round(sum(calls.values()) / stories, 3),
+        "llm_calls_by_agent": _per_story(calls, stories),
+        "prompt_tokens_per_story": round(sum(counts[0] for counts in tokens.values()) / stories, 3),
+        "completion_tokens_per_story": round(sum(counts[1] for counts in tokens.values()) / stories, 3),
+        "cached_prompt_tokens_per_story": round(sum(counts[2] for counts in tokens.values()) / stories, 3),
+        "tokens_by_agent": {
+            agent_name: {"prompt": round(counts[0] / stories, 3), "completion": round(counts[1] / stories, 3)}
+            for agent_name, counts in sorted(tokens.items())
+        },
+        "loops": dict(sorted(loops.items())),
+        "latency": summarize([sample["seconds"] for sample in samples]),
+        "llm_time": summarize([sample["llm_seconds"] for sample in samples]),
+        "orchestration_overhead": summarize([max(sample["seconds"] - sample["llm_seconds"], 0.0) for sample in samples]),
+    }
+
+
+async def run_benchmark(
+    packages: Optional[list[str]] = None,
+    corpus: Optional[list[str]] = None,
+    latency_ms: float = 100.0,
+    seed: int = 0,
+) -> dict:
+    """Runs the corpus through each package and returns the report of all of them."""
+    packages = packages or list(VARIANTS)
+    corpus = corpus or BENCHMARK_CORPUS
+    variants = {}
+    for package in packages:
+        variants[package] = await run_variant(package, corpus, latency_ms, seed)
+    return {
+        "version": BENCHMARK_VERSION,
+        "created": round(time.time(), 3),
+        "model": {"type": "MockLlm", "latency_ms": latency_ms, "seed": seed},
+        "corpus_size": len(corpus),
+        "variants": variants,
+    }
+
+
+def compare_reports(baseline: dict, report: dict, tolerance: float = 0.2) -> list[str]:
+    """Returns the regressions of a report against a baseline report.
+
+    Calls and tokens per story are deterministic, so any increase is a regression;
+    timings are a regression when they grow by more than ``tolerance`` (a fraction).
+    Packages missing from either report are not compared.
+    """
+    regressions = []
+    for package, current in report["variants"].items():
+        previous = baseline.get("variants", {}).get(package)
+        if previous is None:
+            continue
+        for metric in COUNT_METRICS:
+            if current[metric] > previous[metric]:
+                regressions.append(f"{package} {metric}: {previous[metric]} -> {current[metric]}")
+        for metric, field in TIMING_METRICS:
+            before, after = previous[metric][field], current[metric][field]
+            if after > before * (1 + tolerance):
+                regressions.append(f"{package} {metric}.{field}: {before} -> {after}")
+    return regressions
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the story writer designs on a fixed corpus against a mock LLM.")
+    parser.add_argument("--packages", nargs="+", choices=sorted(VARIANTS), default=None, help="the packages to benchmark (default: all)")
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="constant simulated LLM latency")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the mock LLM")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", default=None, help="a previous report; exit with status 1 if this run regressed")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative growth of the timings over the baseline")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    # Checkpoints are written to disk after every stage; leave them out unless asked for,
+    # so the timings do not depend on the disk
+    os.environ.setdefault("STORY_CHECKPOINT", "off")
+
+    report = asyncio.run(run_benchmark(args.packages, latency_ms=args.latency_ms, seed=args.seed))
+    regressions = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare_reports(json.load(baseline_file), report, args.tolerance)
+        report["regressions"] = regressions
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if regressions:
+        print("Regressions against the baseline:\n" + "\n".join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+from google.adk.agents import SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from pydantic import BaseModel, Field
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import asyncio, hashlib, json, logging, os, sqlite3, threading, time
+
+from .refinement import STATE_COMPLETED_ROUNDS, STATE_RESUME_ROUNDS
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_CHECKPOINT_PATH = os.path.join("~", ".cache", "story_writer", "checkpoints.sqlite3")
+# Checkpoints of runs that were never resumed are dropped after this many seconds
+DEFAULT_CHECKPOINT_TTL = 24 * 3600
+# The state key holding the request of a run, part of its fingerprint with the user's message
+REQUEST_STATE_KEY = "current_topic"
+# --- State Keys ---
+STATE_COMPLETED_STAGES = "checkpoint_completed_stages"
+STATE_RESUMED_FROM = "checkpoint_resumed_from"
+STATE_REQUEST_FINGERPRINT = "checkpoint_request"
+# Session-scoped keys only; app:, user: and temp: state is not checkpointed
+_SKIPPED_PREFIXES = ("app:", "user:", "temp:")
+
+
+class Checkpoint(BaseModel):
+    """The session state saved after a completed stage."""
+
+    stage: str
+    state: dict = Field(default_factory=dict)
+    updated_at: float = 0.0
+    # The fingerprint of the request the run was started with
+    request: str = ""
+
+
+def session_key(ctx: InvocationContext) -> str:
+    """Returns the checkpoint key of the invocation's session."""
+    return f"{ctx.app_name}/{ctx.session.user_id}/{ctx.session.id}"
+
+
+def request_fingerprint(ctx: InvocationContext) -> str:
+    """Returns a hash of the request of the invocation: the topic preset in state and the user's message."""
+    message = "".join(part.text or "" for part in (ctx.user_content.parts or [])) if ctx.user_content else ""
+    request = [str(ctx.session.state.get(REQUEST_STATE_KEY) or ""), message.strip()]
+    return hashlib.sha256(json.dumps(request, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def snapshot_state(state) -> dict:
+    """Returns the JSON-serializable, session-scoped part of the state."""
+    snapshot = {}
+    for key, value in state.items():
+        if key.startswith(_SKIPPED_PREFIXES):
+            continue
+        try:
+            json.dumps(value)
+        except (TypeError, ValueError):
+            continue
+        snapshot[key] = value
+    return snapshot
+
+
+class CheckpointStore:
+    """
+    A durable store of the latest checkpoint per session, on SQLite.
+
+    Only the last checkpoint of a session is kept; it is deleted when the session's
+    pipeline finishes, or ``ttl`` seconds after it was saved if it is never resumed.
+    """
+
+    def __init__(self, path: str = DEFAULT_CHECKPOINT_PATH, ttl: Optional[float] = DEFAULT_CHECKPOINT_TTL):
+        """
+        Opens (and creates if needed) the checkpoint database.
+
+        Args:
+            path: Location of the SQLite file, or ":memory:".
+            ttl: Seconds a checkpoint is kept, or None to keep it until its run finishes.
+        """
+        self.ttl = ttl
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoints (
+                   session_key TEXT PRIMARY KEY,
+                   stage TEXT NOT NULL,
+                   state TEXT NOT NULL,
+                   updated_at REAL NOT NULL,
+                   request TEXT NOT NULL DEFAULT '')"""
+        )
+        # Databases written before requests were fingerprinted; their checkpoints never match
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(checkpoints)")]
+        if "request" not in columns:
+            self._conn.execute("ALTER TABLE checkpoints ADD COLUMN request TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["CheckpointStore"]:
+        """Creates the store at STORY_CHECKPOINT_PATH, or returns None if STORY_CHECKPOINT is "off".
+
+        STORY_CHECKPOINT_TTL sets the seconds an unfinished run's checkpoint is kept ("off" = until resumed).
+        """
+        if os.environ.get("STORY_CHECKPOINT", "on").lower() in ("0", "off", "false"):
+            return None
+        ttl = os.environ.get("STORY_CHECKPOINT_TTL", str(DEFAULT_CHECKPOINT_TTL))
+        return cls(
+            os.environ.get("STORY_CHECKPOINT_PATH", DEFAULT_CHECKPOINT_PATH),
+            None if ttl.lower() in ("0", "off", "false") else float(ttl),
+        )
+
+    def save(self, key: str, checkpoint: Checkpoint):
+        """Replaces the checkpoint of the session, and drops the expired checkpoints of other sessions."""
+        updated_at = checkpoint.updated_at or time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (session_key, stage, state, updated_at, request) VALUES (?, ?, ?, ?, ?)",
+                (key, checkpoint.stage, json.dumps(checkpoint.state, ensure_ascii=False), updated_at, checkpoint.request),
+            )
+            if self.ttl is not None:
+                self._conn.execute("DELETE FROM checkpoints WHERE updated_at < ?", (updated_at - self.ttl,))
+            self._conn.commit()
+
+    def load(self, key: str) -> Optional[Checkpoint]:
+        """Returns the checkpoint of the session, or None if there is none or it expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stage, state, updated_at, request FROM checkpoints WHERE session_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if self.ttl is not None and row[2] < time.time() - self.ttl:
+            self.delete(key)
+            return None
+        return Checkpoint(stage=row[0], state=json.loads(row[1]), updated_at=row[2], request=row[3])
+
+    def delete(self, key: str):
+        """Removes the checkpoint of the session."""
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE session_key = ?", (key,))
+            self._conn.commit()
+
+
+_default_store: Optional[CheckpointStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """Returns the process-wide store configured by the environment (None if disabled)."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CheckpointStore.from_env()
+        return _default_store
+
+
+def _is_rounds_key(key: str, name: str) -> bool:
+    # Loops with a state_prefix (e.g. the chapters of a long-form story) prefix their keys
+    return key == name or key.endswith(f"_{name}")
+
+
+def completed_rounds(state_delta: dict) -> Optional[int]:
+    """Returns the round a refinement loop completed in this state delta, or None if it is not such a delta."""
+    for key, value in state_delta.items():
+        if _is_rounds_key(key, STATE_COMPLETED_ROUNDS):
+            return value
+    return None
+
+
+def resume_rounds(state: dict) -> dict:
+    """Returns the state delta that tells every refinement loop of a checkpoint how many rounds it completed."""
+    return {
+        key.removesuffix(STATE_COMPLETED_ROUNDS) + STATE_RESUME_ROUNDS: value
+        for key, value in state.items()
+        if _is_rounds_key(key, STATE_COMPLETED_ROUNDS)
+    }
+
+
+class Checkpointer:
+    """
+    Saves the session state after each completed stage and restores it on restart.
+
+    A stage is any agent the owner runs in sequence; refinement rounds are saved as
+    well. When a run starts under the id of a session that has a checkpoint, with the
+    same request (see request_fingerprint), the saved state is restored and the stages
+    that were already completed are skipped, so their LLM calls are not paid twice. A
+    checkpoint of another request is discarded.
+    """
+
+    def __init__(self, owner: str, store: Optional[CheckpointStore]):
+        self.owner = owner
+        self.store = store
+
+    def _event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.owner,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    async def begin(self, ctx: InvocationContext) -> Optional[Event]:
+        """Starts a run. Returns the event that restores a checkpoint, or that resets the stages."""
+        if self.store is None:
+            return None
+        request = request_fingerprint(ctx)
+        checkpoint = await asyncio.to_thread(self.store.load, session_key(ctx))
+        if checkpoint is not None and checkpoint.request == request:
+            completed = checkpoint.state.get(STATE_COMPLETED_STAGES, [])
+            logger.info(f"[{self.owner}] Resuming session {ctx.session.id} after {checkpoint.stage} (completed: {completed})")
+            return self._event(ctx, {
+                **checkpoint.state,
+                STATE_RESUMED_FROM: checkpoint.stage,
+                **resume_rounds(checkpoint.state),
+                STATE_REQUEST_FINGERPRINT: request,
+            })
+        if checkpoint is not None:
+            logger.info(f"[{self.owner}] Discarding the checkpoint of session {ctx.session.id}: it is for another request.")
+            await asyncio.to_thread(self.store.delete, session_key(ctx))
+        return self._event(ctx, {STATE_COMPLETED_STAGES: [], STATE_RESUMED_FROM: None, STATE_REQUEST_FINGERPRINT: request})
+
+    def is_completed(self, ctx: InvocationContext, stage: str) -> bool:
+        """Returns whether the stage was completed before the last restart."""
+        return self.store is not None and stage in (ctx.session.state.get(STATE_COMPLETED_STAGES) or [])
+
+    async def save(self, ctx: InvocationContext, stage: str):
+        """Saves the current session state as the checkpoint after ``stage``."""
+        if self.store is None:
+            return
+        checkpoint = Checkpoint(
+            stage=stage,
+            state=snapshot_state(ctx.session.state),
+            updated_at=time.time(),
+            request=ctx.session.state.get(STATE_REQUEST_FINGERPRINT) or "",
+        )
+        await asyncio.to_thread(self.store.save, session_key(ctx), checkpoint)
+
+    def complete(self, ctx: InvocationContext, stage: str) -> Optional[Event]:
+        """Returns the event that marks the stage completed. Save the checkpoint after it is applied."""
+        if self.store is None:
+            return None
+        completed = list(ctx.session.state.get(STATE_COMPLETED_STAGES) or [])
+        return self._event(ctx, {STATE_COMPLETED_STAGES: completed + [stage]})
+
+    async def run_stage(self, ctx: InvocationContext, stage) -> AsyncGenerator[Event, None]:
+        """Runs a stage unless it was completed before, saving after every refinement round."""
+        if self.is_completed(ctx, stage.name):
+            logger.info(f"[{self.owner}] Skipping {stage.name}: completed before the restart.")
+            return
+        async for event in stage.run_async(ctx):
+            yield event
+            rounds = completed_rounds(event.actions.state_delta)
+            if self.store is not None and not event.partial and rounds is not None:
+                await self.save(ctx, f"{event.author} round {rounds}")
+
+    async def finish(self, ctx: InvocationContext):
+        """Deletes the checkpoint once the whole run has completed."""
+        if self.store is not None:
+            await asyncio.to_thread(self.store.delete, session_key(ctx))
+
+
+class CheckpointedSequentialAgent(SequentialAgent):
+    """
+    A SequentialAgent that checkpoints the session state after every sub-agent.
+
+    With ``resume`` (the default) the agent owns the checkpoint: it restores it when the
+    request of an interrupted run is started again under the same session id, and
+    deletes it once all sub-agents have completed, or when the run ends early. Nested inside another checkpointing agent, use
+    ``resume=False`` to only skip completed sub-agents and save after each one.
+    """
+
+    resume: bool = True
+
+    def _checkpointer(self) -> Checkpointer:
+        return Checkpointer(self.name, get_checkpoint_store())
+
+    def _should_stop(self, ctx: InvocationContext) -> bool:
+        """Returns True to end the run after the current sub-agent without completing it."""
+        return False
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        checkpointer = self._checkpointer()
+        if self.resume and (event := await checkpointer.begin(ctx)):
+            yield event
+        for sub_agent in self.sub_agents:
+            async for event in checkpointer.run_stage(ctx, sub_agent):
+                yield event
+            if self._should_stop(ctx):
+                # The next turn is another request and starts over from this sub-agent
+                if self.resume:
+                    await checkpointer.finish(ctx)
+                return
+            if event := checkpointer.complete(ctx, sub_agent.name):
+                yield event
+                await checkpointer.save(ctx, sub_agent.name)
+        if self.resume:
+            await checkpointer.finish(ctx)
@@ -0,0 +1,61 @@
+from pydantic import BaseModel
+from typing import Optional
+import os
+
+from .history import DEFAULT_HISTORY_TOKENS, DEFAULT_HISTORY_TURNS
+
+_OFF = ("0", "off", "false")
+
+
+def _optional_float(value: str) -> Optional[float]:
+    return None if value.lower() in _OFF else float(value)
+
+
+def _optional_int(value: str) -> Optional[int]:
+    return None if value.lower() in _OFF else int(value)
+
+
+def _names(value: str) -> list[str]:
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+class StoryConfig(BaseModel):
+    """The pipeline options shared by the three story writers, read from the STORY_* environment variables."""
+
+    # Number of initial drafts written concurrently; only the best one is refined (1 = single draft)
+    num_drafts: int = 1
+    # How the best draft is picked: "heuristic" (local scoring) or "critic" (one comparative LLM call)
+    draft_selection: str = "heuristic"
+    # How the refiner revises the story: "rewrite" (whole story) or "patch" (sentence edits, rewrite as fallback)
+    refine_mode: str = "rewrite"
+    # Stop refining once two revisions in a row are each this similar to their previous draft (None = never)
+    convergence_threshold: Optional[float] = 0.9
+    # Seconds a request may take before refinement stops (None = no deadline); overridable per session in state
+    latency_budget: Optional[float] = None
+    # Chapters of a long-form story, outlined and written concurrently (0 = flash story)
+    num_chapters: int = 0
+    # Specialized critics run concurrently each round, e.g. ["coherence", "clarity"] (empty = single CriticAgent)
+    critics: list[str] = []
+    # Turns of conversation history sent verbatim by the agents that read it; older turns are summarized (None = all)
+    history_turns: Optional[int] = DEFAULT_HISTORY_TURNS
+    # Estimated tokens of conversation history sent per call
+    history_token_budget: int = DEFAULT_HISTORY_TOKENS
+
+    @classmethod
+    def from_env(cls) -> "StoryConfig":
+        """Reads the options from the STORY_* environment variables, keeping the defaults for unset ones."""
+        values = {}
+        for field, variable, parse in (
+            ("num_drafts", "STORY_NUM_DRAFTS", int),
+            ("draft_selection", "STORY_DRAFT_SELECTION", str),
+            ("refine_mode", "STORY_REFINE_MODE", str),
+            ("convergence_threshold", "STORY_CONVERGENCE_THRESHOLD", _optional_float),
+            ("latency_budget", "STORY_LATENCY_BUDGET", _optional_float),
+            ("num_chapters", "STORY_LONGFORM_CHAPTERS", int),
+            ("critics", "STORY_CRITICS", _names),
+            ("history_turns", "STORY_HISTORY_TURNS", _optional_int),
+            ("history_token_budget", "STORY_HISTORY_TOKENS", int),
+        ):
+            if os.environ.get(variable):
+                values[field] = parse(os.environ[variable])
+        return cls(**values)
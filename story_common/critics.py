@@ -0,0 +1,197 @@
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.models.base_llm import BaseLlm
+from typing import AsyncGenerator, Union
+from typing_extensions import override
+import json, logging
+
+from .refinement import CriticVerdict, parse_verdict
+from .similarity import text_similarity
+from .streaming import no_stream
+
+logger = logging.getLogger(__name__)
+
+# --- State Keys ---
+# Per critic: critic_<dimension>; the parsed verdicts of the last round by dimension
+STATE_CRITIC_PREFIX = "critic_"
+STATE_CRITIC_REVIEWS = "critic_reviews"
+# --- Constants ---
+# What each specialized critic looks for, in merge priority order: story-breaking problems first
+CRITIC_DIMENSIONS = {
+    "coherence": "coherence: contradictions, plot holes, unclear cause and effect, and drifting away from the topic and theme",
+    "clarity": "clarity: confusing sentences, unclear character goals or motivations, and ambiguous references",
+    "engagement": "engagement: a weak opening, too little conflict or tension, a predictable twist, and a flat ending",
+}
+# Issues the refiner gets per round across all critics
+MAX_MERGED_ISSUES = 5
+# Issues this similar (word Jaccard) are reported once
+DUPLICATE_ISSUE_SIMILARITY = 0.6
+
+
+def critic_key(dimension: str) -> str:
+    """Returns the state key the critic of the given dimension writes to."""
+    return f"{STATE_CRITIC_PREFIX}{dimension}"
+
+
+def merge_verdicts(verdicts: dict[str, CriticVerdict], max_issues: int = MAX_MERGED_ISSUES) -> CriticVerdict:
+    """Merges the verdicts of the specialized critics into one prioritized verdict.
+
+    Issues are taken round-robin in CRITIC_DIMENSIONS order, so the first issue of every
+    critic makes the cut before anyone's second one, and near-duplicates reported by two
+    critics are kept once. The merged verdict is done only when every critic is done.
+    """
+    ordered = [dimension for dimension in CRITIC_DIMENSIONS if dimension in verdicts]
+    ordered += [dimension for dimension in verdicts if dimension not in CRITIC_DIMENSIONS]
+    issues: list[str] = []
+    depth = max((len(verdicts[dimension].issues) for dimension in ordered), default=0)
+    for rank in range(depth):
+        for dimension in ordered:
+            candidates = verdicts[dimension].issues
+            if rank >= len(candidates) or len(issues) >= max_issues:
+                continue
+            issue = candidates[rank]
+            if all(text_similarity(issue, kept, size=1) < DUPLICATE_ISSUE_SIMILARITY for kept in issues):
+                issues.append(issue)
+    return CriticVerdict(done=all(verdict.done for verdict in verdicts.values()) or not issues, issues=issues)
+
+
+def build_dimension_critic(
+    model: Union[str, BaseLlm],
+    dimension: str,
+    topic_key: str = "current_topic",
+    document_key: str = "current_document",
+) -> LlmAgent:
+    """Creates a critic that only reviews the story along one dimension of CRITIC_DIMENSIONS."""
+    return LlmAgent(
+        name=f"{dimension.capitalize()}CriticAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a Constructive Critic AI reviewing a short story draft for a flash story. You only judge its {CRITIC_DIMENSIONS[dimension]}.
+    Other critics review the other aspects of the story, so ignore them.
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+    **Story to Review:**
+    ```
+    {{{document_key}}}
+    ```
+
+    **Task:**
+    IF you identify *clear and actionable* problems of {dimension}:
+    Respond with {{"done": false, "issues": ["<suggestion 1>", "<suggestion 2>"]}}, at most 3 concise suggestions, the most important first.
+
+    ELSE IF the story has no real problem of {dimension}:
+    Respond with {{"done": true, "issues": []}}.
+
+    Output *only* the JSON object. Do not add explanations or code fences.
+""",
+        description=f"Reviews the {dimension} of the current story and returns a JSON verdict.",
+        output_key=critic_key(dimension),
+        before_model_callback=no_stream, # Verdicts are merged by the panel, never shown while streaming
+    )
+
+
+class CriticPanelAgent(BaseAgent):
+    """
+    Runs several specialized critics concurrently and merges their verdicts.
+
+    Drop-in replacement for the critic of a RefinementLoopAgent: the merged verdict is
+    written to ``criticism_key`` as the same JSON the single critic returns, so one
+    round of the loop addresses the issues of every dimension at the cost of the
+    slowest critic.
+    """
+
+    criticism_key: str
+    max_issues: int = MAX_MERGED_ISSUES
+    state_prefix: str = ""
+    critics_agent: ParallelAgent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        critic_agents: list[LlmAgent],
+        criticism_key: str = "criticism",
+        max_issues: int = MAX_MERGED_ISSUES,
+        state_prefix: str = "",
+    ):
+        """
+        Initializes the CriticPanelAgent.
+
+        Args:
+            name: The name of the agent.
+            critic_agents: The specialized critics; each writes a JSON verdict to its own output_key.
+            criticism_key: The state key the merged verdict is written to.
+            max_issues: The maximum number of merged issues per round.
+            state_prefix: Prefix of the critics' output keys and of the reviews key, so
+              several panels (e.g. one per chapter) can run concurrently.
+        """
+        critics_agent = ParallelAgent(
+            name=f"{name}Critics",
+            sub_agents=critic_agents,
+            description=f"Runs {len(critic_agents)} critics concurrently.",
+        )
+        super().__init__(
+            name=name,
+            description="Reviews the story with several specialized critics and merges their verdicts.",
+            criticism_key=criticism_key,
+            max_issues=max_issues,
+            state_prefix=state_prefix,
+            critics_agent=critics_agent,
+            sub_agents=[critics_agent],
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        async for event in self.critics_agent.run_async(ctx):
+            yield event
+
+        verdicts = {
+            critic.output_key.removeprefix(self.state_prefix).removeprefix(STATE_CRITIC_PREFIX): parse_verdict(ctx.session.state.get(critic.output_key, ""))
+            for critic in self.critics_agent.sub_agents
+        }
+        merged = merge_verdicts(verdicts, self.max_issues)
+        logger.info(
+            f"[{self.name}] Issues per critic: {({dimension: len(v.issues) for dimension, v in verdicts.items()})}, "
+            f"merged {len(merged.issues)}"
+        )
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={
+                self.criticism_key: json.dumps(merged.model_dump()),
+                f"{self.state_prefix}{STATE_CRITIC_REVIEWS}": {dimension: verdict.model_dump() for dimension, verdict in verdicts.items()},
+            }),
+        )
+
+
+def with_critic_panel(
+    critic_agent: LlmAgent,
+    dimensions: list[str],
+    topic_key: str = "current_topic",
+    document_key: str = "current_document",
+) -> BaseAgent:
+    """Returns the critic itself without dimensions, or a CriticPanelAgent of one critic per dimension.
+
+    Args:
+      critic_agent: The general critic. Its model and output_key are used by the panel.
+      dimensions: Names from CRITIC_DIMENSIONS, e.g. ["coherence", "clarity", "engagement"].
+      topic_key: The state key of the topic and theme.
+      document_key: The state key of the story to review.
+    """
+    if not dimensions:
+        return critic_agent
+    unknown = [dimension for dimension in dimensions if dimension not in CRITIC_DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown critic dimensions {unknown}, expected some of {list(CRITIC_DIMENSIONS)}")
+    return CriticPanelAgent(
+        name="CriticPanel",
+        critic_agents=[build_dimension_critic(critic_agent.model, dimension, topic_key, document_key) for dimension in dimensions],
+        criticism_key=critic_agent.output_key,
+    )
@@ -0,0 +1,223 @@
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.models.base_llm import BaseLlm
+from typing import AsyncGenerator, Optional, Union
+from typing_extensions import override
+import logging, re
+
+from .streaming import no_stream
+
+logger = logging.getLogger(__name__)
+
+# --- State Keys ---
+STATE_DRAFT_PREFIX = "draft_"
+STATE_DRAFT_SELECTION = "draft_selection"
+STATE_DRAFT_SCORES = "draft_scores"
+STATE_SELECTED_DRAFT = "selected_draft"
+# --- Selection Modes ---
+SELECT_HEURISTIC = "heuristic"
+SELECT_CRITIC = "critic"
+
+_SENTENCE_END = re.compile(r"[.!?]+(?:\s|$)")
+_WORD = re.compile(r"[a-z']+")
+_META_OPENERS = ("here is", "here's", "sure", "draft", "title:", "certainly")
+
+
+def draft_key(index: int) -> str:
+    """Returns the state key of the draft with the given 1-based index."""
+    return f"{STATE_DRAFT_PREFIX}{index}"
+
+
+def score_draft(text: str, topic: str = "", min_sentences: int = 3, max_sentences: int = 6) -> float:
+    """Scores a draft with cheap local heuristics. Higher is better.
+
+    Combines how many of the topic's content words the draft uses, its lexical
+    diversity and whether its length is within the requested sentence range, and
+    penalizes drafts that open with meta text instead of the story.
+
+    Args:
+      text: The draft.
+      topic: The topic and theme line the draft was written for.
+      min_sentences: The shortest length without penalty.
+      max_sentences: The longest length without penalty.
+
+    Returns: The score, or -1.0 for an empty draft.
+    """
+    text = (text or "").strip()
+    words = _WORD.findall(text.lower())
+    if not words:
+        return -1.0
+    sentences = max(len(_SENTENCE_END.findall(text)), 1)
+    if sentences < min_sentences:
+        length_score = max(0.0, 1.0 - 0.25 * (min_sentences - sentences))
+    elif sentences > max_sentences:
+        length_score = max(0.0, 1.0 - 0.25 * (sentences - max_sentences))
+    else:
+        length_score = 1.0
+    diversity = len(set(words)) / len(words)
+    topic_words = {word for word in _WORD.findall(topic.lower()) if len(word) > 3} - {"story", "topic", "theme"}
+    coverage = len(topic_words & set(words)) / len(topic_words) if topic_words else 0.0
+    penalty = 0.5 if text.lower().startswith(_META_OPENERS) else 0.0
+    return round(0.4 * coverage + 0.3 * diversity + 0.3 * length_score - penalty, 4)
+
+
+def parse_selection(text: str, num_drafts: int) -> Optional[int]:
+    """Returns the draft number picked by the selector, or None if it is not valid."""
+    match = re.search(r"\d+", text or "")
+    if match and 1 <= int(match.group()) <= num_drafts:
+        return int(match.group())
+    return None
+
+
+def build_draft_selector(model: Union[str, BaseLlm], num_drafts: int, topic_key: str = "current_topic") -> LlmAgent:
+    """Creates the comparative critic that picks the best of ``num_drafts`` drafts in one call."""
+    drafts = "\n\n".join(
+        f"**Draft {i}:**\n```\n{{{draft_key(i)}}}\n```" for i in range(1, num_drafts + 1)
+    )
+    return LlmAgent(
+        name="DraftSelectorAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a Constructive Critic AI comparing {num_drafts} drafts of the same flash story (typically 3-6 sentences).
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+{drafts}
+
+    **Task:**
+    Pick the draft that best captures the topic and theme and is the clearest, most engaging and most coherent starting point for refinement.
+    Respond with *only* the number of the best draft. Do not add explanations.
+""",
+        description="Compares the initial drafts and picks the best one to refine.",
+        output_key=STATE_DRAFT_SELECTION,
+        before_model_callback=no_stream,
+    )
+
+
+class MultiDraftWriterAgent(BaseAgent):
+    """
+    Writes several initial drafts concurrently and promotes the best one.
+
+    The writer is cloned once per draft and the clones run in a ParallelAgent, each
+    writing to its own ``draft_<i>`` state key. The winner is then picked by local
+    heuristics, or by one comparative critic call if a selector agent is given, and
+    stored under ``output_key``.
+    """
+
+    drafts_agent: ParallelAgent
+    selector_agent: Optional[LlmAgent] = None
+    num_drafts: int
+    output_key: str
+    topic_key: str = "current_topic"
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        writer_agent: LlmAgent,
+        num_drafts: int = 3,
+        selector_agent: Optional[LlmAgent] = None,
+        topic_key: str = "current_topic",
+    ):
+        """
+        Initializes the MultiDraftWriterAgent.
+
+        Args:
+            name: The name of the agent.
+            writer_agent: The single-draft writer to clone. Its output_key receives the winner.
+            num_drafts: The number of drafts written concurrently.
+            selector_agent: Optional LlmAgent that writes the number of the best draft to
+              state["draft_selection"]. Local heuristics are used without it.
+            topic_key: The state key of the topic and theme, used by the heuristics.
+        """
+        writers = [
+            writer_agent.model_copy(update={
+                "name": f"{writer_agent.name}{i}",
+                "output_key": draft_key(i),
+                "parent_agent": None,
+                # Concurrent drafts would interleave their tokens in the user's output
+                "before_model_callback": no_stream,
+            })
+            for i in range(1, num_drafts + 1)
+        ]
+        drafts_agent = ParallelAgent(
+            name=f"{name}Drafts",
+            sub_agents=writers,
+            description=f"Writes {num_drafts} initial drafts concurrently.",
+        )
+        sub_agents = [drafts_agent] + ([selector_agent] if selector_agent else [])
+        super().__init__(
+            name=name,
+            description=writer_agent.description,
+            drafts_agent=drafts_agent,
+            selector_agent=selector_agent,
+            num_drafts=num_drafts,
+            output_key=writer_agent.output_key,
+            topic_key=topic_key,
+            sub_agents=sub_agents,
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        async for event in self.drafts_agent.run_async(ctx):
+            yield event
+
+        state = ctx.session.state
+        drafts = {i: state.get(draft_key(i), "") for i in range(1, self.num_drafts + 1)}
+        topic = state.get(self.topic_key, "")
+        scores = {str(i): score_draft(draft, topic) for i, draft in drafts.items()}
+
+        choice = None
+        if self.selector_agent:
+            async for event in self.selector_agent.run_async(ctx):
+                yield event
+            choice = parse_selection(ctx.session.state.get(STATE_DRAFT_SELECTION, ""), self.num_drafts)
+            if choice is None:
+                logger.warning(f"[{self.name}] Selector gave no valid draft number. Falling back to heuristics.")
+        if choice is None:
+            choice = max(drafts, key=lambda i: scores[str(i)])
+
+        logger.info(f"[{self.name}] Selected draft {choice} of {self.num_drafts} (scores: {scores})")
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={
+                self.output_key: drafts[choice],
+                STATE_DRAFT_SCORES: scores,
+                STATE_SELECTED_DRAFT: choice,
+            }),
+        )
+
+
+def with_multi_draft(
+    writer_agent: LlmAgent,
+    num_drafts: int,
+    selection: str = SELECT_HEURISTIC,
+    topic_key: str = "current_topic",
+) -> BaseAgent:
+    """Returns the writer itself for a single draft, or a MultiDraftWriterAgent around it.
+
+    Args:
+      writer_agent: The initial writer agent.
+      num_drafts: How many drafts to write concurrently.
+      selection: "heuristic" for local scoring, or "critic" for one comparative LLM call.
+      topic_key: The state key of the topic and theme.
+    """
+    if num_drafts <= 1:
+        return writer_agent
+    selector = None
+    if selection == SELECT_CRITIC:
+        selector = build_draft_selector(writer_agent.model, num_drafts, topic_key)
+    return MultiDraftWriterAgent(
+        name="MultiDraftWriter",
+        writer_agent=writer_agent,
+        num_drafts=num_drafts,
+        selector_agent=selector,
+        topic_key=topic_key,
+    )
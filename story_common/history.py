@@ -0,0 +1,168 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from typing import Optional
+import logging, re
+
+from .metrics import Counter, register
+from .topics import parse_story_topic
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Turns (a user message and everything up to the next one) sent verbatim
+DEFAULT_HISTORY_TURNS = 4
+# Estimated tokens of history sent per call, including the summary
+DEFAULT_HISTORY_TOKENS = 2000
+# What the summary of the older turns keeps
+MAX_SUMMARY_TOPICS = 5
+MAX_SUMMARY_MESSAGES = 3
+SUMMARY_MESSAGE_WORDS = 25
+# The first part of another agent's output, as ADK passes it to the current agent
+_FOREIGN_PREFIX = "For context:"
+_STORY_LINE = re.compile(r"STORY:\s*\[\s*topic:[^\]\n]+\]", re.IGNORECASE)
+
+HISTORY_DROPPED_TOKENS = register(Counter("story_history_dropped_tokens_total", "Estimated history tokens left out of LLM calls by compaction, per agent."))
+
+
+def content_tokens(content: types.Content) -> int:
+    """Estimates the tokens of a content (4 characters per token, as the rate limiter does)."""
+    return sum(len(part.text or "") for part in content.parts or []) // 4
+
+
+def is_user_message(content: types.Content) -> bool:
+    """Returns whether the content is a message the user wrote, not a tool result or another agent's output."""
+    if content.role != "user" or not content.parts:
+        return False
+    if any(part.function_response for part in content.parts):
+        return False
+    return not (content.parts[0].text or "").startswith(_FOREIGN_PREFIX)
+
+
+def _text(content: types.Content) -> str:
+    return "\n".join(part.text for part in content.parts or [] if part.text)
+
+
+def summarize_history(contents: list[types.Content]) -> types.Content:
+    """Collapses older contents into one user content holding the facts that matter later.
+
+    These are the topic and theme of every story requested so far and the user's last
+    few messages, shortened. The summary is built locally, without an LLM call.
+    """
+    topics: list[str] = []
+    messages: list[str] = []
+    for content in contents:
+        text = _text(content)
+        for line in _STORY_LINE.findall(text):
+            story_topic = parse_story_topic(line)
+            if story_topic and story_topic.format() not in topics:
+                topics.append(story_topic.format())
+        if is_user_message(content) and text.strip():
+            words = text.split()
+            messages.append(" ".join(words[:SUMMARY_MESSAGE_WORDS]) + (" ..." if len(words) > SUMMARY_MESSAGE_WORDS else ""))
+
+    lines = [f"Summary of the earlier conversation ({len(contents)} older messages left out):"]
+    if topics:
+        lines.append("- Stories requested so far: " + "; ".join(topics[-MAX_SUMMARY_TOPICS:]))
+    if messages:
+        lines.append("- Earlier user messages: " + " | ".join(f'"{message}"' for message in messages[-MAX_SUMMARY_MESSAGES:]))
+    return types.Content(role="user", parts=[types.Part(text="\n".join(lines))])
+
+
+def compact_contents(
+    contents: list[types.Content],
+    max_turns: int = DEFAULT_HISTORY_TURNS,
+    token_budget: int = DEFAULT_HISTORY_TOKENS,
+) -> list[types.Content]:
+    """Keeps the last ``max_turns`` turns and replaces the older contents with a summary.
+
+    If the kept turns and the summary exceed ``token_budget``, the oldest kept contents
+    are summarized too, down to the last content, which is always sent as it is. The
+    kept history never starts with a tool result whose call was left out.
+
+    Returns: The contents themselves if nothing is left out, else a new list.
+    """
+    starts = [index for index, content in enumerate(contents) if is_user_message(content)]
+    cut = starts[-max_turns] if len(starts) > max_turns else 0
+    last = len(contents) - 1
+    # Tokens of contents[index:]
+    remaining = [0] * (len(contents) + 1)
+    for index in range(last, -1, -1):
+        remaining[index] = remaining[index + 1] + content_tokens(contents[index])
+
+    while cut < last:
+        summary_tokens = content_tokens(summarize_history(contents[:cut])) if cut else 0
+        orphaned = any(part.function_response for part in contents[cut].parts or [])
+        if remaining[cut] + summary_tokens <= token_budget and not orphaned:
+            break
+        cut += 1
+    if not cut:
+        return contents
+    return [summarize_history(contents[:cut]), *contents[cut:]]
+
+
+class HistoryCompactor:
+    """
+    before_model_callback that bounds the history an include_contents='default' agent sends.
+
+    ADK sends the whole session to these agents, including every story and critique
+    written earlier in it, so their prompt (and latency) would grow with every turn.
+    The compactor keeps the last turns and summarizes the rest (see compact_contents).
+    """
+
+    def __init__(self, max_turns: int = DEFAULT_HISTORY_TURNS, token_budget: int = DEFAULT_HISTORY_TOKENS):
+        """
+        Initializes the HistoryCompactor.
+
+        Args:
+            max_turns: The number of most recent turns sent verbatim.
+            token_budget: The estimated tokens of history sent per call.
+        """
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+
+    def __call__(
+        self, callback_context: CallbackContext, llm_request: LlmRequest
+    ) -> Optional[LlmResponse]:
+        contents = llm_request.contents
+        compacted = compact_contents(contents, self.max_turns, self.token_budget)
+        if compacted is not contents:
+            before = sum(content_tokens(content) for content in contents)
+            after = sum(content_tokens(content) for content in compacted)
+            HISTORY_DROPPED_TOKENS.inc(max(before - after, 0), agent=callback_context.agent_name)
+            logger.info(
+                f"[{callback_context.agent_name}] History compacted: {len(contents)} -> {len(compacted)} "
+                f"contents, ~{before} -> ~{after} tokens"
+            )
+            llm_request.contents = compacted
+        return None
+
+
+def compact_agent_tree(
+    agent: BaseAgent,
+    max_turns: Optional[int] = DEFAULT_HISTORY_TURNS,
+    token_budget: int = DEFAULT_HISTORY_TOKENS,
+) -> BaseAgent:
+    """Adds a HistoryCompactor to every LlmAgent of the tree that sends the session history.
+
+    The compactor runs first, so the other callbacks see the request that is sent.
+
+    Args:
+      agent: The root of the agent tree.
+      max_turns: The number of most recent turns sent verbatim (None = send the whole history).
+      token_budget: The estimated tokens of history sent per call.
+
+    Returns: The same agent.
+    """
+    if max_turns is None:
+        return agent
+    if isinstance(agent, LlmAgent) and agent.include_contents == "default":
+        callbacks = agent.before_model_callback
+        callbacks = callbacks if isinstance(callbacks, list) else ([callbacks] if callbacks else [])
+        if not any(isinstance(callback, HistoryCompactor) for callback in callbacks):
+            agent.before_model_callback = [HistoryCompactor(max_turns, token_budget)] + callbacks
+    for sub_agent in agent.sub_agents:
+        compact_agent_tree(sub_agent, max_turns, token_budget)
+    return agent
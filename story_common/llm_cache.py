@@ -0,0 +1,318 @@
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import asyncio, hashlib, json, logging, os, sqlite3, threading, time
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# ADK labels every request with the name of the agent that issued it.
+AGENT_NAME_LABEL = "adk_agent_name"
+# Set in custom_metadata of responses served from the cache
+CACHE_HIT_METADATA_KEY = "llm_cache_hit"
+DEFAULT_CACHE_PATH = os.path.join("~", ".cache", "story_writer", "llm_cache.sqlite3")
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# --- Cache Modes ---
+# "off" (default) never caches, "deterministic" caches only the verdict agents and
+# requests at temperature 0, "on" caches every request (regression and replay runs)
+CACHE_OFF = "off"
+CACHE_DETERMINISTIC = "deterministic"
+CACHE_ON = "on"
+# Agents that return a verdict rather than prose; a cached answer does not change the story
+DETERMINISTIC_AGENTS = frozenset({
+    "CriticAgent", "CoherenceCriticAgent", "ClarityCriticAgent", "EngagementCriticAgent",
+    "DraftSelectorAgent", "ContinuityEditorAgent",
+})
+
+
+def agent_name_of(llm_request: LlmRequest) -> str:
+    """Returns the name of the agent that issued the request, or "" if unknown."""
+    if llm_request.config and llm_request.config.labels:
+        return llm_request.config.labels.get(AGENT_NAME_LABEL, "")
+    return ""
+
+
+def cache_mode() -> str:
+    """Returns STORY_LLM_CACHE: "off" (default), "deterministic" or "on"."""
+    mode = os.environ.get("STORY_LLM_CACHE", CACHE_OFF).lower()
+    if mode in ("0", "false"):
+        return CACHE_OFF
+    if mode in ("1", "true", "all"):
+        return CACHE_ON
+    return mode
+
+
+def is_deterministic(llm_request: LlmRequest) -> bool:
+    """Returns whether the request comes from a verdict agent (or a clone of one) or asks for temperature 0."""
+    if agent_name_of(llm_request).rstrip("0123456789") in DETERMINISTIC_AGENTS:
+        return True
+    return bool(llm_request.config and llm_request.config.temperature == 0)
+
+
+def _dump(value) -> object:
+    """Dumps a pydantic value (or a list of them) into plain JSON-able data."""
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return [_dump(item) for item in value]
+    if isinstance(value, type) and hasattr(value, "model_json_schema"):
+        # A response_schema given as a pydantic model class
+        return value.model_json_schema()
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return value
+
+
+def request_cache_key(model: str, llm_request: LlmRequest) -> str:
+    """Builds the content address of a request.
+
+    The key covers the model, the issuing agent, the rendered instruction, the tool
+    schema, the response schema, the conversation contents and the remaining
+    generation parameters, so two
+    requests share a key only if the provider would see the same input.
+
+    Args:
+      model: The name of the model that serves the request.
+      llm_request: The request about to be sent.
+
+    Returns: A hex sha256 digest.
+    """
+    config = llm_request.config
+    generation = {}
+    if config:
+        try:
+            generation = config.model_dump(
+                mode="json",
+                exclude_none=True,
+                exclude={"labels", "system_instruction", "tools", "http_options", "response_schema"},
+            )
+        except Exception:
+            generation = {"repr": repr(config)}
+    material = {
+        "model": model,
+        "agent": agent_name_of(llm_request),
+        "instruction": _dump(config.system_instruction) if config else None,
+        "tools": _dump(config.tools) if config else None,
+        "response_schema": _dump(config.response_schema) if config else None,
+        "contents": _dump(llm_request.contents),
+        "generation": generation,
+    }
+    blob = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    A persistent LLM response store on SQLite with TTL and LRU eviction.
+
+    Entries expire ``ttl_seconds`` after they were written. When the store grows past
+    ``max_entries`` or ``max_bytes``, the least recently read entries are evicted first.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_CACHE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        """
+        Opens (and creates if needed) the cache database.
+
+        Args:
+            path: Location of the SQLite file, or ":memory:".
+            ttl_seconds: Lifetime of an entry. Non-positive means never expire.
+            max_entries: Maximum number of entries kept.
+            max_bytes: Maximum total payload size kept.
+        """
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   agent TEXT,
+                   payload TEXT NOT NULL,
+                   size INTEGER NOT NULL,
+                   created_at REAL NOT NULL,
+                   accessed_at REAL NOT NULL)"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON responses(accessed_at)")
+        self._conn.commit()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._agent_stats: dict[str, dict[str, int]] = {}
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        """Creates a cache configured by the STORY_LLM_CACHE_* environment variables."""
+        return cls(
+            path=os.environ.get("STORY_LLM_CACHE_PATH", DEFAULT_CACHE_PATH),
+            ttl_seconds=float(os.environ.get("STORY_LLM_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+            max_entries=int(os.environ.get("STORY_LLM_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            max_bytes=int(os.environ.get("STORY_LLM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+        )
+
+    def _count(self, agent: str, outcome: str):
+        self._stats[outcome] += 1
+        per_agent = self._agent_stats.setdefault(agent, {"hits": 0, "misses": 0})
+        per_agent[outcome] += 1
+
+    def get(self, key: str, agent: str = "") -> Optional[list[LlmResponse]]:
+        """Returns the cached responses for the key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row and self.ttl_seconds > 0 and row[1] < now - self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._stats["evictions"] += 1
+                row = None
+            if row is None:
+                self._count(agent, "misses")
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._count(agent, "hits")
+        return [LlmResponse.model_validate(item) for item in json.loads(row[0])]
+
+    def put(self, key: str, responses: list[LlmResponse], model: str = "", agent: str = ""):
+        """Stores the responses under the key and evicts entries over the limits."""
+        payload = json.dumps(
+            [response.model_dump(mode="json", exclude_none=True) for response in responses],
+            ensure_ascii=False,
+        )
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, agent, payload, len(payload), now, now),
+            )
+            self._stats["stores"] += 1
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drops expired entries, then least recently used ones over the size limits."""
+        if self.ttl_seconds > 0:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._stats["evictions"] += max(cursor.rowcount, 0)
+        count, total = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = self._conn.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at ASC"
+        ).fetchall()
+        victims = []
+        for key, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self._stats["evictions"] += len(victims)
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters, overall and per agent, plus the store size."""
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size,
+            "per_agent": {agent: dict(counts) for agent, counts in self._agent_stats.items()},
+        }
+
+
+class CachedLlm(BaseLlm):
+    """
+    A BaseLlm that answers repeated requests from a ResponseCache.
+
+    Misses are forwarded to the wrapped model and stored when the call succeeds.
+    Responses that carry an error are never cached. In the "deterministic" mode only
+    the requests of is_deterministic() go through the cache; a writer asked for the
+    same topic twice still writes a new story.
+    """
+
+    inner: BaseLlm
+    cache: Optional[ResponseCache] = None
+    mode: str = CACHE_OFF
+
+    def __init__(self, inner: BaseLlm, cache: Optional[ResponseCache] = None, **kwargs):
+        """
+        Wraps a model with a response cache.
+
+        Args:
+            inner: The model that serves cache misses.
+            cache: The store to use. Defaults to ResponseCache.from_env() if STORY_LLM_CACHE
+              enables caching, else no caching at all.
+        """
+        mode = kwargs.pop("mode", None) or (CACHE_ON if cache is not None else cache_mode())
+        if mode not in (CACHE_OFF, CACHE_DETERMINISTIC, CACHE_ON):
+            raise ValueError(f"Unknown STORY_LLM_CACHE mode '{mode}', expected off, deterministic or on")
+        if cache is None and mode != CACHE_OFF:
+            cache = ResponseCache.from_env()
+        super().__init__(model=kwargs.pop("model", inner.model), inner=inner, cache=cache, mode=mode, **kwargs)
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.cache is None or (self.mode == CACHE_DETERMINISTIC and not is_deterministic(llm_request)):
+            async for response in self.inner.generate_content_async(llm_request, stream=stream):
+                yield response
+            return
+
+        agent = agent_name_of(llm_request)
+        key = request_cache_key(self.inner.model, llm_request)
+        cached = await asyncio.to_thread(self.cache.get, key, agent)
+        if cached is not None:
+            logger.debug(f"[LLM Cache] Hit for {agent} ({key[:12]})")
+            for response in cached:
+                response.custom_metadata = {**(response.custom_metadata or {}), CACHE_HIT_METADATA_KEY: True}
+                yield response
+            return
+
+        logger.debug(f"[LLM Cache] Miss for {agent} ({key[:12]})")
+        collected = []
+        failed = False
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            if response.error_code or response.error_message:
+                failed = True
+            elif not response.partial:
+                collected.append(response)
+            yield response
+        if collected and not failed:
+            await asyncio.to_thread(self.cache.put, key, collected, self.inner.model, agent)
+
+    def cache_stats(self) -> dict:
+        """Returns the statistics of the underlying cache (empty if disabled)."""
+        return self.cache.stats() if self.cache else {}
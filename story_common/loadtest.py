@@ -0,0 +1,188 @@
+"""Load-test driver for the story writer pipelines against MockLlm.
+
+Runs N concurrent sessions of one package's pipeline with every LlmAgent pointed at a
+local MockLlm, or at a ReplayLlm serving a recorded trace, and reports throughput,
+per-agent step latency percentiles and event-loop lag as JSON.
+
+Usage:
+    python -m story_common.loadtest llm_story_writer --sessions 200 --concurrency 50 --latency-ms 300
+    python -m story_common.loadtest custom_story_writer --sessions 20 --replay trace.jsonl --replay-latency original
+"""
+from google.adk.agents import BaseAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from typing import Optional
+import argparse, asyncio, importlib, json, logging, time, uuid
+
+from .mock_llm import MockLlm, install_model
+from .replay import LATENCY_NONE, LATENCY_ORIGINAL, ReplayLlm
+
+logger = logging.getLogger(__name__)
+
+# Entry agent of each package, and whether it expects the topic preset in state
+# (llm_story_writer's pipeline runs after the root assistant has collected it).
+PIPELINES = {
+    "llm_story_writer": ("story_writing_pipeline", True),
+    "interact_story_writer": ("root_agent", False),
+    "custom_story_writer": ("root_agent", False),
+}
+LOADTEST_TOPIC = "a lighthouse keeper finds a map of a harbor that does not exist"
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Returns the q-th percentile (0-100) of the values by linear interpolation."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: list[float]) -> dict:
+    """Summarizes latencies in seconds as count, mean and p50/p95/p99/max in milliseconds."""
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000 * percentile(values, 50), 3),
+        "p95_ms": round(1000 * percentile(values, 95), 3),
+        "p99_ms": round(1000 * percentile(values, 99), 3),
+        "max_ms": round(1000 * max(values), 3) if values else 0.0,
+    }
+
+
+def load_pipeline(package: str) -> tuple[BaseAgent, bool]:
+    """Imports a story writer package and returns its entry agent."""
+    attribute, preset_topic = PIPELINES[package]
+    module = importlib.import_module(f"{package}.agent")
+    return getattr(module, attribute), preset_topic
+
+
+async def _monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01):
+    """Measures how late the event loop wakes up a task that sleeps ``interval``."""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(time.perf_counter() - started - interval, 0.0))
+
+
+async def run_session(
+    runner: Runner, session_id: str, preset_topic: bool, agent_latencies: dict[str, list[float]]
+) -> float:
+    """Runs one session to completion and returns its duration in seconds.
+
+    Per-agent latency is the time between a model response of the agent and the
+    event before it, so it includes the orchestration overhead of that step.
+    """
+    state = {"current_topic": f"STORY: [topic: {LOADTEST_TOPIC}, theme: drama]"} if preset_topic else {}
+    await runner.session_service.create_session(
+        app_name=runner.app_name, user_id="loadtest", session_id=session_id, state=state
+    )
+    message = types.Content(role="user", parts=[types.Part(text=LOADTEST_TOPIC)])
+    started = last = time.perf_counter()
+    async for event in runner.run_async(user_id="loadtest", session_id=session_id, new_message=message):
+        now = time.perf_counter()
+        if not event.partial and event.content and event.content.role == "model":
+            agent_latencies.setdefault(event.author, []).append(now - last)
+        last = now
+    await runner.session_service.delete_session(
+        app_name=runner.app_name, user_id="loadtest", session_id=session_id
+    )
+    return time.perf_counter() - started
+
+
+async def run_load_test(
+    package: str,
+    sessions: int = 100,
+    concurrency: int = 10,
+    model: Optional[BaseLlm] = None,
+) -> dict:
+    """
+    Runs ``sessions`` sessions of a package, at most ``concurrency`` at a time.
+
+    Args:
+        package: One of the story writer packages, e.g. "llm_story_writer".
+        sessions: The total number of sessions to run.
+        concurrency: The maximum number of sessions running at once.
+        model: The model serving every LlmAgent (a MockLlm or a ReplayLlm). Defaults to a MockLlm without latency.
+
+    Returns: The report with throughput, latency percentiles, lag and error counts.
+    """
+    agent, preset_topic = load_pipeline(package)
+    # Session ids are unique per run, so no session resumes a checkpoint of an earlier run
+    run_id = uuid.uuid4().hex[:12]
+    model = model or MockLlm()
+    install_model(agent, model)
+    runner = Runner(agent=agent, app_name=package, session_service=InMemorySessionService())
+
+    semaphore = asyncio.Semaphore(concurrency)
+    agent_latencies: dict[str, list[float]] = {}
+    session_latencies: list[float] = []
+    errors: dict[str, int] = {}
+    lag_samples: list[float] = []
+    stop = asyncio.Event()
+
+    async def one(index: int):
+        async with semaphore:
+            try:
+                session_latencies.append(
+                    await run_session(runner, f"loadtest_{run_id}_{index}", preset_topic, agent_latencies)
+                )
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    monitor = asyncio.create_task(_monitor_loop_lag(lag_samples, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await monitor
+
+    return {
+        "package": package,
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "completed": len(session_latencies),
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_sessions_per_s": round(len(session_latencies) / wall, 3) if wall else 0.0,
+        "llm_calls": model.calls,
+        "session_latency": summarize(session_latencies),
+        "agent_latency": {agent_name: summarize(values) for agent_name, values in agent_latencies.items()},
+        "event_loop_lag": summarize(lag_samples),
+    }
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Load-test a story writer pipeline against a mock LLM.")
+    parser.add_argument("package", choices=sorted(PIPELINES), help="the package to load-test")
+    parser.add_argument("--sessions", type=int, default=100, help="total number of sessions")
+    parser.add_argument("--concurrency", type=int, default=10, help="maximum number of concurrent sessions")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="median simulated LLM latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="log-normal spread of the latency (0: constant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of LLM calls that fail")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for latency and errors")
+    parser.add_argument("--replay", default=None, help="serve the LLM calls recorded in this trace instead of the mock")
+    parser.add_argument("--replay-latency", choices=[LATENCY_NONE, LATENCY_ORIGINAL], default=LATENCY_NONE, help="wait the recorded latencies when replaying")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    if args.replay:
+        model = ReplayLlm(path=args.replay, latency=args.replay_latency)
+    else:
+        model = MockLlm(
+            latency_ms=args.latency_ms, latency_sigma=args.latency_sigma, error_rate=args.error_rate, seed=args.seed
+        )
+    report = asyncio.run(run_load_test(args.package, args.sessions, args.concurrency, model))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
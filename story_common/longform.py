@@ -0,0 +1,510 @@
+from google.adk.agents import BaseAgent, LlmAgent, ParallelAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.models.base_llm import BaseLlm
+from pydantic import BaseModel
+from typing import AsyncGenerator, Optional, Union
+from typing_extensions import override
+import json, logging, re
+
+from .checkpoint import STATE_RESUMED_FROM
+from .critics import CRITIC_DIMENSIONS, CriticPanelAgent, critic_key
+from .patching import PatchRefinerAgent, STATE_APPLIED_EDITS, STATE_NUMBERED_DOC, STATE_REFINER_PATCH
+from .refinement import (
+    RefinementLoopAgent, STATE_REFINEMENT_EXIT_REASON, STATE_REFINEMENT_ITERATION, STATE_RESUME_ROUNDS,
+    EXIT_CRITIC_DONE, EXIT_MAX_ITERATIONS, EXIT_ESCALATED, EXIT_CONVERGED, EXIT_DEADLINE, EXIT_SKIPPED,
+)
+from .streaming import no_stream
+
+logger = logging.getLogger(__name__)
+
+# --- State Keys ---
+STATE_OUTLINE = "story_outline"
+STATE_CHAPTER_TITLES = "chapter_titles"
+STATE_CONTINUITY_NOTES = "continuity_notes"
+# Set once the outline is stored, cleared once the story is joined: a resumed run keeps the outline
+STATE_LONGFORM_OUTLINED = "longform_outlined"
+# Per chapter: chapter_<i>_brief, _document, _criticism, _status
+CHAPTER_BRIEF = "brief"
+CHAPTER_DOCUMENT = "document"
+CHAPTER_CRITICISM = "criticism"
+CHAPTER_STATUS = "status"
+# --- Chapter Status ---
+STATUS_REFINED = "refined"
+STATUS_REVISED = "revised_for_continuity"
+
+# The story's exit reason is the first of these that any chapter loop ended with
+EXIT_REASON_PRIORITY = (EXIT_DEADLINE, EXIT_ESCALATED, EXIT_MAX_ITERATIONS, EXIT_CONVERGED, EXIT_CRITIC_DONE, EXIT_SKIPPED)
+# Target length of a chapter, in sentences
+CHAPTER_SENTENCES = "6-10"
+# Flash-story wording of the story's critic and refiner prompts, and its chapter equivalent
+_FLASH_WORDING = (
+    (re.compile(r"\ba short story draft\b"), "a chapter draft"),
+    (re.compile(r"\((?:typically|aim for) \d+-\d+ sentences\)"), f"(typically {CHAPTER_SENTENCES} sentences)"),
+    (re.compile(r"\bfor a flash (?:short )?story\b"), "of a longer story"),
+)
+
+_JSON_ARRAY = re.compile(r"\[.*\]", re.DOTALL)
+_NUMBERED_LINE = re.compile(r"^\s*(?:chapter\s*)?\d+\s*[.):-]\s*(?P<text>.+)$", re.IGNORECASE)
+
+
+def chapter_key(index: int, name: str) -> str:
+    """Returns the state key of one value of the chapter with the given 1-based index."""
+    return f"chapter_{index}_{name}"
+
+
+class ChapterPlan(BaseModel):
+    """One chapter of the outline."""
+
+    title: str
+    summary: str
+
+
+def parse_outline(text: str, num_chapters: int) -> list[ChapterPlan]:
+    """Parses the outliner output into exactly ``num_chapters`` chapter plans.
+
+    The outliner is asked for a JSON list of {"title", "summary"} objects; numbered
+    lines ("1. The Map: ...") are accepted as well. Missing chapters are filled with
+    a generic plan, extra ones are dropped.
+    """
+    chapters = []
+    match = _JSON_ARRAY.search(text or "")
+    if match:
+        try:
+            for item in json.loads(match.group()):
+                if isinstance(item, dict) and (item.get("summary") or item.get("title")):
+                    title = str(item.get("title") or f"Chapter {len(chapters) + 1}").strip()
+                    chapters.append(ChapterPlan(title=title, summary=str(item.get("summary") or title).strip()))
+        except json.JSONDecodeError:
+            chapters = []
+    if not chapters:
+        for line in (text or "").splitlines():
+            line_match = _NUMBERED_LINE.match(line)
+            if line_match:
+                title, _, summary = line_match.group("text").partition(":")
+                chapters.append(ChapterPlan(title=title.strip(), summary=(summary or title).strip()))
+    for index in range(len(chapters) + 1, num_chapters + 1):
+        ending = "Bring the story to its ending." if index == num_chapters else "Continue the story."
+        chapters.append(ChapterPlan(title=f"Chapter {index}", summary=ending))
+    return chapters[:num_chapters]
+
+
+def parse_continuity_notes(text: str, num_chapters: int) -> dict[int, list[str]]:
+    """Parses the continuity editor output ([{"chapter": 2, "issue": "..."}]) into issues per chapter."""
+    notes: dict[int, list[str]] = {}
+    match = _JSON_ARRAY.search(text or "")
+    if not match:
+        return notes
+    try:
+        items = json.loads(match.group())
+    except json.JSONDecodeError:
+        return notes
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("chapter"))
+        except (TypeError, ValueError):
+            continue
+        issue = str(item.get("issue") or "").strip()
+        if 1 <= index <= num_chapters and issue:
+            notes.setdefault(index, []).append(issue)
+    return notes
+
+
+def _chapter_context(index: int, num_chapters: int) -> str:
+    return f"""You are working on chapter {index} of a {num_chapters}-chapter story.
+
+    **Story Outline:**
+    ```
+    {{{STATE_OUTLINE}}}
+    ```
+
+    **This Chapter:**
+    ```{{{chapter_key(index, CHAPTER_BRIEF)}}}```
+
+"""
+
+
+def chapter_instruction(instruction: str) -> str:
+    """Rewrites the flash-story length of a critic or refiner prompt for a chapter, so chapters are not flagged as too long."""
+    for pattern, replacement in _FLASH_WORDING:
+        instruction = pattern.sub(replacement, instruction)
+    return instruction
+
+
+def _chapter_keys(index: int, document_key: str, criticism_key: str) -> dict[str, str]:
+    """Maps the story's state keys to the keys of one chapter.
+
+    Besides the story and its criticism, these are the working keys of the
+    specialized critics and of the patch refiner, so chapters refined side by side
+    do not overwrite each other's reviews and patches.
+    """
+    keys = {
+        document_key: chapter_key(index, CHAPTER_DOCUMENT),
+        criticism_key: chapter_key(index, CHAPTER_CRITICISM),
+    }
+    for key in [critic_key(dimension) for dimension in CRITIC_DIMENSIONS] + [STATE_NUMBERED_DOC, STATE_REFINER_PATCH, STATE_APPLIED_EDITS]:
+        keys[key] = chapter_key(index, key)
+    return keys
+
+
+def _clone_for_chapter(agent: LlmAgent, index: int, num_chapters: int, name: str, keys: dict[str, str]) -> LlmAgent:
+    """Clones an LlmAgent so it works on one chapter's state keys (see _chapter_keys) instead of the story's."""
+    instruction = chapter_instruction(agent.instruction)
+    for key, chapter_value in keys.items():
+        instruction = instruction.replace(f"{{{key}}}", f"{{{chapter_value}}}")
+    return agent.model_copy(update={
+        "name": name,
+        "instruction": _chapter_context(index, num_chapters) + instruction,
+        "output_key": keys.get(agent.output_key, agent.output_key),
+        # Chapters are refined side by side; interleaved token streams would be unreadable
+        "before_model_callback": no_stream,
+        "parent_agent": None,
+        "sub_agents": [],
+    })
+
+
+def _chapter_critic(critic_agent: BaseAgent, index: int, num_chapters: int, keys: dict[str, str]) -> BaseAgent:
+    """Clones the story critic for one chapter: a single critic, or a CriticPanelAgent with all its critics."""
+    if isinstance(critic_agent, CriticPanelAgent):
+        return CriticPanelAgent(
+            name=f"{critic_agent.name}{index}",
+            critic_agents=[
+                _clone_for_chapter(critic, index, num_chapters, f"{critic.name}{index}", keys)
+                for critic in critic_agent.critics_agent.sub_agents
+            ],
+            criticism_key=keys[critic_agent.criticism_key],
+            max_issues=critic_agent.max_issues,
+            state_prefix=chapter_key(index, ""),
+        )
+    return _clone_for_chapter(critic_agent, index, num_chapters, f"{critic_agent.name}{index}", keys)
+
+
+def _chapter_refiner(refiner_agent: BaseAgent, index: int, num_chapters: int, keys: dict[str, str]) -> BaseAgent:
+    """Clones the story refiner for one chapter: a single refiner, or a PatchRefinerAgent with its patch and rewrite agents."""
+    if isinstance(refiner_agent, PatchRefinerAgent):
+        patch_agent, rewrite_agent = refiner_agent.patch_agent, refiner_agent.rewrite_agent
+        return PatchRefinerAgent(
+            name=f"{refiner_agent.name}{index}",
+            patch_agent=_clone_for_chapter(patch_agent, index, num_chapters, f"{patch_agent.name}{index}", keys),
+            rewrite_agent=_clone_for_chapter(rewrite_agent, index, num_chapters, f"{rewrite_agent.name}{index}", keys),
+            document_key=keys[refiner_agent.document_key],
+            state_prefix=chapter_key(index, ""),
+        )
+    return _clone_for_chapter(refiner_agent, index, num_chapters, f"{refiner_agent.name}{index}", keys)
+
+
+def build_outliner(model: Union[str, BaseLlm], num_chapters: int, topic_key: str = "current_topic") -> LlmAgent:
+    """Creates the agent that plans the chapters of a long-form story."""
+    return LlmAgent(
+        name="OutlinerAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a Creative Writing Assistant planning a {num_chapters}-chapter story.
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+    **Task:**
+    Outline the story in exactly {num_chapters} chapters. For each chapter give a short title and a 1-2 sentence summary of what happens,
+    so that the chapters can be written independently and still form one coherent story with a clear beginning, middle and end.
+    Respond with *only* a JSON list like [{{"title": "...", "summary": "..."}}]. Do not add explanations or code fences.
+""",
+        description="Outlines the chapters of a long-form story.",
+        output_key=STATE_OUTLINE,
+        before_model_callback=no_stream,
+    )
+
+
+def build_chapter_writer(model: Union[str, BaseLlm], index: int, num_chapters: int, topic_key: str = "current_topic") -> LlmAgent:
+    """Creates the agent that writes the first draft of one chapter."""
+    return LlmAgent(
+        name=f"ChapterWriterAgent{index}",
+        model=model,
+        include_contents='none',
+        instruction=_chapter_context(index, num_chapters) + f"""    You are a Creative Writing Assistant. Write the *first draft* of this chapter (aim for {CHAPTER_SENTENCES} sentences).
+
+    Topic and Theme: ```{{{topic_key}}}```
+
+    Follow the outline so the chapter connects with the chapters before and after it.
+    Output *only* the chapter text. Do not add a chapter heading, introductions or explanations.
+""",
+        description=f"Writes the first draft of chapter {index}.",
+        output_key=chapter_key(index, CHAPTER_DOCUMENT),
+        before_model_callback=no_stream,
+    )
+
+
+def build_continuity_editor(model: Union[str, BaseLlm], num_chapters: int, topic_key: str = "current_topic") -> LlmAgent:
+    """Creates the agent that reviews all chapters together for continuity errors."""
+    chapters = "\n\n".join(
+        f"**Chapter {i}:**\n```\n{{{chapter_key(i, CHAPTER_DOCUMENT)}}}\n```" for i in range(1, num_chapters + 1)
+    )
+    return LlmAgent(
+        name="ContinuityEditorAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a continuity editor reviewing a {num_chapters}-chapter story whose chapters were written separately.
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+{chapters}
+
+    **Task:**
+    Find continuity errors between the chapters: contradicting facts, names, timelines or character behavior, and missing or abrupt transitions.
+    Respond with *only* a JSON list like [{{"chapter": 2, "issue": "..."}}], naming the chapter that should change. Respond with [] if the chapters are consistent.
+    Do not add explanations or code fences.
+""",
+        description="Reviews the chapters together and lists continuity errors per chapter.",
+        output_key=STATE_CONTINUITY_NOTES,
+        before_model_callback=no_stream,
+    )
+
+
+def _state_event(ctx: InvocationContext, author: str, state_delta: dict) -> Event:
+    return Event(
+        invocation_id=ctx.invocation_id,
+        author=author,
+        branch=ctx.branch,
+        actions=EventActions(state_delta=state_delta),
+    )
+
+
+class ChapterAgent(BaseAgent):
+    """Writes one chapter and refines it with its own critic/refiner loop."""
+
+    index: int
+    writer_agent: LlmAgent
+    refinement_loop: RefinementLoopAgent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, index: int, writer_agent: LlmAgent, refinement_loop: RefinementLoopAgent):
+        super().__init__(
+            name=f"Chapter{index}",
+            description=f"Writes and refines chapter {index}.",
+            index=index,
+            writer_agent=writer_agent,
+            refinement_loop=refinement_loop,
+            sub_agents=[writer_agent, refinement_loop],
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        # The exit reason is reset with every new outline, so it is only set here when a resumed run refined this chapter before
+        if ctx.session.state.get(self.refinement_loop.state_key(STATE_REFINEMENT_EXIT_REASON)):
+            logger.info(f"[{self.name}] Skipping: completed before the restart.")
+            return
+        # Restored in the middle of its refinement: the draft is already written
+        if not ctx.session.state.get(self.refinement_loop.state_key(STATE_RESUME_ROUNDS)):
+            async for event in self.writer_agent.run_async(ctx):
+                yield event
+        async for event in self.refinement_loop.run_async(ctx):
+            yield event
+        exit_reason = ctx.session.state.get(self.refinement_loop.state_key(STATE_REFINEMENT_EXIT_REASON))
+        logger.info(f"[{self.name}] Finished ({exit_reason}).")
+        # Stored as soon as this chapter is done, while the others are still being written
+        yield _state_event(ctx, self.name, {chapter_key(self.index, CHAPTER_STATUS): STATUS_REFINED})
+
+
+class ContinuityFixAgent(BaseAgent):
+    """Revises one chapter with its continuity notes, if the continuity editor flagged it."""
+
+    index: int
+    refiner_agent: LlmAgent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, index: int, refiner_agent: LlmAgent):
+        super().__init__(
+            name=f"ContinuityFix{index}",
+            description=f"Fixes the continuity errors of chapter {index}.",
+            index=index,
+            refiner_agent=refiner_agent,
+            sub_agents=[refiner_agent],
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        if ctx.session.state.get(chapter_key(self.index, CHAPTER_STATUS)) != STATUS_REVISED:
+            return
+        async for event in self.refiner_agent.run_async(ctx):
+            yield event
+
+
+class LongFormWriterAgent(BaseAgent):
+    """
+    Writes a multi-chapter story from an outline, with the chapters written concurrently.
+
+    An outliner plans the chapters; then every chapter is drafted and refined by its
+    own writer and critic/refiner loop, all chapters in parallel, so the wall time
+    grows with the slowest chapter rather than with the number of chapters. Each
+    chapter's text is in state[chapter_<i>_document] as soon as it is done. A
+    continuity editor then reviews all chapters together and the flagged chapters
+    are revised, again in parallel, before the chapters are joined into
+    ``document_key``.
+
+    The story's refinement_exit_reason is the worst exit reason of the chapter loops
+    (see EXIT_REASON_PRIORITY) and its refinement_iteration the most rounds any chapter
+    took. When a checkpointed run is resumed, the outline and the finished chapters are
+    kept and interrupted chapter loops continue after their last saved round.
+    """
+
+    num_chapters: int
+    document_key: str
+    outliner_agent: LlmAgent
+    chapters_agent: ParallelAgent
+    chapter_loops: list[RefinementLoopAgent]
+    continuity_agent: LlmAgent
+    fixes_agent: ParallelAgent
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        model: Union[str, BaseLlm],
+        num_chapters: int,
+        critic_agent: BaseAgent,
+        refiner_agent: BaseAgent,
+        topic_key: str = "current_topic",
+        document_key: str = "current_document",
+        criticism_key: str = "criticism",
+        **loop_kwargs,
+    ):
+        """
+        Initializes the LongFormWriterAgent.
+
+        Args:
+            name: The name of the agent.
+            model: The model of the outliner, chapter writers and continuity editor.
+            num_chapters: The number of chapters.
+            critic_agent: The story critic, or a CriticPanelAgent; cloned once per chapter.
+            refiner_agent: The story refiner, or a PatchRefinerAgent; cloned once per chapter. Its
+              rewrite refiner is cloned once per continuity fix.
+            topic_key: The state key of the topic and theme.
+            document_key: The state key the critic and refiner work on, and that receives the whole story.
+            criticism_key: The state key the critic writes to.
+            **loop_kwargs: Further RefinementLoopAgent arguments (max_iterations, completion_phrase, ...).
+        """
+        # Continuity notes are not sentence edits: the fixes always rewrite the chapter
+        rewrite_agent = getattr(refiner_agent, "rewrite_agent", refiner_agent)
+        chapters, loops, fixes = [], [], []
+        for i in range(1, num_chapters + 1):
+            keys = _chapter_keys(i, document_key, criticism_key)
+            loop = RefinementLoopAgent(
+                name=f"ChapterRefinementLoop{i}",
+                critic_agent=_chapter_critic(critic_agent, i, num_chapters, keys),
+                refiner_agent=_chapter_refiner(refiner_agent, i, num_chapters, keys),
+                criticism_key=chapter_key(i, CHAPTER_CRITICISM),
+                document_key=chapter_key(i, CHAPTER_DOCUMENT),
+                state_prefix=chapter_key(i, ""),
+                **loop_kwargs,
+            )
+            loops.append(loop)
+            chapters.append(ChapterAgent(i, build_chapter_writer(model, i, num_chapters, topic_key), loop))
+            fix_refiner = _clone_for_chapter(rewrite_agent, i, num_chapters, f"Continuity{rewrite_agent.name}{i}", keys)
+            fixes.append(ContinuityFixAgent(i, fix_refiner))
+        outliner_agent = build_outliner(model, num_chapters, topic_key)
+        chapters_agent = ParallelAgent(name=f"{name}Chapters", sub_agents=chapters, description=f"Writes {num_chapters} chapters concurrently.")
+        continuity_agent = build_continuity_editor(model, num_chapters, topic_key)
+        fixes_agent = ParallelAgent(name=f"{name}ContinuityFixes", sub_agents=fixes, description="Fixes the flagged chapters concurrently.")
+        super().__init__(
+            name=name,
+            description=f"Writes a {num_chapters}-chapter story from an outline, chapters in parallel.",
+            num_chapters=num_chapters,
+            document_key=document_key,
+            outliner_agent=outliner_agent,
+            chapters_agent=chapters_agent,
+            chapter_loops=loops,
+            continuity_agent=continuity_agent,
+            fixes_agent=fixes_agent,
+            sub_agents=[outliner_agent, chapters_agent, continuity_agent, fixes_agent],
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        if ctx.session.state.get(STATE_RESUMED_FROM) and ctx.session.state.get(STATE_LONGFORM_OUTLINED):
+            logger.info(f"[{self.name}] Resuming with the outline: {ctx.session.state.get(STATE_CHAPTER_TITLES)}")
+        else:
+            async for event in self.outliner_agent.run_async(ctx):
+                yield event
+            plans = parse_outline(ctx.session.state.get(STATE_OUTLINE, ""), self.num_chapters)
+            logger.info(f"[{self.name}] Outline: {[plan.title for plan in plans]}")
+            state_delta = {STATE_CHAPTER_TITLES: [plan.title for plan in plans], STATE_LONGFORM_OUTLINED: True}
+            for i, (plan, loop) in enumerate(zip(plans, self.chapter_loops), start=1):
+                state_delta[chapter_key(i, CHAPTER_BRIEF)] = f"{plan.title}: {plan.summary}"
+                state_delta[chapter_key(i, CHAPTER_CRITICISM)] = ""
+                state_delta[chapter_key(i, CHAPTER_STATUS)] = None
+                state_delta[loop.state_key(STATE_REFINEMENT_EXIT_REASON)] = None
+            yield _state_event(ctx, self.name, state_delta)
+
+        async for event in self.chapters_agent.run_async(ctx):
+            yield event
+
+        async for event in self.continuity_agent.run_async(ctx):
+            yield event
+        notes = parse_continuity_notes(ctx.session.state.get(STATE_CONTINUITY_NOTES, ""), self.num_chapters)
+        logger.info(f"[{self.name}] Continuity issues in chapters {sorted(notes)}")
+        if notes:
+            yield _state_event(ctx, self.name, {
+                key: value
+                for index, issues in notes.items()
+                for key, value in (
+                    (chapter_key(index, CHAPTER_CRITICISM), "\n".join(f"- {issue}" for issue in issues)),
+                    (chapter_key(index, CHAPTER_STATUS), STATUS_REVISED),
+                )
+            })
+            async for event in self.fixes_agent.run_async(ctx):
+                yield event
+
+        state = ctx.session.state
+        story = "\n\n".join(
+            f"Chapter {i}: {title}\n\n{state.get(chapter_key(i, CHAPTER_DOCUMENT), '').strip()}"
+            for i, title in enumerate(state.get(STATE_CHAPTER_TITLES, []), start=1)
+        )
+        yield _state_event(ctx, self.name, {
+            self.document_key: story,
+            STATE_LONGFORM_OUTLINED: False,
+            **self._refinement_summary(ctx),
+        })
+
+    def _refinement_summary(self, ctx: InvocationContext) -> dict:
+        """Returns the story-level exit reason and iterations, aggregated over the chapter loops."""
+        state = ctx.session.state
+        reasons = [state.get(loop.state_key(STATE_REFINEMENT_EXIT_REASON)) for loop in self.chapter_loops]
+        exit_reason = next((reason for reason in EXIT_REASON_PRIORITY if reason in reasons), None)
+        iterations = max((state.get(loop.state_key(STATE_REFINEMENT_ITERATION)) or 0 for loop in self.chapter_loops), default=0)
+        logger.info(f"[{self.name}] Chapter exit reasons {reasons}: {exit_reason}")
+        return {STATE_REFINEMENT_EXIT_REASON: exit_reason, STATE_REFINEMENT_ITERATION: iterations}
+
+
+def with_long_form(
+    writer_steps: list[BaseAgent],
+    num_chapters: int,
+    model: Union[str, BaseLlm],
+    critic_agent: BaseAgent,
+    refiner_agent: BaseAgent,
+    **kwargs,
+) -> list[BaseAgent]:
+    """Returns the writing steps of a pipeline: ``writer_steps`` for flash stories, or a LongFormWriterAgent.
+
+    Args:
+        writer_steps: The flash story steps (initial writer and refinement loop).
+        num_chapters: The number of chapters; 0 or 1 keeps the flash story steps.
+        model: The model of the long-form specific agents.
+        critic_agent: The critic step of the refinement loop (a critic or a CriticPanelAgent), cloned per chapter.
+        refiner_agent: The refiner step of the refinement loop (a refiner or a PatchRefinerAgent), cloned per chapter.
+        **kwargs: Further LongFormWriterAgent arguments.
+    """
+    if num_chapters <= 1:
+        return writer_steps
+    return [LongFormWriterAgent("LongFormWriterAgent", model, num_chapters, critic_agent, refiner_agent, **kwargs)]
@@ -0,0 +1,278 @@
+from google.adk.agents import BaseAgent, LlmAgent, LoopAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import bisect, logging, os, threading, time
+
+from .llm_cache import CACHE_HIT_METADATA_KEY
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+ITERATION_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Bound on the start times kept for in-flight LLM calls; calls that raise never reach
+# the after_model_callback, so their entries are dropped oldest first
+MAX_IN_FLIGHT_CALLS = 10_000
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter with labels."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_label_text(key)} {value:g}" for key, value in sorted(self._values.items())]
+        return lines
+
+
+class Gauge(Counter):
+    """A Prometheus gauge with labels: a value that goes up and down."""
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram with fixed buckets and labels."""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, totals = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), [0.0, 0]])
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series[1][1] if series else 0
+
+    def totals(self) -> dict[tuple, tuple[float, int]]:
+        """Returns the sum and count of the observations of every label set."""
+        with self._lock:
+            return {key: (total, count) for key, (_, (total, count)) in self._series.items()}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, (total, count)) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_label_text(key + (('le', le),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(key)} {total:g}")
+                lines.append(f"{self.name}_count{_label_text(key)} {count}")
+        return lines
+
+
+# --- Metrics ---
+LLM_CALL_SECONDS = Histogram("story_llm_call_duration_seconds", "Latency of LLM calls per agent.")
+LLM_CALLS = Counter("story_llm_calls_total", "LLM calls per agent, by cache outcome.")
+LLM_PROMPT_TOKENS = Counter("story_llm_prompt_tokens_total", "Prompt tokens sent per agent.")
+LLM_COMPLETION_TOKENS = Counter("story_llm_completion_tokens_total", "Completion tokens received per agent.")
+LLM_CACHED_PROMPT_TOKENS = Counter("story_llm_cached_prompt_tokens_total", "Prompt tokens served from the provider's prefix cache, per agent.")
+LLM_ERRORS = Counter("story_llm_errors_total", "LLM responses carrying an error, per agent.")
+LOOP_ITERATIONS = Histogram("story_loop_iterations", "Iterations per loop run.", ITERATION_BUCKETS)
+LOOP_SECONDS = Histogram("story_loop_duration_seconds", "Wall time per loop run.")
+LOOP_EXITS = Counter("story_loop_exits_total", "Loop runs by exit reason.")
+AGENT_ERRORS = Counter("story_agent_errors_total", "Exceptions raised inside an instrumented agent, by type.")
+
+REGISTRY: list = [
+    LLM_CALL_SECONDS, LLM_CALLS, LLM_PROMPT_TOKENS, LLM_COMPLETION_TOKENS, LLM_CACHED_PROMPT_TOKENS, LLM_ERRORS,
+    LOOP_ITERATIONS, LOOP_SECONDS, LOOP_EXITS, AGENT_ERRORS,
+]
+
+
+def register(metric):
+    """Adds a Counter or Histogram to the exported metrics and returns it."""
+    REGISTRY.append(metric)
+    return metric
+
+
+def render_metrics() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def observe_loop(loop: str, iterations: int, exit_reason: str, seconds: float):
+    """Records one finished loop run."""
+    LOOP_ITERATIONS.observe(iterations, loop=loop)
+    LOOP_SECONDS.observe(seconds, loop=loop)
+    LOOP_EXITS.inc(loop=loop, reason=exit_reason)
+
+
+# --- Model Callbacks ---
+# Start times of in-flight LLM calls, per (invocation, agent), oldest first
+_call_started: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+
+def record_model_start(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback that starts the latency timer of the call."""
+    key = (callback_context.invocation_id, callback_context.agent_name)
+    _call_started[key] = time.perf_counter()
+    _call_started.move_to_end(key)
+    while len(_call_started) > MAX_IN_FLIGHT_CALLS:
+        _call_started.popitem(last=False)
+    return None
+
+
+def record_model_end(
+    callback_context: CallbackContext, llm_response: LlmResponse
+) -> Optional[LlmResponse]:
+    """after_model_callback that records latency, tokens, cache outcome and errors."""
+    if llm_response.partial:
+        return None
+    agent = callback_context.agent_name
+    started = _call_started.pop((callback_context.invocation_id, agent), None)
+    if started is not None:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - started, agent=agent)
+    cache_hit = bool(llm_response.custom_metadata and llm_response.custom_metadata.get(CACHE_HIT_METADATA_KEY))
+    LLM_CALLS.inc(agent=agent, cache="hit" if cache_hit else "miss")
+    # Cache hits replay stored usage but consume no provider quota
+    if llm_response.usage_metadata and not cache_hit:
+        LLM_PROMPT_TOKENS.inc(llm_response.usage_metadata.prompt_token_count or 0, agent=agent)
+        LLM_COMPLETION_TOKENS.inc(llm_response.usage_metadata.candidates_token_count or 0, agent=agent)
+        LLM_CACHED_PROMPT_TOKENS.inc(llm_response.usage_metadata.cached_content_token_count or 0, agent=agent)
+    if llm_response.error_code or llm_response.error_message:
+        LLM_ERRORS.inc(agent=agent, code=str(llm_response.error_code or "unknown"))
+    return None
+
+
+def _add_callback(callbacks, callback, first: bool) -> list:
+    existing = callbacks if isinstance(callbacks, list) else ([callbacks] if callbacks else [])
+    if callback in existing:
+        return existing
+    return [callback] + existing if first else existing + [callback]
+
+
+def instrument_agent_tree(agent: BaseAgent) -> BaseAgent:
+    """Adds the metrics model callbacks to every LlmAgent of the tree.
+
+    Also starts the metrics HTTP endpoint if STORY_METRICS_PORT is set.
+
+    Args:
+      agent: The root of the agent tree.
+
+    Returns: The same agent.
+    """
+    if isinstance(agent, LlmAgent):
+        # The timer starts last, so calls answered locally by an earlier callback are not
+        # counted; the end callback runs first and sees the response the model returned.
+        agent.before_model_callback = _add_callback(agent.before_model_callback, record_model_start, first=False)
+        agent.after_model_callback = _add_callback(agent.after_model_callback, record_model_end, first=True)
+    for sub_agent in agent.sub_agents:
+        instrument_agent_tree(sub_agent)
+    if agent.parent_agent is None and os.environ.get("STORY_METRICS_PORT"):
+        start_metrics_server(int(os.environ["STORY_METRICS_PORT"]))
+    return agent
+
+
+class MeteredLoopAgent(LoopAgent):
+    """
+    A LoopAgent that records its iterations, duration, exit reason and errors.
+
+    The exit reason is the name of the tool that escalated (e.g. "exit_sequence"),
+    "escalate" for any other escalation, or "max_iterations".
+    """
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        started = time.perf_counter()
+        times_looped = 0
+        exit_reason = "max_iterations"
+        try:
+            while not self.max_iterations or times_looped < self.max_iterations:
+                times_looped += 1
+                for sub_agent in self.sub_agents:
+                    async for event in sub_agent.run_async(ctx):
+                        yield event
+                        if event.actions.escalate:
+                            responses = event.get_function_responses()
+                            exit_reason = responses[0].name if responses else "escalate"
+                            return
+        except Exception as e:
+            exit_reason = "error"
+            AGENT_ERRORS.inc(agent=self.name, error=type(e).__name__)
+            raise
+        finally:
+            observe_loop(self.name, times_looped, exit_reason, time.perf_counter() - started)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serves the metrics for Prometheus scraping from a daemon thread (once per process)."""
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="story-metrics", daemon=True).start()
+        logger.info(f"[Metrics] Serving Prometheus metrics on {host}:{port}")
+    return _server
@@ -0,0 +1,226 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Any, AsyncGenerator, Callable, Optional, Union
+from typing_extensions import override
+from collections import deque
+import asyncio, logging, random
+
+from .llm_cache import agent_name_of
+from .streaming import stream_requested
+
+logger = logging.getLogger(__name__)
+
+
+class MockLlmError(RuntimeError):
+    """Raised by MockLlm for an injected failure. Looks like a provider's 503, so it counts as transient."""
+
+    status_code = 503
+
+
+class FunctionCallStep(BaseModel):
+    """A scripted function call, e.g. transfer_to_agent. String args are templates."""
+
+    name: str
+    args: dict[str, Any] = Field(default_factory=dict)
+
+
+# A step is a text template, a function call, or a callable computing the response text
+ScriptStep = Union[str, FunctionCallStep, Callable[[LlmRequest], str]]
+
+# Responses that drive all three story writer pipelines to completion:
+# the critic asks for one round of changes, then approves.
+DEFAULT_SCRIPT: dict[str, list[ScriptStep]] = {
+    # The assistant proposes the topic, then hands over to the pipeline once the user confirms it
+    "StoryWritingAssistant": [
+        "STORY: [topic: {user}, theme: drama]",
+        FunctionCallStep(name="transfer_to_agent", args={"agent_name": "StoryWritingPipeline"}),
+    ],
+    "TopicCollectorAgent": ["STORY: [topic: {user}, theme: drama]"],
+    "InitialWriterAgent": [
+        "The lighthouse keeper found a map folded inside the lamp. It showed the harbor, but the harbor had never looked like that. "
+        "That night the tide went out and did not come back. (draft {call})"
+    ],
+    "CriticAgent": [
+        '{{"done": false, "issues": ["Needs a stronger opening sentence"]}}',
+        '{{"done": true, "issues": []}}',
+    ],
+    "DraftSelectorAgent": ["1"],
+    "CoherenceCriticAgent": [
+        '{{"done": false, "issues": ["Explain why the tide does not come back"]}}',
+        '{{"done": true, "issues": []}}',
+    ],
+    "ClarityCriticAgent": [
+        '{{"done": false, "issues": ["Clarify what the keeper wants", "Say where the map was found"]}}',
+        '{{"done": true, "issues": []}}',
+    ],
+    "EngagementCriticAgent": [
+        '{{"done": false, "issues": ["Needs a stronger opening sentence"]}}',
+        '{{"done": true, "issues": []}}',
+    ],
+    "OutlinerAgent": [
+        '[{{"title": "The Map", "summary": "The keeper finds a map inside the lamp."}}, '
+        '{{"title": "The Tide", "summary": "The tide goes out and does not come back."}}, '
+        '{{"title": "The Harbor", "summary": "The keeper walks the dry harbor floor to the place on the map."}}]'
+    ],
+    "SeededWriterAgent": [
+        "The lighthouse keeper found a map folded inside the lamp, the same map as before, but now the harbor on it was burning. (seeded draft {call})"
+    ],
+    "ChapterWriterAgent": ["The keeper kept walking, and the harbor kept changing. (chapter draft {call})"],
+    "ContinuityEditorAgent": ['[{{"chapter": 2, "issue": "The map is lost in chapter 2 but used again in chapter 3."}}]'],
+    "ContinuityRefinerAgent": ["The keeper folded the map into a pocket, and the harbor kept changing. (continuity revision {call})"],
+    "PatchRefinerAgent": [
+        '[{{"op": "replace", "index": 1, "text": "Nobody had lit the lamp in forty years, yet the lighthouse keeper found a map folded inside it."}}]'
+    ],
+    "RefinerAgent": [
+        "Nobody had lit the lamp in forty years, yet the lighthouse keeper found a map folded inside it. It showed the harbor, "
+        "but not as it had ever looked. That night the tide went out and did not come back. (revision {call})"
+    ],
+}
+DEFAULT_STEP = "Mock response from {agent}."
+
+
+class _SafeFormat(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    for content in reversed(llm_request.contents):
+        if content.role == "user" and content.parts and content.parts[0].text:
+            return content.parts[0].text
+    return ""
+
+
+def _prompt_words(llm_request: LlmRequest) -> list[str]:
+    words = str(llm_request.config.system_instruction or "").split() if llm_request.config else []
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            words += (part.text or "").split()
+    return words
+
+
+def _common_prefix(a: list[str], b: list[str]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+class MockLlm(BaseLlm):
+    """
+    A local stand-in for LLM_MODEL that serves scripted responses.
+
+    Each agent cycles through its script steps. Latency is drawn from a log-normal
+    distribution around ``latency_ms`` (``latency_sigma`` = 0 makes it constant), and
+    ``error_rate`` of the calls raise MockLlmError after the delay. Prompt tokens are
+    counted as words; like a provider's prefix cache, the words a prompt shares with
+    the start of a recent prompt are reported as cached, in blocks of
+    ``prefix_cache_block`` words (0 disables it).
+    """
+
+    model: str = "mock/story-writer"
+    script: dict[str, list[Any]] = Field(default_factory=lambda: dict(DEFAULT_SCRIPT))
+    default_step: Any = DEFAULT_STEP
+    latency_ms: float = 0.0
+    latency_sigma: float = 0.0
+    agent_latency_ms: dict[str, float] = Field(default_factory=dict)
+    error_rate: float = 0.0
+    seed: Optional[int] = None
+    prefix_cache_block: int = 16
+
+    _calls: dict[str, int] = PrivateAttr(default_factory=dict)
+    _recent_prompts: deque = PrivateAttr(default_factory=lambda: deque(maxlen=64))
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any):
+        self._rng = random.Random(self.seed)
+
+    @property
+    def calls(self) -> dict[str, int]:
+        """The number of calls served so far, per agent."""
+        return dict(self._calls)
+
+    def sample_latency(self, agent: str) -> float:
+        """Draws the simulated latency of one call in seconds."""
+        median = self.agent_latency_ms.get(agent, self.latency_ms) / 1000
+        if median <= 0:
+            return 0.0
+        if self.latency_sigma <= 0:
+            return median
+        return median * self._rng.lognormvariate(0.0, self.latency_sigma)
+
+    def _next_step(self, agent: str) -> tuple[Any, int]:
+        call = self._calls.get(agent, 0)
+        self._calls[agent] = call + 1
+        # Cloned agents (e.g. InitialWriterAgent2 of a multi-draft writer) share the script of the original
+        steps = self.script.get(agent) or self.script.get(agent.rstrip("0123456789")) or [self.default_step]
+        return steps[call % len(steps)], call + 1
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        agent = agent_name_of(llm_request)
+        step, call = self._next_step(agent)
+        await asyncio.sleep(self.sample_latency(agent))
+        if self.error_rate > 0 and self._rng.random() < self.error_rate:
+            raise MockLlmError(f"Injected failure for {agent} (call {call})")
+
+        values = _SafeFormat(agent=agent, call=call, user=_last_user_text(llm_request))
+        if isinstance(step, FunctionCallStep):
+            args = {k: v.format_map(values) if isinstance(v, str) else v for k, v in step.args.items()}
+            part = types.Part(function_call=types.FunctionCall(name=step.name, args=args))
+            text = ""
+        else:
+            text = step(llm_request) if callable(step) else step.format_map(values)
+            part = types.Part(text=text)
+
+        if stream_requested(llm_request, stream) and text:
+            # Emit word chunks first, then the aggregated response, like LiteLlm does
+            words = text.split(" ")
+            for i, word in enumerate(words):
+                chunk = word if i == len(words) - 1 else word + " "
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+                await asyncio.sleep(0)
+
+        prompt = _prompt_words(llm_request)
+        prompt_tokens = len(prompt)
+        cached_tokens = None
+        if self.prefix_cache_block > 0:
+            shared = max((_common_prefix(prompt, recent) for recent in self._recent_prompts), default=0)
+            cached_tokens = shared - shared % self.prefix_cache_block
+            self._recent_prompts.append(prompt)
+        completion_tokens = len(text.split()) if text else 1
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                cached_content_token_count=cached_tokens,
+                candidates_token_count=completion_tokens,
+                total_token_count=prompt_tokens + completion_tokens,
+            ),
+        )
+
+
+def install_model(agent: BaseAgent, model: BaseLlm) -> int:
+    """Points every LlmAgent in the agent tree at the given model.
+
+    Args:
+      agent: The root of the agent tree.
+      model: The model to use, e.g. a MockLlm.
+
+    Returns: The number of LlmAgents changed.
+    """
+    changed = 0
+    if isinstance(agent, LlmAgent):
+        agent.model = model
+        changed += 1
+    for sub_agent in agent.sub_agents:
+        changed += install_model(sub_agent, model)
+    return changed
@@ -0,0 +1,111 @@
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+from contextvars import ContextVar
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import asyncio, importlib, logging, threading
+
+from .llm_cache import CachedLlm
+from .ratelimit import RateLimitedLlm, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_MODEL = "deepseek/deepseek-chat"
+# Importing this module imports litellm, which takes seconds
+LITE_LLM_MODULE = "google.adk.models.lite_llm"
+
+# Prompt tokens the provider served from its prefix cache in the current call; LiteLlm drops them
+_cached_prompt_tokens: ContextVar[Optional[int]] = ContextVar("cached_prompt_tokens", default=None)
+
+
+def _field(value, name: str):
+    return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+
+
+def cached_prompt_tokens(usage) -> Optional[int]:
+    """Returns the cached prompt tokens of a litellm usage block, or None if the provider does not report them.
+
+    Reads the OpenAI style ``prompt_tokens_details.cached_tokens``, DeepSeek's
+    ``prompt_cache_hit_tokens`` and Anthropic's ``cache_read_input_tokens``.
+    """
+    if not usage:
+        return None
+    details = _field(usage, "prompt_tokens_details")
+    for value in (_field(details, "cached_tokens") if details else None, _field(usage, "prompt_cache_hit_tokens"), _field(usage, "cache_read_input_tokens")):
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _usage_recording_client(module):
+    """Returns a LiteLLMClient that remembers the cached prompt tokens of each response."""
+
+    class UsageRecordingClient(module.LiteLLMClient):
+        async def acompletion(self, model, messages, tools, **kwargs):
+            response = await super().acompletion(model, messages, tools, **kwargs)
+            _cached_prompt_tokens.set(cached_prompt_tokens(_field(response, "usage")))
+            return response
+
+        def completion(self, model, messages, tools, stream=False, **kwargs):
+            for part in super().completion(model, messages, tools, stream=stream, **kwargs):
+                if _field(part, "usage"):
+                    _cached_prompt_tokens.set(cached_prompt_tokens(_field(part, "usage")))
+                yield part
+
+    return UsageRecordingClient()
+
+
+class LazyLlm(BaseLlm):
+    """
+    A LiteLlm that is only created, and litellm only imported, on the first request.
+
+    Building the agent graph therefore costs no litellm import, and processes that
+    never call the real model (mock, cache or replay runs) never pay for it. The
+    import runs in a worker thread so it does not stall other sessions.
+    """
+
+    _client: Optional[BaseLlm] = PrivateAttr(default=None)
+
+    async def client(self) -> BaseLlm:
+        """Returns the LiteLlm client, creating it on the first call."""
+        if self._client is None:
+            module = await asyncio.to_thread(importlib.import_module, LITE_LLM_MODULE)
+            if self._client is None:
+                logger.info(f"[Models] Created LiteLlm client for {self.model}")
+                self._client = module.LiteLlm(model=self.model, llm_client=_usage_recording_client(module))
+        return self._client
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        client = await self.client()
+        _cached_prompt_tokens.set(None)
+        async for response in client.generate_content_async(llm_request, stream=stream):
+            cached = _cached_prompt_tokens.get()
+            if response.usage_metadata and cached is not None:
+                response.usage_metadata.cached_content_token_count = cached
+            yield response
+
+
+_models: dict[str, CachedLlm] = {}
+_models_lock = threading.Lock()
+
+
+def get_model(model: str = DEFAULT_MODEL) -> CachedLlm:
+    """Returns the process-wide cached, lazily created model for a LiteLLM model name.
+
+    All three packages share the same instance per name, so their agents share one
+    client, one response cache and, if limits are configured, one rate limiter. Cache
+    hits do not count against the limits.
+    """
+    with _models_lock:
+        if model not in _models:
+            llm = LazyLlm(model=model)
+            if get_scheduler(model).enabled:
+                llm = RateLimitedLlm(llm)
+            _models[model] = CachedLlm(llm)
+        return _models[model]
@@ -0,0 +1,279 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.models.base_llm import BaseLlm
+from pydantic import BaseModel, ValidationError
+from typing import AsyncGenerator, Literal, Optional, Union
+from typing_extensions import override
+import json, logging, re
+
+from .streaming import no_stream
+
+logger = logging.getLogger(__name__)
+
+# --- State Keys ---
+STATE_NUMBERED_DOC = "numbered_document"
+STATE_REFINER_PATCH = "refiner_patch"
+STATE_APPLIED_EDITS = "applied_edits"
+# --- Refinement Modes ---
+REFINE_REWRITE = "rewrite"
+REFINE_PATCH = "patch"
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE = re.compile(r"(?<=[.!?][\"')\]])\s+|(?<=[.!?])\s+")
+_JSON_VALUE = re.compile(r"[\[{].*[\]}]", re.DOTALL)
+
+
+class PatchError(ValueError):
+    """Raised when a refiner patch cannot be parsed or applied."""
+
+
+class SentenceEdit(BaseModel):
+    """One sentence-level edit. Indexes are 1-based and refer to the unedited story.
+
+    "replace" and "delete" act on sentence ``index``; "insert" adds ``text`` after
+    sentence ``index`` (0 inserts before the first sentence).
+    """
+
+    op: Literal["replace", "insert", "delete"]
+    index: int
+    text: str = ""
+
+
+def split_sentences(document: str) -> list[list[str]]:
+    """Splits a story into paragraphs of sentences."""
+    paragraphs = []
+    for paragraph in _PARAGRAPH_BREAK.split((document or "").strip()):
+        sentences = [s.strip() for s in _SENTENCE.split(paragraph.strip()) if s and s.strip()]
+        if sentences:
+            paragraphs.append(sentences)
+    return paragraphs
+
+
+def join_sentences(paragraphs: list[list[str]]) -> str:
+    """Joins paragraphs of sentences back into a story."""
+    return "\n\n".join(" ".join(sentences) for sentences in paragraphs if sentences)
+
+
+def number_sentences(document: str) -> str:
+    """Renders the story with one "[n] sentence" line per sentence, for the patch refiner."""
+    lines, index = [], 0
+    for paragraph in split_sentences(document):
+        if lines:
+            lines.append("")
+        for sentence in paragraph:
+            index += 1
+            lines.append(f"[{index}] {sentence}")
+    return "\n".join(lines)
+
+
+def parse_patch(text: str) -> list[SentenceEdit]:
+    """Parses the refiner output into edits.
+
+    Accepts a JSON array of edits or an object with an "edits" array, optionally
+    inside code fences.
+
+    Raises:
+      PatchError: If the output contains no valid edit list.
+    """
+    match = _JSON_VALUE.search(text or "")
+    if not match:
+        raise PatchError("no JSON in the refiner output")
+    try:
+        data = json.loads(match.group())
+        if isinstance(data, dict):
+            data = data.get("edits")
+        if not isinstance(data, list):
+            raise PatchError("the refiner output is not a list of edits")
+        return [SentenceEdit.model_validate(item) for item in data]
+    except (json.JSONDecodeError, ValidationError) as e:
+        raise PatchError(f"invalid patch: {e}") from e
+
+
+def apply_patch(document: str, edits: list[SentenceEdit]) -> str:
+    """Applies sentence-level edits to the story.
+
+    All indexes refer to the story before any edit, so the edits can be listed in
+    any order. Inserted sentences stay in the paragraph of the sentence they follow.
+
+    Raises:
+      PatchError: If an index is out of range, a sentence is edited twice, or an
+        edit that needs text has none.
+    """
+    paragraphs = split_sentences(document)
+    positions = [(p, s) for p, sentences in enumerate(paragraphs) for s in range(len(sentences))]
+    count = len(positions)
+    replaced: dict[int, Optional[str]] = {}
+    inserted: dict[int, list[str]] = {}
+    for edit in edits:
+        text = edit.text.strip()
+        if edit.op == "insert":
+            if not 0 <= edit.index <= count:
+                raise PatchError(f"insert position {edit.index} is outside 0..{count}")
+            if not text:
+                raise PatchError(f"insert after sentence {edit.index} has no text")
+            inserted.setdefault(edit.index, []).append(text)
+            continue
+        if not 1 <= edit.index <= count:
+            raise PatchError(f"{edit.op} of sentence {edit.index} is outside 1..{count}")
+        if edit.index in replaced:
+            raise PatchError(f"sentence {edit.index} is edited more than once")
+        if edit.op == "replace" and not text:
+            raise PatchError(f"replacement of sentence {edit.index} has no text")
+        replaced[edit.index] = text if edit.op == "replace" else None
+
+    result: list[list[str]] = [[] for _ in paragraphs] or [[]]
+    result[0].extend(inserted.get(0, []))
+    for index, (p, s) in enumerate(positions, start=1):
+        sentence = replaced.get(index, paragraphs[p][s])
+        if sentence is not None:
+            result[p].append(sentence)
+        result[p].extend(inserted.get(index, []))
+    return join_sentences(result)
+
+
+def build_patch_refiner(
+    model: Union[str, BaseLlm],
+    topic_key: str = "current_topic",
+    criticism_key: str = "criticism",
+) -> LlmAgent:
+    """Creates the refiner that answers with sentence edits instead of the whole story."""
+    return LlmAgent(
+        name="PatchRefinerAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a Creative Writing Assistant refining a story based on critique.
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+    **Current Story (one numbered sentence per line):**
+    ```
+    {{{STATE_NUMBERED_DOC}}}
+    ```
+
+    **Critique/Suggestions:**
+    ```
+    {{{criticism_key}}}
+    ```
+    **Task:**
+    Apply the suggestions with as few sentence-level edits as possible. Respond with *only* a JSON array of edits:
+    {{"op": "replace", "index": <n>, "text": "<new sentence>"}} replaces sentence n,
+    {{"op": "insert", "index": <n>, "text": "<new sentence>"}} inserts a sentence after sentence n (0 for the beginning),
+    {{"op": "delete", "index": <n>}} deletes sentence n.
+    Sentence numbers always refer to the story above, before any edit. Do not add explanations.
+""",
+        description="Refines the story based on critique by editing single sentences.",
+        output_key=STATE_REFINER_PATCH,
+        before_model_callback=no_stream,
+    )
+
+
+class PatchRefinerAgent(BaseAgent):
+    """
+    Refines the story with sentence-level edits applied locally.
+
+    The patch agent sees the story as numbered sentences and answers with a short
+    list of replace/insert/delete edits, so a small fix costs a few output tokens
+    instead of the whole story. If the patch cannot be parsed or applied, the
+    full-rewrite refiner runs instead.
+    """
+
+    patch_agent: LlmAgent
+    rewrite_agent: BaseAgent
+    document_key: str = "current_document"
+    state_prefix: str = ""
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        patch_agent: LlmAgent,
+        rewrite_agent: BaseAgent,
+        document_key: str = "current_document",
+        state_prefix: str = "",
+    ):
+        """
+        Initializes the PatchRefinerAgent.
+
+        Args:
+            name: The name of the agent.
+            patch_agent: Writes a JSON list of edits to state["refiner_patch"].
+            rewrite_agent: The full-rewrite refiner used as fallback.
+            document_key: The state key of the story to edit.
+            state_prefix: Prefix of the numbered story, patch and applied edits keys, so
+              several patch refiners (e.g. one per chapter) can run concurrently.
+        """
+        super().__init__(
+            name=name,
+            description=rewrite_agent.description,
+            patch_agent=patch_agent,
+            rewrite_agent=rewrite_agent,
+            document_key=document_key,
+            state_prefix=state_prefix,
+            sub_agents=[patch_agent, rewrite_agent],
+        )
+
+    def state_key(self, key: str) -> str:
+        """Returns the state key this refiner uses for STATE_NUMBERED_DOC, STATE_REFINER_PATCH or STATE_APPLIED_EDITS."""
+        return f"{self.state_prefix}{key}"
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        document = ctx.session.state.get(self.document_key, "")
+        yield self._state_event(ctx, {self.state_key(STATE_NUMBERED_DOC): number_sentences(document)})
+        async for event in self.patch_agent.run_async(ctx):
+            yield event
+
+        try:
+            edits = parse_patch(ctx.session.state.get(self.state_key(STATE_REFINER_PATCH), ""))
+            refined = apply_patch(document, edits)
+        except PatchError as e:
+            logger.warning(f"[{self.name}] Patch rejected ({e}). Falling back to a full rewrite.")
+        else:
+            if refined.strip():
+                logger.info(f"[{self.name}] Applied {len(edits)} sentence edit(s).")
+                yield self._state_event(ctx, {
+                    self.document_key: refined,
+                    self.state_key(STATE_APPLIED_EDITS): [edit.model_dump() for edit in edits],
+                })
+                return
+            logger.warning(f"[{self.name}] Patch deletes the whole story. Falling back to a full rewrite.")
+
+        async for event in self.rewrite_agent.run_async(ctx):
+            yield event
+
+
+def with_patch_refiner(
+    refiner_agent: LlmAgent,
+    mode: str = REFINE_REWRITE,
+    topic_key: str = "current_topic",
+    criticism_key: str = "criticism",
+) -> BaseAgent:
+    """Returns the refiner itself in "rewrite" mode, or a PatchRefinerAgent around it in "patch" mode.
+
+    Args:
+      refiner_agent: The full-rewrite refiner. Its output_key is the story to edit.
+      mode: "rewrite" or "patch".
+      topic_key: The state key of the topic and theme.
+      criticism_key: The state key of the critique to apply.
+    """
+    if mode != REFINE_PATCH:
+        return refiner_agent
+    return PatchRefinerAgent(
+        name="PatchRefiner",
+        patch_agent=build_patch_refiner(refiner_agent.model, topic_key, criticism_key),
+        rewrite_agent=refiner_agent,
+        document_key=refiner_agent.output_key,
+    )
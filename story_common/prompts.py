@@ -0,0 +1,101 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from pydantic import BaseModel
+from functools import lru_cache
+import logging, os, re
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Instruction layouts: "prefix" moves the state placeholders to the end, "original" keeps the templates as written
+LAYOUT_PREFIX = "prefix"
+LAYOUT_ORIGINAL = "original"
+
+# The placeholders ADK fills from state: {key}, {key?}, {app:key}, {artifact.name}
+_PLACEHOLDER = re.compile(r"\{+([^{}]*)\}+")
+_STATE_NAME = re.compile(r"^(?:(?:app|user|temp):)?[A-Za-z_][A-Za-z0-9_]*\??$|^artifact\.[^{}\s]+\??$")
+# A labelled value: "**Story to Review:**" or "Topic:" followed, on the same or the next line,
+# by a code fence holding nothing but one placeholder
+_BLOCK = re.compile(
+    r"^[ \t]*(?P<label>[^\n`{}]*?:\**)[ \t]*(?:\n[ \t]*)?"
+    r"```[ \t]*\n?[ \t]*\{(?P<name>[^{}\n]+)\}[ \t]*\n?[ \t]*```[ \t]*\n?",
+    re.MULTILINE,
+)
+_BLANK_LINES = re.compile(r"\n[ \t]*\n(?:[ \t]*\n)+")
+
+
+def is_state_placeholder(name: str) -> bool:
+    """Returns whether ``{name}`` is replaced by ADK (a state key or artifact), not literal text like a JSON example."""
+    return bool(_STATE_NAME.match(name.strip()))
+
+
+class CompiledInstruction(BaseModel):
+    """An instruction split into the static text and the state-dependent values after it."""
+
+    prefix: str
+    suffix: str
+    variables: list[str]
+
+    @property
+    def text(self) -> str:
+        return f"{self.prefix}\n\n{self.suffix}" if self.suffix else self.prefix
+
+
+@lru_cache(maxsize=None)
+def compile_instruction(template: str) -> CompiledInstruction:
+    """Reorders an instruction template so all state placeholders come after the static text.
+
+    Providers cache prompts by prefix, and ADK renders the placeholders into the system
+    instruction, so a placeholder in the middle makes everything after it uncacheable.
+    Labelled values ("**Current Story:**" and a fenced placeholder) are moved to the end
+    as they are. A placeholder inside a sentence is replaced by ``<name>`` and its value
+    is appended as a value labelled "<name>:". The instruction text is otherwise unchanged,
+    so the static prefix is the same on every call of the agent, across loop iterations
+    and sessions.
+    """
+    blocks: dict[str, str] = {}
+
+    def move_block(match: re.Match) -> str:
+        name = match.group("name").strip()
+        if not is_state_placeholder(name):
+            return match.group()
+        label = match.group("label").strip()
+        blocks.setdefault(name, f"{label}\n```\n{{{name}}}\n```")
+        return ""
+
+    def move_inline(match: re.Match) -> str:
+        name = match.group(1).strip()
+        if not is_state_placeholder(name):
+            return match.group()
+        blocks.setdefault(name, f"<{name.rstrip('?')}>:\n```\n{{{name}}}\n```")
+        return f"<{name.rstrip('?')}>"
+
+    prefix = _BLOCK.sub(move_block, template)
+    prefix = _PLACEHOLDER.sub(move_inline, prefix)
+    prefix = _BLANK_LINES.sub("\n\n", prefix).rstrip()
+    return CompiledInstruction(prefix=prefix, suffix="\n\n".join(blocks.values()), variables=list(blocks))
+
+
+def prompt_layout() -> str:
+    """Returns the instruction layout set by STORY_PROMPT_LAYOUT: "prefix" (default) or "original"."""
+    return os.environ.get("STORY_PROMPT_LAYOUT", LAYOUT_PREFIX).lower()
+
+
+def compile_agent_tree(agent: BaseAgent) -> BaseAgent:
+    """Compiles the instruction of every LlmAgent of the tree for prefix caching, once, at build time.
+
+    Instructions given as callables are left alone. Does nothing with STORY_PROMPT_LAYOUT=original.
+
+    Args:
+      agent: The root of the agent tree.
+
+    Returns: The same agent.
+    """
+    if prompt_layout() == LAYOUT_ORIGINAL:
+        return agent
+    if isinstance(agent, LlmAgent) and isinstance(agent.instruction, str) and agent.instruction:
+        compiled = compile_instruction(agent.instruction)
+        agent.instruction = compiled.text
+        logger.debug(f"[Prompts] {agent.name}: {len(compiled.prefix)} static chars, then {compiled.variables}")
+    for sub_agent in agent.sub_agents:
+        compile_agent_tree(sub_agent)
+    return agent
@@ -0,0 +1,314 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import BaseModel, PrivateAttr
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import asyncio, itertools, json, logging, os, threading, time
+
+from .metrics import Gauge, Histogram, register
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+# Lower ranks are served first
+PRIORITY_RANKS = {PRIORITY_INTERACTIVE: 0, PRIORITY_BATCH: 1}
+# Request labels carrying the session's priority and tenant to the model
+PRIORITY_LABEL = "story_priority"
+TENANT_LABEL = "story_tenant"
+# Tenant of the sessions that do not set state["tenant_id"]
+DEFAULT_TENANT = "default"
+# Completion tokens assumed for a request without max_output_tokens, until its usage is known
+DEFAULT_OUTPUT_TOKENS = 512
+# Seconds of the sustained rate a bucket may spend at once
+DEFAULT_BURST_SECONDS = 5.0
+# --- State Keys ---
+STATE_PRIORITY = "request_priority"
+STATE_TENANT = "tenant_id"
+
+RATE_LIMIT_WAIT_SECONDS = register(Histogram("story_rate_limit_wait_seconds", "Time LLM calls waited for the rate limiter, per model and priority."))
+RATE_LIMIT_QUEUE_DEPTH = register(Gauge("story_rate_limit_queue_depth", "LLM calls waiting for the rate limiter, per model."))
+
+
+def estimate_tokens(llm_request: LlmRequest) -> int:
+    """Estimates the tokens a request will be billed for (4 characters per token, plus the output allowance)."""
+    characters = len(str(llm_request.config.system_instruction or "")) if llm_request.config else 0
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            characters += len(part.text or "")
+    max_output = (llm_request.config.max_output_tokens if llm_request.config else None) or DEFAULT_OUTPUT_TOKENS
+    return characters // 4 + max_output
+
+
+class TokenBucket:
+    """A token bucket refilled at ``rate_per_minute`` that holds at most ``capacity``.
+
+    The level may go negative when actual usage turns out higher than estimated; the
+    debt is paid back by the refill before anything else is granted.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.level = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Returns the seconds until ``amount`` can be taken (requests above the capacity wait for a full bucket)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class RateLimits(BaseModel):
+    """The provider limits of one model. None means unlimited."""
+
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    burst_seconds: float = DEFAULT_BURST_SECONDS
+
+
+def load_rate_limits(model: str) -> RateLimits:
+    """Reads the limits of a model from the environment.
+
+    STORY_RATE_LIMIT_RPM and STORY_RATE_LIMIT_TPM apply to every model;
+    STORY_RATE_LIMITS='{"<model>": {"rpm": ..., "tpm": ...}}' overrides them per model.
+    """
+    values = {}
+    if os.environ.get("STORY_RATE_LIMIT_RPM"):
+        values["rpm"] = float(os.environ["STORY_RATE_LIMIT_RPM"])
+    if os.environ.get("STORY_RATE_LIMIT_TPM"):
+        values["tpm"] = float(os.environ["STORY_RATE_LIMIT_TPM"])
+    if os.environ.get("STORY_RATE_LIMIT_BURST_SECONDS"):
+        values["burst_seconds"] = float(os.environ["STORY_RATE_LIMIT_BURST_SECONDS"])
+    if os.environ.get("STORY_RATE_LIMITS"):
+        values.update(json.loads(os.environ["STORY_RATE_LIMITS"]).get(model, {}))
+    return RateLimits(**values)
+
+
+class _Waiter:
+    __slots__ = ("rank", "priority", "tenant", "tokens", "seq", "future", "enqueued")
+
+    def __init__(self, priority: str, tenant: str, tokens: int, seq: int, future: asyncio.Future):
+        self.rank = PRIORITY_RANKS.get(priority, len(PRIORITY_RANKS))
+        self.priority = priority
+        self.tenant = tenant
+        self.tokens = tokens
+        self.seq = seq
+        self.future = future
+        self.enqueued = time.monotonic()
+
+
+class RateLimitScheduler:
+    """
+    Admits LLM calls to one model within its requests- and tokens-per-minute limits.
+
+    Calls that do not fit wait in a queue. The queue is served by priority first
+    (interactive before batch), then fairly across tenants: the tenant that has been
+    granted the fewest tokens goes next, with tenants joining at the current share so
+    a newcomer cannot starve the others. Admitting calls below the limit instead of
+    bursting into 429s keeps every session moving.
+    """
+
+    def __init__(self, name: str, limits: RateLimits):
+        self.name = name
+        self.limits = limits
+        self.requests = TokenBucket(limits.rpm, max(1.0, limits.rpm / 60 * limits.burst_seconds)) if limits.rpm else None
+        self.tokens = TokenBucket(limits.tpm, max(1.0, limits.tpm / 60 * limits.burst_seconds)) if limits.tpm else None
+        self._waiters: list[_Waiter] = []
+        self._served: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _wait_time(self, tokens: int) -> float:
+        wait = self.requests.wait_time(1) if self.requests else 0.0
+        return max(wait, self.tokens.wait_time(tokens)) if self.tokens else wait
+
+    def _grant(self, tenant: str, tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens:
+            self.tokens.take(tokens)
+        self._served[tenant] = max(self._served.get(tenant, 0.0), self._virtual_time) + tokens
+        # Tenants that join later start from the share of the least served waiting tenant
+        waiting = [self._served.get(waiter.tenant, self._virtual_time) for waiter in self._waiters]
+        self._virtual_time = min(waiting) if waiting else self._served[tenant]
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # A new event loop (e.g. another asyncio.run): waiters of the old one are gone
+            self._loop, self._waiters, self._dispatcher = loop, [], None
+            self._wakeup = asyncio.Event()
+
+    def _next_waiter(self) -> _Waiter:
+        for waiter in self._waiters:
+            self._served.setdefault(waiter.tenant, self._virtual_time)
+        return min(self._waiters, key=lambda waiter: (waiter.rank, self._served[waiter.tenant], waiter.seq))
+
+    async def _dispatch(self):
+        while self._waiters:
+            self._waiters = [waiter for waiter in self._waiters if not waiter.future.done()]
+            if not self._waiters:
+                break
+            waiter = self._next_waiter()
+            wait = self._wait_time(waiter.tokens)
+            if wait > 0:
+                # Wake up early if a more urgent call arrives meanwhile
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._waiters.remove(waiter)
+            self._grant(waiter.tenant, waiter.tokens)
+            waiter.future.set_result(None)
+            RATE_LIMIT_QUEUE_DEPTH.set(len(self._waiters), model=self.name)
+        self._dispatcher = None
+
+    async def acquire(self, tokens: int, priority: str = PRIORITY_INTERACTIVE, tenant: str = "") -> float:
+        """Waits until the call may be sent and reserves its request and tokens.
+
+        Returns: The seconds the call waited.
+        """
+        if not self.enabled:
+            return 0.0
+        self._bind_loop()
+        started = time.monotonic()
+        if not self._waiters and self._wait_time(tokens) <= 0:
+            self._grant(tenant, tokens)
+        else:
+            waiter = _Waiter(priority, tenant, tokens, next(self._seq), self._loop.create_future())
+            self._waiters.append(waiter)
+            RATE_LIMIT_QUEUE_DEPTH.set(len(self._waiters), model=self.name)
+            self._wakeup.set()
+            if self._dispatcher is None:
+                self._dispatcher = asyncio.ensure_future(self._dispatch())
+            try:
+                await waiter.future
+            finally:
+                if not waiter.future.done() or waiter.future.cancelled():
+                    self._waiters = [other for other in self._waiters if other is not waiter]
+                    RATE_LIMIT_QUEUE_DEPTH.set(len(self._waiters), model=self.name)
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT_SECONDS.observe(waited, model=self.name, priority=priority)
+        return waited
+
+    def settle(self, estimated: int, actual: int):
+        """Corrects the token bucket once the actual usage of a call is known."""
+        if self.tokens and actual:
+            self.tokens.take(actual - estimated)
+
+
+class RateLimitedLlm(BaseLlm):
+    """
+    A BaseLlm that sends requests to the wrapped model only when its scheduler admits them.
+
+    The priority and tenant are read from the request labels set by label_request().
+    """
+
+    inner: BaseLlm
+    _scheduler: RateLimitScheduler = PrivateAttr(default=None)
+
+    def __init__(self, inner: BaseLlm, scheduler: Optional[RateLimitScheduler] = None, **kwargs):
+        """
+        Wraps a model with a rate limiter.
+
+        Args:
+            inner: The model to call.
+            scheduler: The scheduler to share. Defaults to the process-wide scheduler of
+              the model's name, with the limits from load_rate_limits().
+        """
+        super().__init__(model=kwargs.pop("model", inner.model), inner=inner, **kwargs)
+        self._scheduler = scheduler or get_scheduler(inner.model)
+
+    @property
+    def scheduler(self) -> RateLimitScheduler:
+        return self._scheduler
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        labels = (llm_request.config.labels if llm_request.config else None) or {}
+        estimated = estimate_tokens(llm_request)
+        await self._scheduler.acquire(
+            estimated,
+            priority=labels.get(PRIORITY_LABEL, PRIORITY_INTERACTIVE),
+            tenant=labels.get(TENANT_LABEL, ""),
+        )
+        actual = 0
+        async for response in self.inner.generate_content_async(llm_request, stream=stream):
+            if response.usage_metadata and not response.partial:
+                actual = response.usage_metadata.total_token_count or 0
+            yield response
+        self._scheduler.settle(estimated, actual)
+
+
+_schedulers: dict[str, RateLimitScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(model: str) -> RateLimitScheduler:
+    """Returns the process-wide scheduler of a model, shared by every session and package."""
+    with _schedulers_lock:
+        if model not in _schedulers:
+            _schedulers[model] = RateLimitScheduler(model, load_rate_limits(model))
+        return _schedulers[model]
+
+
+# --- Model Callbacks ---
+def label_request(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback that labels the request with the session's priority and tenant.
+
+    The priority is state["request_priority"] ("interactive" by default, "batch" for
+    batch jobs) and the tenant is state["tenant_id"]. Sessions without a tenant share
+    DEFAULT_TENANT; set the tenant when the session is created to share the rate
+    fairly between users.
+    """
+    state = callback_context.state
+    llm_request.config = llm_request.config or types.GenerateContentConfig()
+    llm_request.config.labels = llm_request.config.labels or {}
+    llm_request.config.labels[PRIORITY_LABEL] = state.get(STATE_PRIORITY) or PRIORITY_INTERACTIVE
+    llm_request.config.labels[TENANT_LABEL] = state.get(STATE_TENANT) or DEFAULT_TENANT
+    return None
+
+
+def label_agent_tree(agent: BaseAgent) -> BaseAgent:
+    """Adds label_request to the model callbacks of every LlmAgent of the tree."""
+    if isinstance(agent, LlmAgent):
+        callbacks = agent.before_model_callback
+        callbacks = callbacks if isinstance(callbacks, list) else ([callbacks] if callbacks else [])
+        if label_request not in callbacks:
+            agent.before_model_callback = callbacks + [label_request]
+    for sub_agent in agent.sub_agents:
+        label_agent_tree(sub_agent)
+    return agent
@@ -0,0 +1,327 @@
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from pydantic import BaseModel, Field
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import json, logging, re, time
+
+from .metrics import AGENT_ERRORS, observe_loop
+from .similarity import fingerprint, text_similarity
+from .streaming import draft_diff, progress_event
+
+logger = logging.getLogger(__name__)
+
+# --- State Keys ---
+STATE_CRITIC_VERDICT = "critic_verdict"
+STATE_REFINEMENT_ITERATION = "refinement_iteration"
+STATE_REFINEMENT_EXIT_REASON = "refinement_exit_reason"
+# Rounds (critique plus revision) finished by the running loop, and rounds to skip after a restart
+STATE_COMPLETED_ROUNDS = "refinement_completed_rounds"
+STATE_RESUME_ROUNDS = "refinement_resume_rounds"
+# Fingerprints of the drafts seen by the running loop, the similarity of the last revision,
+# and the number of consecutive revisions at or above the convergence threshold
+STATE_DRAFT_HISTORY = "refinement_draft_history"
+STATE_DRAFT_SIMILARITY = "refinement_draft_similarity"
+STATE_SIMILAR_REVISIONS = "refinement_similar_revisions"
+# Keys of the loop's own bookkeeping, namespaced by ``state_prefix`` when several loops run concurrently
+LOOP_STATE_KEYS = frozenset({
+    STATE_CRITIC_VERDICT, STATE_REFINEMENT_ITERATION, STATE_REFINEMENT_EXIT_REASON,
+    STATE_COMPLETED_ROUNDS, STATE_RESUME_ROUNDS, STATE_DRAFT_HISTORY, STATE_DRAFT_SIMILARITY,
+    STATE_SIMILAR_REVISIONS,
+})
+# Seconds the whole request may take, counted from the user message; set per session
+STATE_LATENCY_BUDGET = "latency_budget_seconds"
+# Set by an earlier step whose document is already final (a reused story): the loop does not run
+STATE_SKIP_REFINEMENT = "refinement_skip"
+# --- Exit Reasons ---
+EXIT_CRITIC_DONE = "critic_done"
+EXIT_MAX_ITERATIONS = "max_iterations"
+EXIT_ESCALATED = "escalated"
+EXIT_CONVERGED = "converged"
+EXIT_DEADLINE = "deadline"
+EXIT_SKIPPED = "skipped"
+# --- Constants ---
+# Weight of the newest sample in the per-agent latency averages
+LATENCY_EWMA_ALPHA = 0.3
+# Consecutive similar revisions after which the drafts count as converged. A single small
+# revision is what a targeted fix looks like, so it never ends the loop on its own.
+CONVERGED_REVISIONS = 2
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+_BULLET = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+# Average wall time of a critic or refiner step per agent name, shared by all loops
+_step_seconds: dict[str, float] = {}
+
+
+class CriticVerdict(BaseModel):
+    """The structured result of one critic pass."""
+
+    done: bool = False
+    issues: list[str] = Field(default_factory=list)
+
+    def as_criticism(self) -> str:
+        """Renders the issues as the bullet list the refiner reads from state."""
+        return "\n".join(f"- {issue}" for issue in self.issues)
+
+
+def observe_step(agent: str, seconds: float):
+    """Adds the duration of a critic or refiner step to the agent's average."""
+    previous = _step_seconds.get(agent)
+    _step_seconds[agent] = seconds if previous is None else previous + LATENCY_EWMA_ALPHA * (seconds - previous)
+
+
+def expected_step_seconds(agent: str) -> float:
+    """Returns the average duration of the agent's steps, or 0.0 before the first one."""
+    return _step_seconds.get(agent, 0.0)
+
+
+def invocation_started_at(ctx: InvocationContext) -> float:
+    """Returns the time of the user message that started the invocation (now if there is none)."""
+    for event in reversed(ctx.session.events):
+        if event.invocation_id == ctx.invocation_id and event.author == "user":
+            return event.timestamp
+    return time.time()
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^a-z0-9 ]", "", text.lower()).strip()
+
+
+def parse_verdict(text: str, completion_phrase: str = "") -> CriticVerdict:
+    """Parses the critic output into a CriticVerdict.
+
+    The critic is asked for a JSON object like {"done": false, "issues": ["..."]}.
+    Models sometimes wrap it in code fences or answer in prose instead, so this also
+    accepts the completion phrase (ignoring case and punctuation) and free-form
+    critique text (one issue per non-empty line).
+
+    Args:
+      text: The raw critic output.
+      completion_phrase: The phrase that signals the story is finished.
+
+    Returns: The verdict. A verdict without issues is always done.
+    """
+    text = (text or "").strip()
+    match = _JSON_OBJECT.search(text)
+    if match:
+        try:
+            data = json.loads(match.group())
+            if isinstance(data, dict):
+                issues = [str(issue).strip() for issue in data.get("issues") or [] if str(issue).strip()]
+                return CriticVerdict(done=bool(data.get("done")) or not issues, issues=issues)
+        except json.JSONDecodeError:
+            pass
+
+    if not text or (completion_phrase and _normalize(text) == _normalize(completion_phrase)):
+        return CriticVerdict(done=True)
+    issues = [_BULLET.sub("", line).strip() for line in text.splitlines()]
+    return CriticVerdict(done=False, issues=[issue for issue in issues if issue])
+
+
+class RefinementLoopAgent(BaseAgent):
+    """
+    Runs critic and refiner rounds until the critic is satisfied.
+
+    Unlike a LoopAgent with an exit tool, completion is detected locally from the
+    critic verdict, so a finished story never pays for a refiner LLM call. After each
+    iteration a progress event with the critique and a draft diff is emitted.
+
+    The loop also stops when the drafts converge: when CONVERGED_REVISIONS consecutive
+    revisions (each after a critique that was not done) are at least
+    ``convergence_threshold`` similar to the draft they revised, or a revision brings
+    back a draft the loop has already seen, further rounds would only oscillate.
+
+    With a latency budget (state[STATE_LATENCY_BUDGET], or ``latency_budget``), the
+    loop checks before every critic and refiner step whether the step still fits,
+    based on the average duration of that agent's previous steps, and otherwise
+    stops and keeps the current draft.
+    """
+
+    critic_agent: BaseAgent
+    refiner_agent: BaseAgent
+    max_iterations: int = 5
+    criticism_key: str = "criticism"
+    document_key: str = "current_document"
+    completion_phrase: str = ""
+    convergence_threshold: Optional[float] = None
+    latency_budget: Optional[float] = None
+    state_prefix: str = ""
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(
+        self,
+        name: str,
+        critic_agent: BaseAgent,
+        refiner_agent: BaseAgent,
+        max_iterations: int = 5,
+        criticism_key: str = "criticism",
+        document_key: str = "current_document",
+        completion_phrase: str = "",
+        convergence_threshold: Optional[float] = None,
+        latency_budget: Optional[float] = None,
+        state_prefix: str = "",
+        **kwargs,
+    ):
+        """
+        Initializes the RefinementLoopAgent.
+
+        Args:
+            name: The name of the agent.
+            critic_agent: Writes its verdict to state[criticism_key].
+            refiner_agent: Rewrites the story from state[criticism_key].
+            max_iterations: The maximum number of critic rounds.
+            criticism_key: The state key the critic writes to.
+            document_key: The state key of the story the refiner rewrites.
+            completion_phrase: Plain-text completion signal accepted besides the JSON verdict.
+            convergence_threshold: Shingle similarity between consecutive drafts at or
+              above which a revision counts as similar; the loop stops after
+              CONVERGED_REVISIONS similar revisions in a row. None disables convergence detection.
+            latency_budget: Default seconds a request may take, for sessions without
+              state[STATE_LATENCY_BUDGET]. None means no deadline.
+            state_prefix: Prefix of the loop's bookkeeping keys (LOOP_STATE_KEYS), so
+              loops running side by side do not overwrite each other's.
+        """
+        super().__init__(
+            name=name,
+            critic_agent=critic_agent,
+            refiner_agent=refiner_agent,
+            max_iterations=max_iterations,
+            criticism_key=criticism_key,
+            document_key=document_key,
+            completion_phrase=completion_phrase,
+            convergence_threshold=convergence_threshold,
+            latency_budget=latency_budget,
+            state_prefix=state_prefix,
+            sub_agents=[critic_agent, refiner_agent],
+            **kwargs,
+        )
+
+    def state_key(self, key: str) -> str:
+        """Returns the state key this loop uses for one of the LOOP_STATE_KEYS."""
+        return f"{self.state_prefix}{key}" if key in LOOP_STATE_KEYS else key
+
+    def _state_event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        """Creates a content-less event that records state changes of the loop."""
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={self.state_key(key): value for key, value in state_delta.items()}),
+        )
+
+    def _converged(self, ctx: InvocationContext, previous_document: str, document: str) -> tuple[bool, dict]:
+        """Compares a revision with the draft it revised and the earlier drafts.
+
+        Returns: Whether the drafts converged, and the state delta that records the
+        revision in the draft history.
+        """
+        history = list(ctx.session.state.get(self.state_key(STATE_DRAFT_HISTORY)) or [fingerprint(previous_document)])
+        similarity = round(text_similarity(previous_document, document), 4)
+        revisited = fingerprint(document) in history
+        similar_revisions = 0
+        if similarity >= self.convergence_threshold:
+            similar_revisions = (ctx.session.state.get(self.state_key(STATE_SIMILAR_REVISIONS)) or 0) + 1
+        state_delta = {
+            STATE_DRAFT_HISTORY: history + [fingerprint(document)],
+            STATE_DRAFT_SIMILARITY: similarity,
+            STATE_SIMILAR_REVISIONS: similar_revisions,
+        }
+        if revisited or similar_revisions >= CONVERGED_REVISIONS:
+            logger.info(f"[{self.name}] Drafts converged (similarity={similarity}, similar revisions={similar_revisions}, revisited={revisited}).")
+            return True, state_delta
+        return False, state_delta
+
+    def _deadline(self, ctx: InvocationContext) -> Optional[float]:
+        """Returns the time by which the request must be answered, or None without a budget."""
+        budget = ctx.session.state.get(STATE_LATENCY_BUDGET, self.latency_budget)
+        return invocation_started_at(ctx) + float(budget) if budget is not None else None
+
+    def _fits(self, deadline: Optional[float], *agents: BaseAgent) -> bool:
+        """Returns whether the steps of the agents are expected to finish before the deadline."""
+        if deadline is None:
+            return True
+        remaining = deadline - time.time()
+        expected = sum(expected_step_seconds(agent.name) for agent in agents)
+        if remaining > expected:
+            return True
+        logger.info(f"[{self.name}] {remaining:.2f}s left, {', '.join(agent.name for agent in agents)} expected to take {expected:.2f}s: stopping.")
+        return False
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        started = time.perf_counter()
+        exit_reason: Optional[str] = None
+        iteration = 0
+        deadline = self._deadline(ctx)
+        try:
+            resume_rounds = ctx.session.state.get(self.state_key(STATE_RESUME_ROUNDS))
+            if not resume_rounds:
+                yield self._state_event(ctx, {STATE_DRAFT_HISTORY: [], STATE_DRAFT_SIMILARITY: None, STATE_SIMILAR_REVISIONS: 0})
+            # Restored from a checkpoint: the current document already includes these rounds
+            if resume_rounds:
+                iteration = resume_rounds
+                logger.info(f"[{self.name}] Resuming after {iteration} completed round(s).")
+                yield self._state_event(ctx, {STATE_RESUME_ROUNDS: 0})
+            if ctx.session.state.get(STATE_SKIP_REFINEMENT):
+                exit_reason = EXIT_SKIPPED
+            while exit_reason is None and iteration < self.max_iterations:
+                if not self._fits(deadline, self.critic_agent, self.refiner_agent):
+                    exit_reason = EXIT_DEADLINE
+                    break
+                iteration += 1
+                step_started = time.perf_counter()
+                async for event in self.critic_agent.run_async(ctx):
+                    yield event
+                observe_step(self.critic_agent.name, time.perf_counter() - step_started)
+
+                verdict = parse_verdict(ctx.session.state.get(self.criticism_key, ""), self.completion_phrase)
+                logger.info(f"[{self.name}] Iteration {iteration}: done={verdict.done}, issues={len(verdict.issues)}")
+                if verdict.done:
+                    exit_reason = EXIT_CRITIC_DONE
+                    yield self._state_event(ctx, {
+                        STATE_CRITIC_VERDICT: verdict.model_dump(),
+                        STATE_REFINEMENT_ITERATION: iteration,
+                    })
+                    yield progress_event(ctx, self.name, iteration, self.max_iterations, True, [])
+                    break
+
+                # The refiner reads the normalized issue list, not the raw critic JSON
+                yield self._state_event(ctx, {
+                    self.criticism_key: verdict.as_criticism(),
+                    STATE_CRITIC_VERDICT: verdict.model_dump(),
+                    STATE_REFINEMENT_ITERATION: iteration,
+                })
+                if not self._fits(deadline, self.refiner_agent):
+                    exit_reason = EXIT_DEADLINE
+                    break
+                previous_document = ctx.session.state.get(self.document_key, "")
+                step_started = time.perf_counter()
+                async for event in self.refiner_agent.run_async(ctx):
+                    yield event
+                    if event.actions.escalate:
+                        exit_reason = EXIT_ESCALATED
+                observe_step(self.refiner_agent.name, time.perf_counter() - step_started)
+                document = ctx.session.state.get(self.document_key, "")
+                diff = draft_diff(previous_document, document)
+                yield progress_event(ctx, self.name, iteration, self.max_iterations, False, verdict.issues, diff)
+                state_delta = {STATE_COMPLETED_ROUNDS: iteration}
+                if self.convergence_threshold is not None and exit_reason is None:
+                    converged, history_delta = self._converged(ctx, previous_document, document)
+                    state_delta.update(history_delta)
+                    if converged:
+                        exit_reason = EXIT_CONVERGED
+                yield self._state_event(ctx, state_delta)
+
+            exit_reason = exit_reason or EXIT_MAX_ITERATIONS
+            logger.info(f"[{self.name}] Finished after {iteration} iteration(s): {exit_reason}")
+            yield self._state_event(ctx, {STATE_REFINEMENT_EXIT_REASON: exit_reason, STATE_COMPLETED_ROUNDS: 0})
+        except Exception as e:
+            exit_reason = "error"
+            AGENT_ERRORS.inc(agent=self.name, error=type(e).__name__)
+            raise
+        finally:
+            observe_loop(self.name, iteration, exit_reason or "cancelled", time.perf_counter() - started)
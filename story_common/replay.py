@@ -0,0 +1,292 @@
+"""Record and replay of LLM traffic.
+
+With STORY_LLM_RECORD=<path>, every LLM call of the agents is appended to a trace file
+as one compact JSON line: the issuing agent, a hash of the request, the time to the
+first response, the total duration and the responses (or the error). With
+STORY_LLM_REPLAY=<path>, LLM_MODEL serves those recordings instead of calling a
+model, so a captured workload can be re-run offline and deterministically;
+STORY_LLM_REPLAY_LATENCY=original also waits the recorded latencies.
+
+Usage:
+    python -m story_common.replay trace.jsonl
+prints per-agent call counts, latencies and errors of a trace as JSON.
+"""
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+from collections import deque
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import argparse, asyncio, json, logging, os, threading, time
+
+from .llm_cache import agent_name_of, request_cache_key
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+TRACE_VERSION = 1
+# Requests are keyed independently of the model that served them, so a trace recorded
+# through the router replays against any model configuration
+TRACE_KEY_MODEL = "trace"
+# --- Replay Latency Modes ---
+LATENCY_NONE = "none"
+LATENCY_ORIGINAL = "original"
+
+
+class ReplayMissError(LookupError):
+    """Raised when the trace has no recording left for an agent's request."""
+
+
+class ReplayedLlmError(RuntimeError):
+    """Raised in place of an error recorded in the trace. Carries the recorded status code."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TraceWriter:
+    """Appends trace records to a JSON lines file, one line per LLM call."""
+
+    def __init__(self, path: str):
+        path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+_writers: dict[str, TraceWriter] = {}
+_writers_lock = threading.Lock()
+
+
+def get_trace_writer(path: str) -> TraceWriter:
+    """Returns the process-wide writer of a trace file, shared by all packages recording to it."""
+    path = os.path.expanduser(path)
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = TraceWriter(path)
+        return _writers[path]
+
+
+def read_trace(path: str) -> list[dict]:
+    """Returns the records of a trace file, skipping a torn last line."""
+    records = []
+    with open(os.path.expanduser(path), "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"[Replay] Skipping unreadable line {number} of {path}")
+    return records
+
+
+class RecordingLlm(BaseLlm):
+    """
+    A BaseLlm that passes every call to the wrapped model and records it in a trace.
+
+    Only complete (non-partial) responses are recorded; a call that fails is recorded
+    with its error, so the replay fails the same way.
+    """
+
+    inner: BaseLlm
+    path: str
+
+    _writer: TraceWriter = PrivateAttr(default=None)
+
+    def __init__(self, inner: BaseLlm, path: str, **kwargs):
+        """
+        Wraps a model with a recorder.
+
+        Args:
+            inner: The model that serves the calls.
+            path: The trace file to append to.
+        """
+        super().__init__(model=kwargs.pop("model", inner.model), inner=inner, path=path, **kwargs)
+
+    def model_post_init(self, __context):
+        self._writer = get_trace_writer(self.path)
+        logger.info(f"[Replay] Recording LLM traffic to {self._writer.path}")
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        record = {
+            "v": TRACE_VERSION,
+            "ts": round(time.time(), 3),
+            "agent": agent_name_of(llm_request),
+            "key": request_cache_key(TRACE_KEY_MODEL, llm_request),
+            "stream": stream,
+        }
+        started = time.perf_counter()
+        first_response_at = None
+        responses = []
+        try:
+            async for response in self.inner.generate_content_async(llm_request, stream=stream):
+                if first_response_at is None:
+                    first_response_at = time.perf_counter()
+                if not response.partial:
+                    responses.append(response.model_dump(mode="json", exclude_none=True))
+                yield response
+        except Exception as e:
+            record["error"] = {"type": type(e).__name__, "message": str(e), "status_code": getattr(e, "status_code", None)}
+            raise
+        finally:
+            finished = time.perf_counter()
+            record["first_response_s"] = round((first_response_at or finished) - started, 4)
+            record["duration_s"] = round(finished - started, 4)
+            record["responses"] = responses
+            self._writer.write(record)
+
+    @property
+    def calls(self) -> dict[str, int]:
+        """The number of calls per agent of the wrapped model, if it counts them."""
+        return getattr(self.inner, "calls", {})
+
+    def cache_stats(self) -> dict:
+        """Returns the response cache statistics of the wrapped model, if it has any."""
+        return self.inner.cache_stats() if hasattr(self.inner, "cache_stats") else {}
+
+    def latency_stats(self) -> dict[str, float]:
+        """Returns the observed latencies of the wrapped model, if it tracks any."""
+        return self.inner.latency_stats() if hasattr(self.inner, "latency_stats") else {}
+
+
+class ReplayLlm(BaseLlm):
+    """
+    A BaseLlm that serves the calls recorded in a trace instead of calling a model.
+
+    A request is answered by the oldest unused recording of the same agent with the
+    same request hash. If there is none (the prompts changed between versions, or the
+    sessions ran in another order), the oldest unused recording of the agent is used,
+    unless ``strict`` is set. The recordings are consumed once, so a replay needs a
+    trace of at least the same workload.
+    """
+
+    model: str = "replay"
+    path: str
+    latency: str = LATENCY_NONE
+    strict: bool = False
+
+    _recordings: dict[str, deque] = PrivateAttr(default_factory=dict)
+    _calls: dict[str, int] = PrivateAttr(default_factory=dict)
+    _fallbacks: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context):
+        records = read_trace(self.path)
+        for record in records:
+            self._recordings.setdefault(record.get("agent", ""), deque()).append(record)
+        logger.info(f"[Replay] Loaded {len(records)} recorded call(s) of {len(self._recordings)} agent(s) from {self.path}")
+
+    @classmethod
+    def from_env(cls) -> Optional["ReplayLlm"]:
+        """Creates the replay backend of STORY_LLM_REPLAY, or returns None if it is not set."""
+        path = os.environ.get("STORY_LLM_REPLAY")
+        if not path:
+            return None
+        return cls(
+            path=os.path.expanduser(path),
+            latency=os.environ.get("STORY_LLM_REPLAY_LATENCY", LATENCY_NONE).lower(),
+            strict=os.environ.get("STORY_LLM_REPLAY_STRICT", "off").lower() in ("1", "on", "true"),
+        )
+
+    @property
+    def calls(self) -> dict[str, int]:
+        """The number of calls served so far, per agent."""
+        return dict(self._calls)
+
+    @property
+    def fallbacks(self) -> int:
+        """The number of calls answered by a recording of another request of the same agent."""
+        return self._fallbacks
+
+    def _take(self, agent: str, key: str) -> dict:
+        recordings = self._recordings.get(agent)
+        if not recordings:
+            raise ReplayMissError(f"No recorded call left for {agent} in {self.path}")
+        for index, record in enumerate(recordings):
+            if record.get("key") == key:
+                del recordings[index]
+                return record
+        if self.strict:
+            raise ReplayMissError(f"No recorded call of {agent} matches request {key[:12]} in {self.path}")
+        self._fallbacks += 1
+        logger.debug(f"[Replay] No exact match for {agent} ({key[:12]}), using its next recording")
+        return recordings.popleft()
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        agent = agent_name_of(llm_request)
+        record = self._take(agent, request_cache_key(TRACE_KEY_MODEL, llm_request))
+        self._calls[agent] = self._calls.get(agent, 0) + 1
+        original = self.latency == LATENCY_ORIGINAL
+        first_response_s = record.get("first_response_s", 0.0)
+        if original:
+            await asyncio.sleep(first_response_s)
+        if record.get("error"):
+            error = record["error"]
+            raise ReplayedLlmError(f"{error.get('type')}: {error.get('message')}", error.get("status_code"))
+        for response in record.get("responses", []):
+            yield LlmResponse.model_validate(response)
+        if original:
+            await asyncio.sleep(max(record.get("duration_s", 0.0) - first_response_s, 0.0))
+
+
+def with_llm_trace(model: BaseLlm) -> BaseLlm:
+    """Returns the model itself, a RecordingLlm around it (STORY_LLM_RECORD) or a ReplayLlm (STORY_LLM_REPLAY)."""
+    replay = ReplayLlm.from_env()
+    if replay is not None:
+        return replay
+    if os.environ.get("STORY_LLM_RECORD"):
+        return RecordingLlm(model, os.environ["STORY_LLM_RECORD"])
+    return model
+
+
+def summarize_trace(records: list[dict]) -> dict:
+    """Returns the number of calls, latency percentiles and errors per agent of a trace."""
+    from .loadtest import summarize
+
+    agents: dict[str, list[dict]] = {}
+    for record in records:
+        agents.setdefault(record.get("agent", ""), []).append(record)
+    timestamps = [record["ts"] for record in records if "ts" in record]
+    return {
+        "calls": len(records),
+        "span_seconds": round(max(timestamps) - min(timestamps), 3) if timestamps else 0.0,
+        "agents": {
+            agent: {
+                "calls": len(calls),
+                "errors": sum(1 for call in calls if call.get("error")),
+                "first_response": summarize([call.get("first_response_s", 0.0) for call in calls]),
+                "duration": summarize([call.get("duration_s", 0.0) for call in calls]),
+            }
+            for agent, calls in sorted(agents.items())
+        },
+    }
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Summarize a recorded LLM trace.")
+    parser.add_argument("trace", help="the trace file written with STORY_LLM_RECORD")
+    args = parser.parse_args(argv)
+    print(json.dumps(summarize_trace(read_trace(args.trace)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
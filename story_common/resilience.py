@@ -0,0 +1,325 @@
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import BaseModel, Field, PrivateAttr
+from collections import deque
+from typing import AsyncGenerator, Optional
+from typing_extensions import override
+import asyncio, logging, os, random, threading, time
+
+from .llm_cache import CACHE_HIT_METADATA_KEY, agent_name_of
+from .metrics import Counter, register
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# HTTP statuses of provider errors worth retrying: timeout, rate limit, server errors
+TRANSIENT_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+# Latency samples kept per agent to estimate the hedging quantile
+LATENCY_WINDOW = 200
+# --- Circuit States ---
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+LLM_RETRIES = register(Counter("story_llm_retries_total", "LLM call attempts retried after a transient error, per agent and model."))
+LLM_TIMEOUTS = register(Counter("story_llm_timeouts_total", "LLM call attempts that hit their timeout, per agent and model."))
+LLM_HEDGES = register(Counter("story_llm_hedged_calls_total", "Hedged LLM calls per agent and model, by the attempt that answered first."))
+CIRCUIT_TRANSITIONS = register(Counter("story_llm_circuit_transitions_total", "Circuit breaker state changes per model."))
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised instead of calling a model whose circuit breaker is open."""
+
+
+def is_transient(error: BaseException) -> bool:
+    """Returns whether an LLM call error is worth retrying (timeouts, connection errors, 429 and 5xx)."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    return getattr(error, "status_code", None) in TRANSIENT_STATUS_CODES
+
+
+def _parse_agent_seconds(value: str) -> dict[str, float]:
+    """Parses "CriticAgent=15,RefinerAgent=45" into a dict."""
+    result = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            result[name.strip()] = float(seconds)
+    return result
+
+
+class ResiliencePolicy(BaseModel):
+    """Timeouts, retries, hedging and circuit breaking of the calls to one model."""
+
+    timeout: float = 60.0
+    agent_timeouts: dict[str, float] = Field(default_factory=lambda: {"CriticAgent": 20.0})
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge: bool = True
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    breaker_failures: int = 5
+    breaker_reset_seconds: float = 30.0
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        """Reads the policy from the STORY_LLM_* environment variables, keeping the defaults for unset ones."""
+        values = {}
+        for field, variable, parse in (
+            ("timeout", "STORY_LLM_TIMEOUT", float),
+            ("agent_timeouts", "STORY_LLM_AGENT_TIMEOUTS", _parse_agent_seconds),
+            ("max_retries", "STORY_LLM_RETRIES", int),
+            ("hedge", "STORY_LLM_HEDGE", lambda value: value.lower() not in ("0", "off", "false")),
+            ("hedge_quantile", "STORY_LLM_HEDGE_QUANTILE", float),
+            ("breaker_failures", "STORY_LLM_BREAKER_FAILURES", int),
+            ("breaker_reset_seconds", "STORY_LLM_BREAKER_RESET", float),
+        ):
+            if os.environ.get(variable):
+                values[field] = parse(os.environ[variable])
+        return cls(**values)
+
+    def timeout_for(self, agent: str) -> float:
+        """Returns the timeout of one call attempt of the agent (or of the agent it was cloned from), in seconds."""
+        return self.agent_timeouts.get(agent) or self.agent_timeouts.get(agent.rstrip("0123456789"), self.timeout)
+
+    def backoff(self, attempt: int, rng: random.Random) -> float:
+        """Returns the delay before retry ``attempt`` (1-based), with full jitter."""
+        return rng.uniform(0.0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a model after ``failures`` consecutive transient errors.
+
+    The circuit stays open for ``reset_seconds``, then lets a single trial call through
+    (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failures: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CIRCUIT_CLOSED
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"[Circuit] {self.name}: {self.state} -> {state}")
+            CIRCUIT_TRANSITIONS.inc(model=self.name, state=state)
+            self.state = state
+
+    def allow(self) -> bool:
+        """Returns whether a call may go out now, reserving the trial call when half-open."""
+        with self._lock:
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._transition(CIRCUIT_HALF_OPEN)
+            if self.state == CIRCUIT_CLOSED:
+                return True
+            if self.state == CIRCUIT_HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._trial_running = False
+            self._transition(CIRCUIT_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_running = False
+            if self.state == CIRCUIT_HALF_OPEN or self._consecutive_failures >= self.failures:
+                self._opened_at = time.monotonic()
+                self._transition(CIRCUIT_OPEN)
+
+
+class ResilientLlm(BaseLlm):
+    """
+    A BaseLlm that guards the calls to the wrapped model.
+
+    - Every attempt has a per-agent timeout.
+    - Once an attempt has waited longer than the agent's observed ``hedge_quantile``
+      latency for its first response, a duplicate request is sent; the first one to
+      answer is used and the other is cancelled.
+    - Transient errors are retried with jittered exponential backoff, as long as no
+      response has been passed on yet.
+    - Consecutive transient failures open a circuit breaker; while it is open calls
+      fail at once with CircuitOpenError, so a ModelRouter fails over to the next
+      model of the route.
+    """
+
+    inner: BaseLlm
+    policy: ResiliencePolicy = Field(default_factory=ResiliencePolicy)
+    seed: Optional[int] = None
+
+    _breaker: CircuitBreaker = PrivateAttr(default=None)
+    _latencies: dict[str, deque] = PrivateAttr(default_factory=dict)
+    _rng: random.Random = PrivateAttr(default=None)
+
+    def __init__(self, inner: BaseLlm, policy: Optional[ResiliencePolicy] = None, **kwargs):
+        """
+        Wraps a model with timeouts, hedging, retries and a circuit breaker.
+
+        Args:
+            inner: The model to call.
+            policy: The settings. Defaults to ResiliencePolicy.from_env().
+        """
+        super().__init__(model=kwargs.pop("model", inner.model), inner=inner, policy=policy or ResiliencePolicy.from_env(), **kwargs)
+
+    def model_post_init(self, __context):
+        self._breaker = CircuitBreaker(self.inner.model, self.policy.breaker_failures, self.policy.breaker_reset_seconds)
+        self._rng = random.Random(self.seed)
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._breaker
+
+    def hedge_delay(self, agent: str) -> Optional[float]:
+        """Returns how long to wait for a first response before hedging, or None to not hedge."""
+        samples = self._latencies.get(agent)
+        if not self.policy.hedge or not samples or len(samples) < self.policy.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(self.policy.hedge_quantile * len(ordered)))]
+
+    def _observe(self, agent: str, seconds: float):
+        self._latencies.setdefault(agent, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+    async def _next_before(self, generator: AsyncGenerator, deadline: float, agent: str) -> Optional[LlmResponse]:
+        """Returns the next response of the generator, or None at its end. Runs in the calling task."""
+        try:
+            async with asyncio.timeout_at(deadline):
+                return await generator.__anext__()
+        except StopAsyncIteration:
+            return None
+        except TimeoutError:
+            LLM_TIMEOUTS.inc(agent=agent, model=self.inner.model)
+            raise TimeoutError(f"{self.inner.model} did not answer {agent} within {self.policy.timeout_for(agent):.1f}s")
+
+    async def _race_first(
+        self, agent: str, llm_request: LlmRequest, stream: bool, started: float, deadline: float, hedge_at: float
+    ) -> tuple[AsyncGenerator, Optional[LlmResponse]]:
+        """Waits for the first response, sending a hedge request once ``hedge_at`` seconds passed.
+
+        Returns: The generator that answered first and its first response (None if it ended
+        without one). The other request is cancelled.
+        """
+        loop = asyncio.get_running_loop()
+        # Pending first-response tasks, mapped to their generator and whether they are the hedge
+        racing: dict[asyncio.Task, tuple[AsyncGenerator, bool]] = {}
+
+        def launch(hedged: bool):
+            generator = self.inner.generate_content_async(llm_request, stream=stream)
+            racing[asyncio.ensure_future(generator.__anext__())] = (generator, hedged)
+
+        launch(False)
+        hedged_call = False
+        winner = first = error = None
+        try:
+            while winner is None:
+                now = loop.time()
+                if now >= deadline:
+                    LLM_TIMEOUTS.inc(agent=agent, model=self.inner.model)
+                    raise TimeoutError(f"{self.inner.model} did not answer {agent} within {deadline - started:.1f}s")
+                wait_until = deadline if hedged_call else min(deadline, started + hedge_at)
+                done, _ = await asyncio.wait(racing, timeout=max(0.0, wait_until - now), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if not hedged_call and loop.time() >= started + hedge_at:
+                        logger.debug(f"[Resilience] Hedging {agent} on {self.inner.model} after {hedge_at:.2f}s")
+                        launch(True)
+                        hedged_call = True
+                    continue
+                for task in done:
+                    generator, hedged = racing.pop(task)
+                    if task.exception() is None or isinstance(task.exception(), StopAsyncIteration):
+                        winner, first = (generator, hedged), task.result() if task.exception() is None else None
+                        break
+                    # The other request may still answer
+                    error = task.exception()
+                if winner is None and not racing:
+                    raise error
+        finally:
+            for task in racing:
+                task.cancel()
+            await asyncio.gather(*racing, return_exceptions=True)
+            for generator, _ in racing.values():
+                await generator.aclose()
+
+        generator, hedged = winner
+        if hedged_call:
+            LLM_HEDGES.inc(agent=agent, model=self.inner.model, winner="hedge" if hedged else "primary")
+        return generator, first
+
+    async def _attempt(
+        self, agent: str, llm_request: LlmRequest, stream: bool
+    ) -> AsyncGenerator[LlmResponse, None]:
+        """Runs one attempt, hedged if its first response is late, within the agent's timeout.
+
+        The responses are awaited in the calling task, so context variables set by the
+        wrapped model are seen by the caller. Only the first-response race of a hedged
+        call runs in separate tasks.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.policy.timeout_for(agent)
+        hedge_at = self.hedge_delay(agent)
+        if hedge_at is None:
+            generator = self.inner.generate_content_async(llm_request, stream=stream)
+            try:
+                first = await self._next_before(generator, deadline, agent)
+            except BaseException:
+                await generator.aclose()
+                raise
+        else:
+            generator, first = await self._race_first(agent, llm_request, stream, started, deadline, hedge_at)
+
+        try:
+            if first is None:
+                return
+            if not (first.custom_metadata and first.custom_metadata.get(CACHE_HIT_METADATA_KEY)):
+                self._observe(agent, loop.time() - started)
+            yield first
+            while (response := await self._next_before(generator, deadline, agent)) is not None:
+                yield response
+        finally:
+            await generator.aclose()
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        agent = agent_name_of(llm_request)
+        attempt = 0
+        while True:
+            if not self._breaker.allow():
+                raise CircuitOpenError(f"Circuit of {self.inner.model} is {self._breaker.state}")
+            responded = False
+            try:
+                async for response in self._attempt(agent, llm_request, stream):
+                    responded = True
+                    yield response
+                self._breaker.record_success()
+                return
+            except Exception as e:
+                if not is_transient(e):
+                    # The provider answered, the request itself was bad: not a reason to open the circuit
+                    self._breaker.record_success()
+                    raise
+                self._breaker.record_failure()
+                # A partial answer was already passed on, and retries are exhausted: give up
+                if responded or attempt >= self.policy.max_retries:
+                    raise
+                attempt += 1
+                delay = self.policy.backoff(attempt, self._rng)
+                logger.warning(f"[Resilience] {agent} on {self.inner.model} failed ({type(e).__name__}: {e}), retry {attempt} in {delay:.2f}s")
+                LLM_RETRIES.inc(agent=agent, model=self.inner.model)
+                await asyncio.sleep(delay)
@@ -0,0 +1,259 @@
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import AsyncGenerator, Callable, Literal, Optional, Union
+from typing_extensions import override
+import json, logging, os, threading, time
+
+from .llm_cache import CACHE_HIT_METADATA_KEY, agent_name_of
+from .metrics import Counter, register
+from .models import DEFAULT_MODEL, get_model
+from .resilience import ResiliencePolicy, ResilientLlm
+from .streaming import stream_requested
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+TIER_QUALITY = "quality"
+TIER_FAST = "fast"
+ROUTER_MODEL_NAME = "router"
+# Weight of the newest sample in the per-model latency average
+LATENCY_EWMA_ALPHA = 0.3
+# Seconds a model that just failed is skipped by "fastest" routes
+FAILURE_COOLDOWN_SECONDS = 30.0
+
+LLM_ROUTED_CALLS = register(Counter("story_llm_routed_calls_total", "LLM calls per agent and routed model, by outcome."))
+
+
+class Route(BaseModel):
+    """The models an agent's requests may go to.
+
+    ``ordered`` tries the models in the listed order and only moves on when a model
+    fails. ``fastest`` tries them by observed latency, fastest first; models without
+    samples are tried before measured ones, so every model is measured once.
+    """
+
+    models: list[str] = Field(min_length=1)
+    strategy: Literal["ordered", "fastest"] = "ordered"
+
+
+class RoutingConfig(BaseModel):
+    """Named routes (tiers) and the tier or route of each agent."""
+
+    tiers: dict[str, Route]
+    agents: dict[str, Union[str, Route]] = Field(default_factory=dict)
+    default: str = TIER_QUALITY
+
+    def route_for(self, agent: str) -> Route:
+        """Returns the route of the agent, or the default tier's route for unlisted agents.
+
+        Numbered clones of an agent (CriticAgent2 of a long-form story) share its route.
+        """
+        route = self.agents.get(agent) or self.agents.get(agent.rstrip("0123456789"), self.default)
+        return self.tiers[route] if isinstance(route, str) else route
+
+
+# Short classification-style calls go to the fast tier; writing stays on the quality tier.
+# Both tiers start on the same model, so nothing changes until a fast model is configured.
+DEFAULT_ROUTING = {
+    "tiers": {
+        TIER_QUALITY: {"models": [DEFAULT_MODEL]},
+        TIER_FAST: {"models": [DEFAULT_MODEL], "strategy": "fastest"},
+    },
+    "agents": {
+        "CriticAgent": TIER_FAST,
+        "TopicCollectorAgent": TIER_FAST,
+        "DraftSelectorAgent": TIER_FAST,
+        "CoherenceCriticAgent": TIER_FAST,
+        "ClarityCriticAgent": TIER_FAST,
+        "EngagementCriticAgent": TIER_FAST,
+    },
+    "default": TIER_QUALITY,
+}
+
+
+def _parse_models(value: str) -> list[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+def load_routing_config(environ=None) -> RoutingConfig:
+    """Builds the routing configuration from the defaults and the environment.
+
+    Later sources override earlier ones:
+
+    1. DEFAULT_ROUTING.
+    2. STORY_MODEL_ROUTES: a JSON file path (or inline JSON) in the RoutingConfig
+       shape. Its tiers and agents are merged over the defaults.
+    3. STORY_MODEL_<TIER>: comma-separated models of a tier, primary first, e.g.
+       STORY_MODEL_FAST="gemini/gemini-2.0-flash,deepseek/deepseek-chat".
+    """
+    environ = os.environ if environ is None else environ
+    config = json.loads(json.dumps(DEFAULT_ROUTING))
+    source = environ.get("STORY_MODEL_ROUTES", "").strip()
+    if source:
+        if not source.startswith("{"):
+            with open(os.path.expanduser(source), "r", encoding="utf-8") as f:
+                source = f.read()
+        overrides = json.loads(source)
+        config["tiers"].update(overrides.get("tiers", {}))
+        config["agents"].update(overrides.get("agents", {}))
+        config["default"] = overrides.get("default", config["default"])
+    prefix = "STORY_MODEL_"
+    for key, value in environ.items():
+        if key.startswith(prefix) and key != "STORY_MODEL_ROUTES" and _parse_models(value):
+            config["tiers"].setdefault(key[len(prefix):].lower(), {})["models"] = _parse_models(value)
+    return RoutingConfig.model_validate(config)
+
+
+class LatencyTracker:
+    """Exponentially weighted average latency and the last failure of each model."""
+
+    def __init__(self, alpha: float = LATENCY_EWMA_ALPHA, cooldown: float = FAILURE_COOLDOWN_SECONDS):
+        self.alpha = alpha
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._latency: dict[str, float] = {}
+        self._failed_at: dict[str, float] = {}
+
+    def observe(self, model: str, seconds: float):
+        """Adds a successful call's latency to the model's average."""
+        with self._lock:
+            previous = self._latency.get(model)
+            self._latency[model] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+            self._failed_at.pop(model, None)
+
+    def fail(self, model: str):
+        """Records a failed call; the model is avoided for the cooldown period."""
+        with self._lock:
+            self._failed_at[model] = time.monotonic()
+
+    def order(self, models: list[str]) -> list[str]:
+        """Sorts models fastest first: cooling-down models last, unmeasured ones before measured ones."""
+        now = time.monotonic()
+        with self._lock:
+            def rank(indexed):
+                index, model = indexed
+                cooling = now - self._failed_at.get(model, -self.cooldown) < self.cooldown
+                latency = self._latency.get(model)
+                return (cooling, latency is not None, latency or 0.0, index)
+            return [model for _, model in sorted(enumerate(models), key=rank)]
+
+    def snapshot(self) -> dict[str, float]:
+        """Returns the current average latency per model, in seconds."""
+        with self._lock:
+            return dict(self._latency)
+
+
+class ModelRouter(BaseLlm):
+    """
+    A BaseLlm that sends each request to the model configured for its agent.
+
+    The agent is read from the request labels ADK sets, so one router can be given to
+    every LlmAgent. Each model is called through a ResilientLlm (timeouts, hedging,
+    retries and a circuit breaker) unless ``policy`` is None. If a model still fails
+    before it produced any response, or its circuit is open, the request goes to the
+    next model of the route.
+    """
+
+    model: str = ROUTER_MODEL_NAME
+    config: RoutingConfig
+    _resolve: Optional[Callable[[str], BaseLlm]] = PrivateAttr(default=None)
+    policy: Optional[ResiliencePolicy] = None
+    _latency: LatencyTracker = PrivateAttr(default_factory=LatencyTracker)
+    _clients: dict[str, BaseLlm] = PrivateAttr(default_factory=dict)
+
+    def __init__(
+        self,
+        config: Optional[RoutingConfig] = None,
+        resolve: Optional[Callable[[str], BaseLlm]] = None,
+        policy: Optional[ResiliencePolicy] = None,
+        **kwargs,
+    ):
+        """
+        Creates a router.
+
+        Args:
+            config: The routes. Defaults to load_routing_config().
+            resolve: Returns the model for a model name. Defaults to get_model(), the
+              shared cached, lazily created LiteLlm.
+            policy: The resilience settings every model is called with, or None to
+              call the models directly.
+        """
+        super().__init__(config=config or load_routing_config(), policy=policy, **kwargs)
+        self._resolve = resolve
+
+    def resolve(self, model: str) -> BaseLlm:
+        """Returns the model instance for a model name."""
+        return self._resolve(model) if self._resolve else get_model(model)
+
+    def client(self, model: str) -> BaseLlm:
+        """Returns the model the router calls for a model name, wrapped in its resilience layer."""
+        if model not in self._clients:
+            llm = self.resolve(model)
+            self._clients[model] = ResilientLlm(llm, self.policy) if self.policy else llm
+        return self._clients[model]
+
+    def candidates(self, agent: str) -> list[str]:
+        """Returns the models to try for the agent's request, in order."""
+        route = self.config.route_for(agent)
+        return self._latency.order(route.models) if route.strategy == "fastest" else list(route.models)
+
+    @override
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        agent = agent_name_of(llm_request)
+        candidates = self.candidates(agent)
+        stream = stream_requested(llm_request, stream)
+        for position, model in enumerate(candidates):
+            started = time.perf_counter()
+            responded = cache_hit = False
+            try:
+                async for response in self.client(model).generate_content_async(llm_request, stream=stream):
+                    responded = True
+                    cache_hit = cache_hit or bool(response.custom_metadata and response.custom_metadata.get(CACHE_HIT_METADATA_KEY))
+                    yield response
+            except Exception as e:
+                self._latency.fail(model)
+                LLM_ROUTED_CALLS.inc(agent=agent, model=model, outcome="error")
+                # Part of the answer has already been shown: switching models would mix two answers
+                if responded or position == len(candidates) - 1:
+                    raise
+                logger.warning(f"[Router] {model} failed for {agent} ({type(e).__name__}: {e}), falling back to {candidates[position + 1]}")
+                continue
+            # Cache hits say nothing about the provider's latency
+            if not cache_hit:
+                self._latency.observe(model, time.perf_counter() - started)
+            LLM_ROUTED_CALLS.inc(agent=agent, model=model, outcome="cache_hit" if cache_hit else "ok")
+            return
+
+    def latency_stats(self) -> dict[str, float]:
+        """Returns the observed average latency per model, in seconds."""
+        return self._latency.snapshot()
+
+    def cache_stats(self) -> dict:
+        """Returns the response cache statistics of every configured model that has a cache."""
+        models = {model for route in self.config.tiers.values() for model in route.models}
+        models |= {model for route in self.config.agents.values() if isinstance(route, Route) for model in route.models}
+        stats = {}
+        for model in sorted(models):
+            llm = self.resolve(model)
+            if hasattr(llm, "cache_stats"):
+                stats[model] = llm.cache_stats()
+        return stats
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> ModelRouter:
+    """Returns the process-wide router configured by the environment, shared by all packages."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            resilient = os.environ.get("STORY_LLM_RESILIENCE", "on").lower() not in ("0", "off", "false")
+            _router = ModelRouter(policy=ResiliencePolicy.from_env() if resilient else None)
+            logger.info(f"[Router] Routes: {_router.config.model_dump_json()}")
+        return _router
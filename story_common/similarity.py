@@ -0,0 +1,37 @@
+import hashlib, re
+
+# --- Constants ---
+# Word shingle size used to compare drafts
+SHINGLE_SIZE = 3
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def words(text: str) -> list[str]:
+    """Returns the lowercased words of the text, without punctuation."""
+    return _WORD.findall((text or "").lower())
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> set[tuple[str, ...]]:
+    """Returns the set of word n-grams of the text (the text itself if it is shorter)."""
+    tokens = words(text)
+    if len(tokens) <= size:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    """Returns |a & b| / |a | b|, and 1.0 for two empty sets."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def text_similarity(a: str, b: str, size: int = SHINGLE_SIZE) -> float:
+    """Returns the shingle Jaccard similarity of two texts, from 0.0 (disjoint) to 1.0 (same words)."""
+    return jaccard(shingles(a, size), shingles(b, size))
+
+
+def fingerprint(text: str) -> str:
+    """Returns a short hash of the text's words, equal for drafts that differ only in case, spacing or punctuation."""
+    return hashlib.sha1(" ".join(words(text)).encode("utf-8")).hexdigest()[:16]
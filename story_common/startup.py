@@ -0,0 +1,117 @@
+"""Cold-start benchmark for the story writer packages.
+
+Starts fresh interpreters and measures, per package, how long it takes to import the
+package, to build its agent graph (first access to the entry agent) and to get the
+first event of a session served by MockLlm. Also reports whether litellm was
+imported along the way.
+
+Usage:
+    python -m story_common.startup llm_story_writer custom_story_writer --runs 5 --output startup.json
+"""
+# Only the standard library is imported at module level, so the child processes
+# measure the package imports from a cold start.
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+
+PACKAGES = ("llm_story_writer", "interact_story_writer", "custom_story_writer")
+
+
+def measure_in_process(package: str) -> dict:
+    """Measures the cold start of one package in the current (fresh) interpreter."""
+    import asyncio, importlib
+
+    started = time.perf_counter()
+    module = importlib.import_module(f"{package}.agent")
+    imported = time.perf_counter()
+
+    from .loadtest import PIPELINES, LOADTEST_TOPIC
+    attribute, preset_topic = PIPELINES[package]
+    agent = getattr(module, attribute)
+    built = time.perf_counter()
+
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+    from google.genai import types
+    from .mock_llm import MockLlm, install_model
+
+    install_model(agent, MockLlm())
+
+    async def first_event() -> float:
+        runner = Runner(agent=agent, app_name=package, session_service=InMemorySessionService())
+        state = {"current_topic": f"STORY: [topic: {LOADTEST_TOPIC}, theme: drama]"} if preset_topic else {}
+        session = await runner.session_service.create_session(app_name=package, user_id="startup", state=state)
+        message = types.Content(role="user", parts=[types.Part(text=LOADTEST_TOPIC)])
+        run_started = time.perf_counter()
+        events = runner.run_async(user_id="startup", session_id=session.id, new_message=message)
+        await events.__anext__()
+        latency = time.perf_counter() - run_started
+        await events.aclose()
+        return latency
+
+    first_event_s = asyncio.run(first_event())
+    return {
+        "import_s": round(imported - started, 4),
+        "build_s": round(built - imported, 4),
+        "first_event_s": round(first_event_s, 4),
+        "time_to_first_event_s": round(time.perf_counter() - started, 4),
+        "litellm_imported": "litellm" in sys.modules,
+    }
+
+
+def measure_cold_start(package: str) -> dict:
+    """Runs measure_in_process() in a new interpreter and adds its total wall time."""
+    with tempfile.TemporaryDirectory() as directory:
+        result_path = os.path.join(directory, "result.json")
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "story_common.startup", "--child", package, "--output", result_path],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            env={**os.environ, "STORY_LLM_CACHE": "off", "STORY_METRICS_PORT": ""},
+        )
+        wall_s = time.perf_counter() - started
+        with open(result_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    result["process_wall_s"] = round(wall_s, 4)
+    return result
+
+
+def run_benchmark(packages: list[str], runs: int = 3) -> dict:
+    """Measures every package ``runs`` times and reports the median of each timing."""
+    report = {"runs": runs, "python": sys.version.split()[0], "packages": {}}
+    for package in packages:
+        samples = [measure_cold_start(package) for _ in range(runs)]
+        summary = {
+            key: round(statistics.median(sample[key] for sample in samples), 4)
+            for key in samples[0] if key != "litellm_imported"
+        }
+        summary["litellm_imported"] = any(sample["litellm_imported"] for sample in samples)
+        report["packages"][package] = summary
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import and first-event latency of the story writer packages.")
+    parser.add_argument("packages", nargs="*", default=list(PACKAGES), help=f"Packages to measure (default: all of {', '.join(PACKAGES)}).")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts per package (the median is reported).")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout.")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.packages) - set(PACKAGES))
+    if unknown:
+        parser.error(f"unknown package(s): {', '.join(unknown)}")
+
+    if args.child:
+        report = measure_in_process(args.child)
+    else:
+        report = run_benchmark(args.packages, args.runs)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event, EventActions
+from google.adk.models.base_llm import BaseLlm
+from pydantic import BaseModel
+from collections import Counter
+from typing import AsyncGenerator, Optional, Union
+from typing_extensions import override
+import asyncio, logging, math, os, sqlite3, threading, time
+
+from .longform import LongFormWriterAgent
+from .refinement import STATE_REFINEMENT_EXIT_REASON, STATE_SKIP_REFINEMENT, EXIT_DEADLINE
+from .similarity import fingerprint, words
+from .streaming import stream_output
+from .topics import normalize_theme, parse_story_topic
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_INDEX_PATH = os.path.join("~", ".cache", "story_writer", "stories.sqlite3")
+DEFAULT_MAX_STORIES = 1000
+# Same theme and a topic at least this similar: the finished story is returned as is
+DEFAULT_REUSE_THRESHOLD = 0.9
+# Any theme and a topic at least this similar: the story is the writer's starting draft
+DEFAULT_SEED_THRESHOLD = 0.5
+# Words that say nothing about what a topic is about
+STOP_WORDS = frozenset(
+    "a an the of to in on at by for with and or but is was were be been his her their its my your our "
+    "who whom which that this these those about from into as".split()
+)
+# --- State Keys ---
+STATE_SEED_STORY = "seed_story"
+STATE_STORY_REUSE = "story_reuse"
+# --- Reuse Modes ---
+REUSE_HIT = "reused"
+REUSE_SEED = "seeded"
+REUSE_MISS = "miss"
+
+
+def topic_terms(topic: str) -> list[str]:
+    """Returns the content words of a topic, lowercased and without punctuation."""
+    return [word for word in words(topic) if word not in STOP_WORDS]
+
+
+def split_topic(text: str) -> tuple[str, str]:
+    """Returns the (topic, normalized theme) of a STORY line, or (text, "") for free-form text."""
+    parsed = parse_story_topic(text)
+    if parsed is None:
+        return (text or "").strip(), ""
+    theme = parsed.theme.strip().lower()
+    return parsed.topic, normalize_theme(theme) or theme
+
+
+class StoryMatch(BaseModel):
+    """The indexed story closest to a topic."""
+
+    key: str
+    topic: str
+    theme: str
+    document: str
+    similarity: float
+
+
+class StoryIndex:
+    """
+    A persistent index of finished stories by topic, on SQLite, with LRU eviction.
+
+    Topics are compared by TF-IDF weighted cosine similarity of their content words,
+    computed in memory over all indexed topics, so no embedding service is needed.
+    When the index grows past ``max_stories``, the least recently used stories are
+    evicted first.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_INDEX_PATH,
+        max_stories: int = DEFAULT_MAX_STORIES,
+        reuse_threshold: float = DEFAULT_REUSE_THRESHOLD,
+        seed_threshold: Optional[float] = DEFAULT_SEED_THRESHOLD,
+    ):
+        """
+        Opens (and creates if needed) the index database.
+
+        Args:
+            path: Location of the SQLite file, or ":memory:".
+            max_stories: Maximum number of stories kept.
+            reuse_threshold: Minimum topic similarity (same theme) to return a finished story as is.
+            seed_threshold: Minimum topic similarity to adapt a finished story, or None to never seed.
+        """
+        if path != ":memory:":
+            path = os.path.expanduser(path)
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_stories = max_stories
+        self.reuse_threshold = reuse_threshold
+        self.seed_threshold = seed_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS stories (
+                   key TEXT PRIMARY KEY,
+                   topic TEXT NOT NULL,
+                   theme TEXT NOT NULL,
+                   document TEXT NOT NULL,
+                   created_at REAL NOT NULL,
+                   accessed_at REAL NOT NULL)"""
+        )
+        self._conn.commit()
+        # key -> (topic, theme, term counts), and the number of topics each term occurs in
+        self._terms: dict[str, tuple[str, str, Counter]] = {}
+        self._document_frequency: Counter = Counter()
+        for key, topic, theme in self._conn.execute("SELECT key, topic, theme FROM stories"):
+            self._add_terms(key, topic, theme)
+
+    @classmethod
+    def from_env(cls) -> Optional["StoryIndex"]:
+        """Creates the index configured by the STORY_INDEX_* variables, or returns None unless STORY_REUSE is "on"."""
+        if os.environ.get("STORY_REUSE", "off").lower() not in ("1", "on", "true"):
+            return None
+        seed = os.environ.get("STORY_SEED_THRESHOLD", str(DEFAULT_SEED_THRESHOLD))
+        return cls(
+            path=os.environ.get("STORY_INDEX_PATH", DEFAULT_INDEX_PATH),
+            max_stories=int(os.environ.get("STORY_INDEX_MAX_STORIES", DEFAULT_MAX_STORIES)),
+            reuse_threshold=float(os.environ.get("STORY_REUSE_THRESHOLD", DEFAULT_REUSE_THRESHOLD)),
+            seed_threshold=None if seed.lower() in ("off", "false") else float(seed),
+        )
+
+    @staticmethod
+    def story_key(topic: str, theme: str) -> str:
+        """Returns the index key of a topic and theme: equal for topics that differ only in case or punctuation."""
+        return fingerprint(f"{topic} | {theme}")
+
+    def _add_terms(self, key: str, topic: str, theme: str):
+        counts = Counter(topic_terms(topic))
+        self._terms[key] = (topic, theme, counts)
+        self._document_frequency.update(counts.keys())
+
+    def _remove_terms(self, key: str):
+        _, _, counts = self._terms.pop(key)
+        self._document_frequency.subtract(counts.keys())
+
+    def _vector(self, counts: Counter) -> dict[str, float]:
+        total = len(self._terms) + 1
+        vector = {term: count * (math.log(total / (1 + self._document_frequency[term])) + 1.0) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def search(self, topic: str, theme: str = "") -> Optional[StoryMatch]:
+        """Returns the indexed story whose topic is most similar to ``topic`` (same theme first on ties), or None."""
+        with self._lock:
+            query = self._vector(Counter(topic_terms(topic)))
+            best_key, best = None, (0.0, False)
+            for key, (_, indexed_theme, counts) in self._terms.items():
+                vector = self._vector(counts)
+                score = (sum(weight * vector.get(term, 0.0) for term, weight in query.items()), indexed_theme == theme)
+                if score > best:
+                    best_key, best = key, score
+            if best_key is None:
+                return None
+            row = self._conn.execute("SELECT topic, theme, document FROM stories WHERE key = ?", (best_key,)).fetchone()
+        return StoryMatch(key=best_key, topic=row[0], theme=row[1], document=row[2], similarity=round(min(best[0], 1.0), 4))
+
+    def reuse_mode(self, match: Optional[StoryMatch], theme: str) -> str:
+        """Returns how a match is used for a new story of the theme: REUSE_HIT, REUSE_SEED or REUSE_MISS."""
+        if match and match.theme == theme and match.similarity >= self.reuse_threshold:
+            return REUSE_HIT
+        if match and self.seed_threshold is not None and match.similarity >= self.seed_threshold:
+            return REUSE_SEED
+        return REUSE_MISS
+
+    def lookup(self, topic: str, theme: str = "") -> tuple[str, Optional[StoryMatch]]:
+        """Searches the closest story and returns its reuse mode with it.
+
+        Only a story that is reused or seeded counts as used for the LRU eviction; the
+        best candidate of a miss keeps its access time.
+        """
+        match = self.search(topic, theme)
+        mode = self.reuse_mode(match, theme)
+        if mode != REUSE_MISS:
+            with self._lock:
+                self._conn.execute("UPDATE stories SET accessed_at = ? WHERE key = ?", (time.time(), match.key))
+                self._conn.commit()
+        return mode, match
+
+    def add(self, topic: str, theme: str, document: str):
+        """Stores the finished story of a topic, replacing an earlier one of the same topic and theme."""
+        key = self.story_key(topic, theme)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stories VALUES (?, ?, ?, ?, ?, ?)",
+                (key, topic, theme, document, now, now),
+            )
+            if key in self._terms:
+                self._remove_terms(key)
+            self._add_terms(key, topic, theme)
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drops the least recently used stories over the capacity."""
+        excess = len(self._terms) - self.max_stories
+        if excess <= 0:
+            return
+        victims = [key for (key,) in self._conn.execute("SELECT key FROM stories ORDER BY accessed_at ASC LIMIT ?", (excess,))]
+        self._conn.executemany("DELETE FROM stories WHERE key = ?", [(key,) for key in victims])
+        for key in victims:
+            self._remove_terms(key)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+
+_default_index: Optional[StoryIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_story_index() -> Optional[StoryIndex]:
+    """Returns the process-wide index configured by the environment (None if disabled)."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = StoryIndex.from_env()
+        return _default_index
+
+
+def build_seeded_writer(model: Union[str, BaseLlm], topic_key: str = "current_topic", document_key: str = "current_document") -> LlmAgent:
+    """Creates the writer that adapts the closest finished story to a new topic and theme."""
+    return LlmAgent(
+        name="SeededWriterAgent",
+        model=model,
+        include_contents='none',
+        instruction=f"""You are a Creative Writing Assistant. Write the *first draft* of a short story (aim for 3-6 sentences) for this topic and theme:
+
+    **Topic and Theme:**
+    ```{{{topic_key}}}```
+
+    **A Finished Story on a Similar Topic:**
+    ```
+    {{{STATE_SEED_STORY}}}
+    ```
+
+    Use the finished story as your starting point: keep what fits, and change the characters, details and tone wherever
+    the new topic or theme differs.
+    Output *only* the story text. Do not add introductions or explanations.
+""",
+        description="Writes the initial story by adapting a finished story on a similar topic.",
+        output_key=document_key,
+        before_model_callback=stream_output, # Stream the draft to the user as it is written
+    )
+
+
+class StoryReuseAgent(BaseAgent):
+    """
+    Replaces the initial writer step with a lookup in the StoryIndex.
+
+    - Same theme and a topic at least the index's ``reuse_threshold`` similar: the
+      finished story becomes the document and the refinement loop is skipped.
+    - A topic at least ``seed_threshold`` similar: the finished story is adapted by the
+      SeededWriterAgent, which usually needs fewer refinement rounds than a new draft.
+    - Otherwise the original writer step runs.
+    """
+
+    index: StoryIndex
+    writer_agent: BaseAgent
+    seeded_writer_agent: LlmAgent
+    topic_key: str
+    document_key: str
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    def __init__(self, name: str, writer_agent: BaseAgent, seeded_writer_agent: LlmAgent, **kwargs):
+        super().__init__(
+            name=name,
+            description="Reuses or adapts a finished story on a similar topic, or writes a new one.",
+            writer_agent=writer_agent,
+            seeded_writer_agent=seeded_writer_agent,
+            sub_agents=[writer_agent, seeded_writer_agent],
+            **kwargs,
+        )
+
+    def _event(self, ctx: InvocationContext, state_delta: dict) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta=state_delta),
+        )
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        topic, theme = split_topic(ctx.session.state.get(self.topic_key, ""))
+        mode, match = await asyncio.to_thread(self.index.lookup, topic, theme)
+        logger.info(f"[{self.name}] {mode} for {topic!r} ({theme})" + (f": {match.topic!r} ({match.theme}), similarity {match.similarity}" if match else ""))
+        reuse = {"mode": mode, "topic": match.topic, "theme": match.theme, "similarity": match.similarity} if match else {"mode": mode}
+
+        if mode == REUSE_HIT:
+            yield self._event(ctx, {self.document_key: match.document, STATE_STORY_REUSE: reuse, STATE_SKIP_REFINEMENT: True})
+            return
+        if mode == REUSE_SEED:
+            yield self._event(ctx, {STATE_SEED_STORY: match.document, STATE_STORY_REUSE: reuse, STATE_SKIP_REFINEMENT: False})
+            writer = self.seeded_writer_agent
+        else:
+            yield self._event(ctx, {STATE_STORY_REUSE: reuse, STATE_SKIP_REFINEMENT: False})
+            writer = self.writer_agent
+        async for event in writer.run_async(ctx):
+            yield event
+
+
+class StoryRecorderAgent(BaseAgent):
+    """Adds the finished story to the StoryIndex, unless it was reused or cut short by the latency budget."""
+
+    index: StoryIndex
+    topic_key: str
+    document_key: str
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    @override
+    async def _run_async_impl(
+        self, ctx: InvocationContext
+    ) -> AsyncGenerator[Event, None]:
+        state = ctx.session.state
+        reuse = dict(state.get(STATE_STORY_REUSE) or {})
+        document = state.get(self.document_key, "")
+        if reuse.get("mode") == REUSE_HIT or not document or state.get(STATE_REFINEMENT_EXIT_REASON) == EXIT_DEADLINE:
+            return
+        topic, theme = split_topic(state.get(self.topic_key, ""))
+        await asyncio.to_thread(self.index.add, topic, theme, document)
+        logger.info(f"[{self.name}] Indexed the story of {topic!r} ({theme}), {len(self.index)} stories.")
+        yield Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            actions=EventActions(state_delta={STATE_STORY_REUSE: {**reuse, "indexed": True}}),
+        )
+
+
+def with_story_reuse(
+    writing_steps: list[BaseAgent],
+    index: Optional[StoryIndex],
+    model: Union[str, BaseLlm],
+    topic_key: str = "current_topic",
+    document_key: str = "current_document",
+) -> list[BaseAgent]:
+    """Returns the writing steps, with the writer looked up in and the result added to the index.
+
+    Args:
+        writing_steps: The initial writer step followed by the refinement loop.
+        index: The story index, or None to keep the steps unchanged.
+        model: The model of the seeded writer.
+        topic_key: The state key of the topic and theme.
+        document_key: The state key of the story.
+    """
+    # Chapters are not indexed: a reused flash story is no answer to a long-form request, nor the reverse
+    if index is None or isinstance(writing_steps[0], LongFormWriterAgent):
+        return writing_steps
+    reuse_agent = StoryReuseAgent(
+        name="StoryReuseAgent",
+        writer_agent=writing_steps[0],
+        seeded_writer_agent=build_seeded_writer(model, topic_key, document_key),
+        index=index,
+        topic_key=topic_key,
+        document_key=document_key,
+    )
+    recorder = StoryRecorderAgent(name="StoryRecorderAgent", index=index, topic_key=topic_key, document_key=document_key)
+    return [reuse_agent, *writing_steps[1:], recorder]
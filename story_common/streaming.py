@@ -0,0 +1,115 @@
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from typing import Optional
+import difflib, logging, os, re
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Key of the progress payload in Event.custom_metadata
+PROGRESS_METADATA_KEY = "refinement_progress"
+# Request label with the agent's streaming choice ("on" / "off"); without it the RunConfig decides
+STREAM_LABEL = "story_stream"
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+
+
+def stream_setting() -> str:
+    """Returns STORY_STREAM: "auto" (follow the client's RunConfig), "on" or "off"."""
+    return os.environ.get("STORY_STREAM", "auto").lower()
+
+
+def run_config(client_streaming: bool = False, **kwargs) -> RunConfig:
+    """Returns the RunConfig of an invocation: SSE if the client asked for streaming, unless STORY_STREAM overrides it."""
+    setting = stream_setting()
+    streaming = setting == "on" or (setting != "off" and client_streaming)
+    return RunConfig(streaming_mode=StreamingMode.SSE if streaming else StreamingMode.NONE, **kwargs)
+
+
+def _label_streaming(llm_request: LlmRequest, streaming: bool):
+    llm_request.config = llm_request.config or types.GenerateContentConfig()
+    llm_request.config.labels = llm_request.config.labels or {}
+    llm_request.config.labels[STREAM_LABEL] = "on" if streaming else "off"
+
+
+def stream_requested(llm_request: LlmRequest, stream: bool) -> bool:
+    """Returns whether a model call streams: the agent's choice (STREAM_LABEL) if it made one, else ``stream``.
+
+    ADK derives ``stream`` from the invocation's RunConfig; the models call this so
+    each agent can stream or not without changing the RunConfig of the invocation.
+    """
+    labels = (llm_request.config.labels if llm_request.config else None) or {}
+    if labels.get(STREAM_LABEL) in ("on", "off"):
+        return labels[STREAM_LABEL] == "on"
+    return stream
+
+
+def stream_output(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback for agents whose text is shown to the user (writer, refiner).
+
+    With STORY_STREAM=on the agent streams its tokens (SSE) even if the client did not
+    ask for streaming; with "off" it never streams; with "auto" the client decides.
+    """
+    setting = stream_setting()
+    if setting in ("on", "off"):
+        _label_streaming(llm_request, setting == "on")
+    return None
+
+
+def no_stream(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback for agents whose output is parsed, not shown (critic, selector)."""
+    _label_streaming(llm_request, False)
+    return None
+
+
+def draft_diff(old: str, new: str) -> str:
+    """Returns a compact sentence-level diff between two drafts ("-" removed, "+" added)."""
+    old_sentences = [s for s in _SENTENCE.split((old or "").strip()) if s]
+    new_sentences = [s for s in _SENTENCE.split((new or "").strip()) if s]
+    lines = difflib.ndiff(old_sentences, new_sentences)
+    return "\n".join(line for line in lines if line.startswith(("- ", "+ ")))
+
+
+def progress_event(
+    ctx: InvocationContext,
+    author: str,
+    iteration: int,
+    max_iterations: int,
+    done: bool,
+    issues: list[str],
+    diff: str = "",
+) -> Event:
+    """Creates the progress event emitted after each refinement iteration.
+
+    The event is partial, so clients see it as it happens but it is neither stored in
+    the session nor replayed into later LLM prompts. The structured payload is in
+    custom_metadata["refinement_progress"].
+    """
+    if done:
+        text = f"[Refinement {iteration}/{max_iterations}] The critic has no further issues."
+    else:
+        text = f"[Refinement {iteration}/{max_iterations}] Addressed: " + "; ".join(issues)
+    return Event(
+        invocation_id=ctx.invocation_id,
+        author=author,
+        branch=ctx.branch,
+        partial=True,
+        content=types.Content(role="model", parts=[types.Part(text=text + "\n")]),
+        custom_metadata={
+            PROGRESS_METADATA_KEY: {
+                "iteration": iteration,
+                "max_iterations": max_iterations,
+                "done": done,
+                "issues": issues,
+                "diff": diff,
+            }
+        },
+    )
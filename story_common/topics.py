@@ -0,0 +1,127 @@
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+from pydantic import BaseModel
+from typing import Optional
+import logging, re
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# The themes offered in the topic collection prompts
+KNOWN_THEMES = (
+    "fantasy", "science fiction", "horror", "romance", "comedy", "drama",
+    "thriller", "mystery", "young adult", "middle grade",
+)
+THEME_ALIASES = {
+    "sci-fi": "science fiction",
+    "scifi": "science fiction",
+    "sf": "science fiction",
+    "romantic": "romance",
+    "comedic": "comedy",
+    "funny": "comedy",
+    "dramatic": "drama",
+    "ya": "young adult",
+}
+# Topics this short are too vague to write about (e.g. "a man smoking")
+MIN_TOPIC_WORDS = 4
+
+_STORY_FORMAT = re.compile(r"^\s*STORY:\s*\[\s*topic:\s*(?P<topic>.+),\s*theme:\s*(?P<theme>[^\]]+?)\s*\]\s*$", re.IGNORECASE | re.DOTALL)
+_LABELED = re.compile(
+    r"^\s*topic\s*[:=]\s*(?P<topic>.+?)\s*[,;\n]\s*theme\s*[:=]\s*(?P<theme>.+?)\s*\.?\s*$"
+    r"|^\s*theme\s*[:=]\s*(?P<theme2>.+?)\s*[,;\n]\s*topic\s*[:=]\s*(?P<topic2>.+?)\s*\.?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_THEMED_STORY = re.compile(
+    r"^\s*(?:(?:please\s+)?(?:write|give\s+me|tell\s+me)\s+)?(?:an?\s+)?(?P<theme>[a-z][a-z -]*?)\s+(?:flash\s+|short\s+)?story\s+about\s+(?P<topic>.+?)\s*[.!]?\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+
+
+class StoryTopic(BaseModel):
+    """A topic and theme pair in the STORY format used between the agents."""
+
+    topic: str
+    theme: str
+
+    def format(self) -> str:
+        """Renders the pair as "STORY: [topic: ..., theme: ...]"."""
+        return f"STORY: [topic: {self.topic}, theme: {self.theme}]"
+
+
+def normalize_theme(theme: str) -> Optional[str]:
+    """Returns the known theme the text names, or None if it is not in the vocabulary."""
+    theme = re.sub(r"\s+", " ", theme.strip().lower().rstrip("."))
+    theme = THEME_ALIASES.get(theme, theme)
+    return theme if theme in KNOWN_THEMES else None
+
+
+def parse_story_topic(text: str) -> Optional[StoryTopic]:
+    """Parses "STORY: [topic: ..., theme: ...]".
+
+    This is the format check of the topic confirmation step: any non-empty topic and
+    theme are accepted as long as they differ, and the theme need not be a known one.
+
+    Returns: The topic and theme, or None if the text is not in the format.
+    """
+    match = _STORY_FORMAT.match(text or "")
+    if not match:
+        return None
+    topic, theme = match.group("topic").strip(), match.group("theme").strip()
+    if not topic or not theme or topic.lower() == theme.lower():
+        return None
+    return StoryTopic(topic=topic, theme=theme)
+
+
+def extract_topic(text: str) -> Optional[StoryTopic]:
+    """Extracts a topic and theme from well-formed user input without an LLM call.
+
+    Accepted forms are the STORY format itself, labeled fields ("topic: ..., theme:
+    ..."), and "a <theme> story about <topic>". The theme must be one of
+    KNOWN_THEMES (or an alias) and the topic must have at least MIN_TOPIC_WORDS
+    words. Anything else is left to the topic collector agent.
+
+    Returns: The topic and theme, or None if the input is ambiguous.
+    """
+    text = (text or "").strip()
+    topic = theme = None
+    match = _STORY_FORMAT.match(text)
+    if match:
+        topic, theme = match.group("topic"), match.group("theme")
+    elif match := _LABELED.match(text):
+        topic = match.group("topic") or match.group("topic2")
+        theme = match.group("theme") or match.group("theme2")
+    elif match := _THEMED_STORY.match(text):
+        topic, theme = match.group("topic"), match.group("theme")
+    if topic is None:
+        return None
+
+    theme = normalize_theme(theme)
+    topic = topic.strip().rstrip(".")
+    if theme is None or len(topic.split()) < MIN_TOPIC_WORDS or topic.lower() == theme:
+        return None
+    return StoryTopic(topic=topic, theme=theme)
+
+
+def text_response(text: str) -> LlmResponse:
+    """Creates a model response with the given text, answered locally instead of by the LLM."""
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def extract_topic_locally(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """before_model_callback for topic collectors that skips the LLM for well-formed input.
+
+    If the latest user message names a known theme and a clear topic, the STORY line
+    is returned as the agent's response. Otherwise the LLM is asked as usual.
+    """
+    if not llm_request.contents or llm_request.contents[-1].role != "user":
+        return None
+    parts = llm_request.contents[-1].parts or []
+    story_topic = extract_topic(parts[0].text if parts else "")
+    if story_topic is None:
+        return None
+    logger.info(f"[{callback_context.agent_name}] Topic extracted locally: {story_topic.format()}")
+    return text_response(story_topic.format())
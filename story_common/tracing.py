@@ -0,0 +1,130 @@
+from collections import OrderedDict, deque
+from google.adk.events import Event
+from typing import Optional
+import json, logging, os, threading, zlib
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+DEFAULT_TRACE_LEVEL = "DEBUG"
+DEFAULT_SAMPLE_RATE = 1.0
+DEFAULT_BUFFER_SIZE = 50
+DEFAULT_MAX_SESSIONS = 1000
+
+
+def summarize_event(event: Event) -> dict:
+    """Returns the few event fields worth keeping in memory, without serializing the content."""
+    summary = {
+        "ts": round(event.timestamp, 3),
+        "id": event.id,
+        "author": event.author,
+    }
+    if event.content and event.content.parts:
+        text = "".join(part.text or "" for part in event.content.parts)
+        if text:
+            summary["text"] = text[:200]
+        calls = [part.function_call.name for part in event.content.parts if part.function_call]
+        if calls:
+            summary["function_calls"] = calls
+    if event.actions.state_delta:
+        summary["state_keys"] = sorted(event.actions.state_delta)
+    if event.actions.escalate:
+        summary["escalate"] = True
+    if event.error_code or event.error_message:
+        summary["error"] = event.error_code or event.error_message
+    return summary
+
+
+class EventTracer:
+    """
+    Traces agent events as compact one-line JSON, only when the log level is enabled.
+
+    Whole sessions are sampled by a hash of their id, so a sampled session is traced
+    completely. Independently of the log level, a short summary of the last events of
+    every session is kept in a bounded ring buffer that can be dumped on error.
+    """
+
+    def __init__(
+        self,
+        trace_logger: Optional[logging.Logger] = None,
+        level: int = logging.DEBUG,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+    ):
+        """
+        Initializes the EventTracer.
+
+        Args:
+            trace_logger: The logger to write to. Defaults to this module's logger.
+            level: The level of the per-event trace lines.
+            sample_rate: The fraction of sessions whose events are logged (0.0 to 1.0).
+            buffer_size: The number of recent events kept per session.
+            max_sessions: The number of sessions with a buffer; the least recent are dropped.
+        """
+        self.logger = trace_logger or logger
+        self.level = level
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.max_sessions = max_sessions
+        self._buffers: OrderedDict[str, deque] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, trace_logger: Optional[logging.Logger] = None) -> "EventTracer":
+        """Creates a tracer configured by STORY_TRACE_LEVEL, _SAMPLE_RATE and _BUFFER_SIZE."""
+        level = logging.getLevelName(os.environ.get("STORY_TRACE_LEVEL", DEFAULT_TRACE_LEVEL).upper())
+        return cls(
+            trace_logger=trace_logger,
+            level=level if isinstance(level, int) else logging.DEBUG,
+            sample_rate=float(os.environ.get("STORY_TRACE_SAMPLE_RATE", DEFAULT_SAMPLE_RATE)),
+            buffer_size=int(os.environ.get("STORY_TRACE_BUFFER_SIZE", DEFAULT_BUFFER_SIZE)),
+        )
+
+    def sampled(self, session_id: str) -> bool:
+        """Returns whether the events of the session are logged."""
+        if self.sample_rate >= 1.0:
+            return True
+        return zlib.crc32(session_id.encode("utf-8")) % 10_000 < self.sample_rate * 10_000
+
+    def trace(self, session_id: str, source: str, event: Event):
+        """Records a complete event in the session's ring buffer and logs any event if enabled and sampled."""
+        # Streamed chunks would push the complete events out of the buffer
+        if not event.partial:
+            summary = summarize_event(event)
+            summary["source"] = source
+            with self._lock:
+                buffer = self._buffers.get(session_id)
+                if buffer is None:
+                    buffer = self._buffers[session_id] = deque(maxlen=self.buffer_size)
+                    if len(self._buffers) > self.max_sessions:
+                        self._buffers.popitem(last=False)
+                else:
+                    self._buffers.move_to_end(session_id)
+                buffer.append(summary)
+
+        if self.logger.isEnabledFor(self.level) and self.sampled(session_id):
+            record = {
+                "session": session_id,
+                "source": source,
+                "event": event.model_dump(mode="json", exclude_none=True),
+            }
+            self.logger.log(self.level, json.dumps(record, separators=(",", ":"), ensure_ascii=False))
+
+    def recent(self, session_id: str) -> list[dict]:
+        """Returns the buffered event summaries of the session, oldest first."""
+        with self._lock:
+            return list(self._buffers.get(session_id, ()))
+
+    def dump(self, session_id: str, reason: str = "") -> list[dict]:
+        """Logs the buffered events of the session at ERROR level, one line each, and returns them."""
+        events = self.recent(session_id)
+        self.logger.error(f"[Trace] Last {len(events)} event(s) of session {session_id}: {reason}")
+        for summary in events:
+            self.logger.error(json.dumps(summary, separators=(",", ":"), ensure_ascii=False))
+        return events
+
+    def discard(self, session_id: str):
+        """Drops the buffer of a finished session."""
+        with self._lock:
+            self._buffers.pop(session_id, None)
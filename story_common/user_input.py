@@ -0,0 +1,142 @@
+from google.adk.agents.invocation_context import InvocationContext
+from abc import ABC, abstractmethod
+from collections import Counter
+from typing import Optional
+from typing_extensions import override
+import asyncio, logging, os
+
+from .checkpoint import CheckpointedSequentialAgent
+
+logger = logging.getLogger(__name__)
+
+# --- Constants ---
+# Set while a session waits for the user to complete the topic in the next turn
+STATE_AWAITING_INPUT = "awaiting_user_input"
+# How missing input is collected:
+#   "turn"    end the invocation and continue with the user's next message (works with adk run and adk web)
+#   "console" ask in the terminal without blocking the event loop
+#   "queue"   wait for submit_input() from another task, e.g. a web frontend
+INPUT_MODE_TURN = "turn"
+INPUT_MODE_CONSOLE = "console"
+INPUT_MODE_QUEUE = "queue"
+DEFAULT_INPUT_TIMEOUT = 300.0
+
+
+class InputChannel(ABC):
+    """Delivers user input to one waiting session without blocking other sessions."""
+
+    @abstractmethod
+    async def ask(self, session_id: str, prompt: str, timeout: Optional[float] = None) -> Optional[str]:
+        """Waits for the user's answer. Returns None if it did not arrive within the timeout."""
+
+
+class ConsoleInputChannel(InputChannel):
+    """
+    Reads answers from the terminal in a worker thread.
+
+    Only the asking session waits; the event loop keeps serving the others. There is a
+    single terminal, so concurrent questions are answered one after the other. A read
+    that timed out stays pending and is handed to the next question instead of
+    starting a second reader on stdin.
+    """
+
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self._pending_read: Optional[asyncio.Future] = None
+
+    @override
+    async def ask(self, session_id: str, prompt: str, timeout: Optional[float] = None) -> Optional[str]:
+        async with self._lock:
+            print(prompt, end="", flush=True)
+            if self._pending_read is None or self._pending_read.done():
+                self._pending_read = asyncio.ensure_future(asyncio.to_thread(input))
+            try:
+                answer = await asyncio.wait_for(asyncio.shield(self._pending_read), timeout)
+            except asyncio.TimeoutError:
+                logger.info(f"[Input] No console input for session {session_id} within {timeout}s.")
+                return None
+            self._pending_read = None
+            return answer.strip()
+
+
+class QueueInputChannel(InputChannel):
+    """Per-session queues fed by submit(), e.g. from a web request handler."""
+
+    def __init__(self):
+        self._queues: dict[str, asyncio.Queue] = {}
+        # Number of pending asks per session; asks on the same session may overlap
+        self._waiting: Counter[str] = Counter()
+
+    def _queue(self, session_id: str) -> asyncio.Queue:
+        return self._queues.setdefault(session_id, asyncio.Queue())
+
+    def submit(self, session_id: str, text: str):
+        """Delivers the user's answer to the session."""
+        self._queue(session_id).put_nowait(text)
+
+    def waiting_sessions(self) -> list[str]:
+        """Returns the sessions currently waiting for an answer."""
+        return sorted(+self._waiting)
+
+    @override
+    async def ask(self, session_id: str, prompt: str, timeout: Optional[float] = None) -> Optional[str]:
+        self._waiting[session_id] += 1
+        try:
+            return (await asyncio.wait_for(self._queue(session_id).get(), timeout)).strip()
+        except asyncio.TimeoutError:
+            logger.info(f"[Input] No input for session {session_id} within {timeout}s.")
+            return None
+        finally:
+            self._waiting[session_id] -= 1
+            if not self._waiting[session_id]:
+                del self._waiting[session_id]
+                # Keep the queue while another ask waits on it or an answer is still unread
+                queue = self._queues.get(session_id)
+                if queue is not None and queue.empty():
+                    self._queues.pop(session_id, None)
+
+
+_console_channel = ConsoleInputChannel()
+_queue_channel = QueueInputChannel()
+
+
+def input_mode() -> str:
+    """Returns STORY_USER_INPUT: "turn" (default), "console" or "queue"."""
+    return os.environ.get("STORY_USER_INPUT", INPUT_MODE_TURN).lower()
+
+
+def input_timeout() -> float:
+    """Returns how long a session waits for input, from STORY_USER_INPUT_TIMEOUT (seconds)."""
+    return float(os.environ.get("STORY_USER_INPUT_TIMEOUT", DEFAULT_INPUT_TIMEOUT))
+
+
+def get_input_channel() -> Optional[InputChannel]:
+    """Returns the channel of the configured input mode, or None for event-driven turns."""
+    mode = input_mode()
+    if mode == INPUT_MODE_CONSOLE:
+        return _console_channel
+    if mode == INPUT_MODE_QUEUE:
+        return _queue_channel
+    return None
+
+
+def submit_input(session_id: str, text: str):
+    """Answers a session waiting in "queue" mode."""
+    _queue_channel.submit(session_id, text)
+
+
+class TurnAwareSequentialAgent(CheckpointedSequentialAgent):
+    """
+    A checkpointed SequentialAgent that ends the turn while the session waits for user input.
+
+    When a sub-agent sets state["awaiting_user_input"], the remaining sub-agents are
+    skipped, so the invocation ends and the user's next message starts the sequence
+    again from the stage that asked.
+    """
+
+    @override
+    def _should_stop(self, ctx: InvocationContext) -> bool:
+        if ctx.session.state.get(STATE_AWAITING_INPUT):
+            logger.info(f"[{self.name}] Waiting for user input. Ending the turn.")
+            return True
+        return False
@@ -0,0 +1,9 @@
+import os, sys
+
+# The packages are imported from the repository root, as adk run / adk web do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the tests off the disk and away from real models: no checkpoints, response cache or story index
+os.environ["STORY_CHECKPOINT"] = "off"
+os.environ["STORY_LLM_CACHE"] = "off"
+os.environ["STORY_REUSE"] = "off"
@@ -0,0 +1,33 @@
+import asyncio, json
+import pytest
+
+from llm_story_writer import batch
+from llm_story_writer.agent import story_writing_pipeline
+from story_common.mock_llm import MockLlm, install_model
+
+RECORDS = [
+    {"id": "1", "topic": "a lighthouse keeper who finds a map", "theme": "horror"},
+    {"id": "2", "topic": "two rival bakers share one oven", "theme": "romance"},
+    {"id": "3", "topic": "a wizard who opens a driving school", "theme": "comedy"},
+]
+
+
+def test_resumed_run_skips_the_finished_records(tmp_path):
+    input_path, output_path = tmp_path / "topics.jsonl", tmp_path / "stories.jsonl"
+    input_path.write_text("".join(json.dumps(record) + "\n" for record in RECORDS))
+    output_path.write_text(json.dumps({"id": "1", "current_document": "The lamp was dark."}) + "\n"
+                           + json.dumps({"id": "2", "error": "TimeoutError()"}) + "\n")
+    model = MockLlm()
+    install_model(story_writing_pipeline, model)
+
+    summary = asyncio.run(batch.run_batch(str(input_path), str(output_path), concurrency=2, run_id="run1"))
+
+    assert (summary["stories"], summary["failed"], summary["skipped"]) == (2, 0, 1)
+    assert model.calls["InitialWriterAgent"] == 2
+    ids = [json.loads(line)["id"] for line in output_path.read_text().splitlines()]
+    assert sorted(ids) == ["1", "2", "2", "3"]
+
+
+def test_missing_input_file_fails_the_run(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(batch.run_batch(str(tmp_path / "missing.jsonl"), str(tmp_path / "stories.jsonl")))
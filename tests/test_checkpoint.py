@@ -0,0 +1,92 @@
+from google.adk.agents import SequentialAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+import asyncio, time
+import pytest
+
+from story_common.checkpoint import (
+    Checkpoint, Checkpointer, CheckpointStore, STATE_COMPLETED_STAGES, STATE_REQUEST_FINGERPRINT,
+    STATE_RESUMED_FROM, request_fingerprint, session_key,
+)
+
+TOPIC = "STORY: [topic: a keeper who finds a map, theme: horror]"
+
+
+def make_context(topic: str = TOPIC, message: str = "go") -> InvocationContext:
+    async def create():
+        service = InMemorySessionService()
+        session = await service.create_session(app_name="app", user_id="user", session_id="batch_1", state={"current_topic": topic})
+        return service, session
+
+    service, session = asyncio.run(create())
+    return InvocationContext(
+        session_service=service,
+        invocation_id="e-1",
+        agent=SequentialAgent(name="Pipeline"),
+        session=session,
+        user_content=types.Content(role="user", parts=[types.Part(text=message)]),
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    return CheckpointStore(str(tmp_path / "checkpoints.sqlite3"))
+
+
+def test_store_keeps_the_latest_checkpoint(store):
+    store.save("app/user/s", Checkpoint(stage="InitialWriterAgent", state={"current_document": "draft"}))
+    store.save("app/user/s", Checkpoint(stage="StoryRefinementLoop round 1", state={"current_document": "revision"}))
+    checkpoint = store.load("app/user/s")
+    assert checkpoint.stage == "StoryRefinementLoop round 1"
+    assert checkpoint.state == {"current_document": "revision"}
+    store.delete("app/user/s")
+    assert store.load("app/user/s") is None
+
+
+def test_begin_without_store_does_nothing():
+    assert asyncio.run(Checkpointer("Pipeline", None).begin(make_context())) is None
+
+
+def test_begin_without_checkpoint_resets_the_stages(store):
+    ctx = make_context()
+    event = asyncio.run(Checkpointer("Pipeline", store).begin(ctx))
+    assert event.actions.state_delta == {
+        STATE_COMPLETED_STAGES: [],
+        STATE_RESUMED_FROM: None,
+        STATE_REQUEST_FINGERPRINT: request_fingerprint(ctx),
+    }
+
+
+def test_begin_restores_the_checkpoint_of_the_same_request(store):
+    ctx = make_context()
+    store.save(session_key(ctx), Checkpoint(
+        stage="StoryRefinementLoop round 2",
+        state={
+            STATE_COMPLETED_STAGES: ["InitialWriterAgent"],
+            "current_document": "The lamp was dark.",
+            "refinement_completed_rounds": 2,
+            "chapter_3_refinement_completed_rounds": 1,
+        },
+        request=request_fingerprint(ctx),
+    ))
+    delta = asyncio.run(Checkpointer("Pipeline", store).begin(ctx)).actions.state_delta
+    assert delta["current_document"] == "The lamp was dark."
+    assert delta[STATE_COMPLETED_STAGES] == ["InitialWriterAgent"]
+    assert delta[STATE_RESUMED_FROM] == "StoryRefinementLoop round 2"
+    assert delta["refinement_resume_rounds"] == 2
+    assert delta["chapter_3_refinement_resume_rounds"] == 1
+
+
+def test_begin_discards_the_checkpoint_of_another_request(store):
+    ctx = make_context()
+    store.save(session_key(ctx), Checkpoint(stage="InitialWriterAgent", request=request_fingerprint(make_context(message="other"))))
+    delta = asyncio.run(Checkpointer("Pipeline", store).begin(ctx)).actions.state_delta
+    assert delta[STATE_RESUMED_FROM] is None
+    assert store.load(session_key(ctx)) is None
+
+
+def test_expired_checkpoints_are_not_loaded(tmp_path):
+    store = CheckpointStore(str(tmp_path / "checkpoints.sqlite3"), ttl=60)
+    store.save("app/user/old", Checkpoint(stage="InitialWriterAgent", updated_at=time.time() - 120))
+    assert store.load("app/user/old") is None
@@ -0,0 +1,26 @@
+import pytest
+
+from story_common.config import StoryConfig
+
+
+def test_defaults_without_environment(monkeypatch):
+    for variable in ("STORY_CONVERGENCE_THRESHOLD", "STORY_LATENCY_BUDGET", "STORY_CRITICS", "STORY_HISTORY_TURNS"):
+        monkeypatch.delenv(variable, raising=False)
+    config = StoryConfig.from_env()
+    assert config.latency_budget is None and config.critics == []
+
+
+@pytest.mark.parametrize("off", ["0", "off", "False"])
+def test_optional_options_can_be_turned_off(monkeypatch, off):
+    for variable in ("STORY_CONVERGENCE_THRESHOLD", "STORY_LATENCY_BUDGET", "STORY_HISTORY_TURNS"):
+        monkeypatch.setenv(variable, off)
+    config = StoryConfig.from_env()
+    assert (config.convergence_threshold, config.latency_budget, config.history_turns) == (None, None, None)
+
+
+def test_options_are_parsed(monkeypatch):
+    monkeypatch.setenv("STORY_LATENCY_BUDGET", "12.5")
+    monkeypatch.setenv("STORY_CRITICS", "coherence, clarity,")
+    monkeypatch.setenv("STORY_NUM_DRAFTS", "3")
+    config = StoryConfig.from_env()
+    assert (config.latency_budget, config.critics, config.num_drafts) == (12.5, ["coherence", "clarity"], 3)
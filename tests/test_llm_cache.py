@@ -0,0 +1,69 @@
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+import pytest
+
+from story_common import llm_cache
+from story_common.llm_cache import ResponseCache
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock)
+    return clock
+
+
+def response(text: str) -> list[LlmResponse]:
+    return [LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))]
+
+
+def test_hit_returns_the_stored_responses(clock):
+    cache = ResponseCache(":memory:")
+    assert cache.get("a", agent="CriticAgent") is None
+    cache.put("a", response("verdict"), agent="CriticAgent")
+    assert cache.get("a", agent="CriticAgent")[0].content.parts[0].text == "verdict"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["per_agent"]["CriticAgent"] == {"hits": 1, "misses": 1}
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(":memory:", ttl_seconds=60)
+    cache.put("a", response("old"))
+    clock.now += 59
+    assert cache.get("a") is not None
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_read_entry_is_evicted_first(clock):
+    cache = ResponseCache(":memory:", max_entries=2)
+    cache.put("a", response("a"))
+    clock.now += 1
+    cache.put("b", response("b"))
+    clock.now += 1
+    cache.get("a")
+    clock.now += 1
+    cache.put("c", response("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_size_limit_evicts_until_the_store_fits(clock):
+    cache = ResponseCache(":memory:", max_bytes=400)
+    for key in ("a", "b", "c"):
+        cache.put(key, response(key * 100))
+        clock.now += 1
+    assert cache.stats()["bytes"] <= 400
+    assert cache.get("c") is not None
+    assert cache.get("a") is None
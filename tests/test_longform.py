@@ -0,0 +1,41 @@
+from story_common.longform import ChapterPlan, chapter_instruction, parse_continuity_notes, parse_outline
+
+
+def test_parse_outline_json():
+    text = 'Here is the outline: [{"title": "The Map", "summary": "The keeper finds a map."}, {"title": "The Harbor"}]'
+    assert parse_outline(text, 2) == [
+        ChapterPlan(title="The Map", summary="The keeper finds a map."),
+        ChapterPlan(title="The Harbor", summary="The Harbor"),
+    ]
+
+
+def test_parse_outline_numbered_lines():
+    text = "1. The Map: The keeper finds a map.\nChapter 2) The Harbor: He sails to it."
+    assert parse_outline(text, 2) == [
+        ChapterPlan(title="The Map", summary="The keeper finds a map."),
+        ChapterPlan(title="The Harbor", summary="He sails to it."),
+    ]
+
+
+def test_parse_outline_fills_and_truncates_to_the_chapter_count():
+    plans = parse_outline('[{"title": "The Map", "summary": "A map."}]', 3)
+    assert [plan.title for plan in plans] == ["The Map", "Chapter 2", "Chapter 3"]
+    assert plans[-1].summary == "Bring the story to its ending."
+    assert len(parse_outline("1. A: a\n2. B: b\n3. C: c", 2)) == 2
+    assert [plan.title for plan in parse_outline("no outline at all", 2)] == ["Chapter 1", "Chapter 2"]
+
+
+def test_parse_continuity_notes():
+    text = '[{"chapter": 2, "issue": "The keeper is named Tom, not Tim."}, {"chapter": 9, "issue": "out of range"}, {"chapter": "x"}]'
+    assert parse_continuity_notes(text, 3) == {2: ["The keeper is named Tom, not Tim."]}
+    assert parse_continuity_notes("[]", 3) == {}
+
+
+def test_chapter_instruction_drops_the_flash_story_length():
+    critic = "You are a Constructive Critic AI reviewing a short story draft (typically 3-6 sentences) for a flash story. Your goal is ..."
+    assert chapter_instruction(critic) == (
+        "You are a Constructive Critic AI reviewing a chapter draft (typically 6-10 sentences) of a longer story. Your goal is ..."
+    )
+    panel_critic = "You are a Constructive Critic AI reviewing a short story draft for a flash story. You only judge its pacing."
+    assert "flash" not in chapter_instruction(panel_critic)
+    assert chapter_instruction("Refine the story based on critique.") == "Refine the story based on critique."
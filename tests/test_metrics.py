@@ -0,0 +1,12 @@
+from types import SimpleNamespace
+
+from story_common import metrics
+
+
+def test_start_times_of_failed_calls_are_bounded(monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_IN_FLIGHT_CALLS", 2)
+    monkeypatch.setattr(metrics, "_call_started", metrics.OrderedDict())
+    for invocation_id in ("e-1", "e-2", "e-3"):
+        # The calls raise, so record_model_end never pops their start times
+        metrics.record_model_start(SimpleNamespace(invocation_id=invocation_id, agent_name="CriticAgent"), None)
+    assert list(metrics._call_started) == [("e-2", "CriticAgent"), ("e-3", "CriticAgent")]
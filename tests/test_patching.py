@@ -0,0 +1,51 @@
+import pytest
+
+from story_common.patching import PatchError, SentenceEdit, apply_patch, number_sentences, parse_patch
+
+STORY = "The lamp was dark. The keeper climbed the stairs!\n\nA map lay on the desk. It showed no harbor."
+
+
+def test_number_sentences_keeps_paragraphs():
+    assert number_sentences(STORY) == (
+        "[1] The lamp was dark.\n[2] The keeper climbed the stairs!\n\n[3] A map lay on the desk.\n[4] It showed no harbor."
+    )
+
+
+def test_parse_patch_accepts_fenced_list_and_edits_object():
+    edits = parse_patch('```json\n[{"op": "delete", "index": 2}]\n```')
+    assert edits == [SentenceEdit(op="delete", index=2)]
+    assert parse_patch('{"edits": [{"op": "insert", "index": 0, "text": "Night fell."}]}')[0].op == "insert"
+
+
+@pytest.mark.parametrize("text", ["no json here", '{"op": "delete"}', '[{"op": "rename", "index": 1}]', "[1, 2"])
+def test_parse_patch_rejects_invalid_output(text):
+    with pytest.raises(PatchError):
+        parse_patch(text)
+
+
+def test_apply_patch_indexes_refer_to_the_unedited_story():
+    edits = [
+        SentenceEdit(op="delete", index=2),
+        SentenceEdit(op="replace", index=4, text="It showed a harbor that did not exist."),
+        SentenceEdit(op="insert", index=0, text="Night fell."),
+        SentenceEdit(op="insert", index=3, text="Its ink was still wet."),
+    ]
+    assert apply_patch(STORY, edits) == (
+        "Night fell. The lamp was dark.\n\nA map lay on the desk. Its ink was still wet. It showed a harbor that did not exist."
+    )
+
+
+def test_apply_patch_without_edits_keeps_the_story():
+    assert apply_patch(STORY, []) == STORY
+
+
+@pytest.mark.parametrize("edits", [
+    [SentenceEdit(op="replace", index=5, text="Out of range.")],
+    [SentenceEdit(op="insert", index=5, text="Out of range.")],
+    [SentenceEdit(op="delete", index=1), SentenceEdit(op="replace", index=1, text="Twice.")],
+    [SentenceEdit(op="replace", index=1, text="  ")],
+    [SentenceEdit(op="insert", index=1)],
+])
+def test_apply_patch_rejects_invalid_edits(edits):
+    with pytest.raises(PatchError):
+        apply_patch(STORY, edits)
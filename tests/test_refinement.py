@@ -0,0 +1,83 @@
+from google.adk.agents import LlmAgent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+import asyncio
+
+from story_common.mock_llm import MockLlm
+from story_common.refinement import (
+    CriticVerdict, EXIT_CONVERGED, EXIT_CRITIC_DONE, RefinementLoopAgent, STATE_REFINEMENT_EXIT_REASON,
+    STATE_REFINEMENT_ITERATION, parse_verdict,
+)
+
+COMPLETION_PHRASE = "No major issues found."
+
+
+def test_parse_verdict_json():
+    verdict = parse_verdict('{"done": false, "issues": ["The ending is abrupt.", "  "]}')
+    assert verdict == CriticVerdict(done=False, issues=["The ending is abrupt."])
+
+
+def test_parse_verdict_json_in_code_fence():
+    verdict = parse_verdict('```json\n{"done": true, "issues": []}\n```')
+    assert verdict.done and verdict.issues == []
+
+
+def test_parse_verdict_without_issues_is_done():
+    assert parse_verdict('{"done": false, "issues": []}').done
+
+
+def test_parse_verdict_completion_phrase_ignores_case_and_punctuation():
+    assert parse_verdict("no major issues found", COMPLETION_PHRASE).done
+    assert parse_verdict("").done
+
+
+def test_parse_verdict_free_form_critique():
+    verdict = parse_verdict("- The keeper's name changes.\n\n* The map is never explained.", COMPLETION_PHRASE)
+    assert not verdict.done
+    assert verdict.issues == ["The keeper's name changes.", "The map is never explained."]
+    assert verdict.as_criticism() == "- The keeper's name changes.\n- The map is never explained."
+
+
+STORY = (
+    "Nobody had lit the lamp in forty years, yet the lighthouse keeper found a map folded inside it. "
+    "It showed the harbor, but not as it had ever looked. That night the tide went out and did not come back, "
+    "and the keeper walked the dry harbor floor to the place on the map."
+)
+
+
+NOT_DONE = '{{"done": false, "issues": ["Needs a stronger opening sentence"]}}'
+DONE = '{{"done": true, "issues": []}}'
+
+
+def run_loop(critic_script: list, refiner_script: list, convergence_threshold: float = 0.8) -> tuple[dict, MockLlm]:
+    model = MockLlm(script={"CriticAgent": critic_script, "RefinerAgent": refiner_script})
+    loop = RefinementLoopAgent(
+        name="StoryRefinementLoop",
+        critic_agent=LlmAgent(name="CriticAgent", model=model, instruction="Review {current_document}", output_key="criticism"),
+        refiner_agent=LlmAgent(name="RefinerAgent", model=model, instruction="Revise {current_document}", output_key="current_document"),
+        convergence_threshold=convergence_threshold,
+    )
+
+    async def run():
+        runner = Runner(agent=loop, app_name="app", session_service=InMemorySessionService())
+        session = await runner.session_service.create_session(app_name="app", user_id="user", state={"current_document": STORY})
+        message = types.Content(role="user", parts=[types.Part(text="go")])
+        async for _ in runner.run_async(user_id="user", session_id=session.id, new_message=message):
+            pass
+        return (await runner.session_service.get_session(app_name="app", user_id="user", session_id=session.id)).state
+
+    return asyncio.run(run()), model
+
+
+def test_one_small_revision_is_checked_by_the_critic():
+    state, model = run_loop([NOT_DONE, DONE], [STORY + " (revision {call})"])
+    assert state[STATE_REFINEMENT_EXIT_REASON] == EXIT_CRITIC_DONE
+    assert model.calls["CriticAgent"] == 2
+
+
+def test_consecutive_small_revisions_converge():
+    state, model = run_loop([NOT_DONE], [STORY + " (revision {call})"])
+    assert state[STATE_REFINEMENT_EXIT_REASON] == EXIT_CONVERGED
+    assert state[STATE_REFINEMENT_ITERATION] == 2
+    assert model.calls["RefinerAgent"] == 2
@@ -0,0 +1,39 @@
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+import asyncio, importlib
+import pytest
+
+from story_common.mock_llm import MockLlm, install_model
+from story_common.refinement import STATE_REFINEMENT_EXIT_REASON
+
+# The user's messages of one story per package: llm_story_writer's assistant proposes
+# the topic and starts the pipeline once it is confirmed
+MESSAGES = {
+    "llm_story_writer": ["a horror story about a lighthouse keeper who finds a map", "Yes, please write it."],
+    "interact_story_writer": ["a horror story about a lighthouse keeper who finds a map"],
+    "custom_story_writer": ["a horror story about a lighthouse keeper who finds a map"],
+}
+
+
+async def write_story(package: str) -> tuple[dict, MockLlm]:
+    agent = importlib.import_module(f"{package}.agent").root_agent
+    model = MockLlm()
+    install_model(agent, model)
+    runner = Runner(agent=agent, app_name=package, session_service=InMemorySessionService())
+    session = await runner.session_service.create_session(app_name=package, user_id="user")
+    for text in MESSAGES[package]:
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        async for _ in runner.run_async(user_id="user", session_id=session.id, new_message=message):
+            pass
+    session = await runner.session_service.get_session(app_name=package, user_id="user", session_id=session.id)
+    return session.state, model
+
+
+@pytest.mark.parametrize("package", sorted(MESSAGES))
+def test_writes_and_refines_a_story(package):
+    state, model = asyncio.run(write_story(package))
+    assert state.get("current_document")
+    assert state.get(STATE_REFINEMENT_EXIT_REASON) is not None
+    assert model.calls.get("InitialWriterAgent") == 1
+    assert model.calls.get("CriticAgent", 0) >= 1
@@ -0,0 +1,75 @@
+import pytest
+
+from story_common import story_index
+from story_common.story_index import REUSE_HIT, REUSE_MISS, REUSE_SEED, StoryIndex
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+
+    def tick() -> float:
+        now[0] += 1
+        return now[0]
+
+    monkeypatch.setattr(story_index.time, "time", tick)
+
+
+def test_search_returns_the_most_similar_topic(clock):
+    index = StoryIndex(":memory:")
+    assert index.search("a lighthouse keeper who finds a map") is None
+    index.add("a lighthouse keeper who finds a map", "horror", "The lamp was dark.")
+    index.add("two rival bakers share one oven", "romance", "The oven was warm.")
+
+    match = index.search("the lighthouse keeper finds a strange map", "horror")
+    assert match.document == "The lamp was dark."
+    assert 0 < match.similarity < 1
+    assert index.search("a lighthouse keeper who finds a map", "horror").similarity == pytest.approx(1.0)
+
+
+def test_search_prefers_the_same_theme_on_ties(clock):
+    index = StoryIndex(":memory:")
+    index.add("a keeper who finds a map", "horror", "horror story")
+    index.add("a keeper who finds a map", "comedy", "comedy story")
+    assert index.search("a keeper who finds a map", "comedy").document == "comedy story"
+    assert index.search("a keeper who finds a map", "horror").document == "horror story"
+
+
+def test_add_replaces_the_story_of_the_same_topic(clock):
+    index = StoryIndex(":memory:")
+    index.add("a keeper who finds a map", "horror", "first")
+    index.add("A keeper who finds a map!", "horror", "second")
+    assert len(index) == 1
+    assert index.search("a keeper who finds a map", "horror").document == "second"
+
+
+def test_lookup_classifies_the_match():
+    index = StoryIndex(":memory:")
+    index.add("a lighthouse keeper who finds a map", "horror", "The lamp was dark.")
+    assert index.lookup("a lighthouse keeper who finds a map", "horror")[0] == REUSE_HIT
+    assert index.lookup("a lighthouse keeper who finds a map", "comedy")[0] == REUSE_SEED
+    assert index.lookup("two rival bakers share one oven", "romance") == (REUSE_MISS, None)
+
+
+def test_least_recently_used_story_is_evicted(clock):
+    index = StoryIndex(":memory:", max_stories=2)
+    index.add("a lighthouse keeper who finds a map", "horror", "lighthouse")
+    index.add("two rival bakers share one oven", "romance", "bakers")
+    assert index.lookup("a lighthouse keeper who finds a map", "horror")[0] == REUSE_HIT
+    index.add("a retired wizard opens a driving school", "comedy", "wizard")
+
+    assert len(index) == 2
+    assert index.search("rival bakers oven", "romance") is None
+    assert index.search("lighthouse keeper map", "horror").document == "lighthouse"
+
+
+def test_misses_do_not_refresh_the_closest_story(clock):
+    index = StoryIndex(":memory:", max_stories=2)
+    index.add("a lighthouse keeper who finds a map", "horror", "lighthouse")
+    index.add("two rival bakers share one oven", "romance", "bakers")
+    mode, match = index.lookup("a keeper of bees", "drama")
+    assert mode == REUSE_MISS and match.document == "lighthouse"
+    index.add("a retired wizard opens a driving school", "comedy", "wizard")
+
+    assert index.search("lighthouse keeper map", "horror") is None
+    assert index.search("rival bakers oven", "romance").document == "bakers"
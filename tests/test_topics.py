@@ -0,0 +1,40 @@
+import pytest
+
+from story_common.topics import StoryTopic, extract_topic, parse_story_topic
+
+
+def test_parse_story_topic():
+    parsed = parse_story_topic("STORY: [topic: a keeper who finds a map, theme: Horror]")
+    assert parsed == StoryTopic(topic="a keeper who finds a map", theme="Horror")
+    assert parsed.format() == "STORY: [topic: a keeper who finds a map, theme: Horror]"
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Original input: something about cats",
+    "STORY: [topic: drama, theme: drama]",
+    "STORY: [topic: , theme: drama]",
+])
+def test_parse_story_topic_rejects_other_text(text):
+    assert parse_story_topic(text) is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("STORY: [topic: a keeper who finds a map, theme: horror]", ("a keeper who finds a map", "horror")),
+    ("topic: a programmer who teaches her laptop to dream, theme: sci-fi", ("a programmer who teaches her laptop to dream", "science fiction")),
+    ("theme: comedy; topic: a wizard who opens a driving school", ("a wizard who opens a driving school", "comedy")),
+    ("Please write a funny story about a wizard who opens a driving school.", ("a wizard who opens a driving school", "comedy")),
+    ("a romance short story about two rival bakers sharing one oven", ("two rival bakers sharing one oven", "romance")),
+])
+def test_extract_topic_from_well_formed_input(text, expected):
+    assert extract_topic(text) == StoryTopic(topic=expected[0], theme=expected[1])
+
+
+@pytest.mark.parametrize("text", [
+    "something spooky with an old librarian",
+    "a horror story about a ghost",
+    "a cooking story about a chef who loses his sense of taste",
+    "",
+])
+def test_extract_topic_leaves_ambiguous_input_to_the_llm(text):
+    assert extract_topic(text) is None
@@ -0,0 +1,32 @@
+import asyncio
+
+from story_common.user_input import QueueInputChannel
+
+
+def test_queue_channel_delivers_submitted_answers():
+    async def run():
+        channel = QueueInputChannel()
+        ask = asyncio.create_task(channel.ask("s", "[user]:", timeout=1))
+        await asyncio.sleep(0)
+        assert channel.waiting_sessions() == ["s"]
+        channel.submit("s", " horror \n")
+        assert await ask == "horror"
+        assert channel.waiting_sessions() == []
+        assert await channel.ask("s", "[user]:", timeout=0.01) is None
+
+    asyncio.run(run())
+
+
+def test_overlapping_asks_on_one_session():
+    async def run():
+        channel = QueueInputChannel()
+        first = asyncio.create_task(channel.ask("s", "[user]:", timeout=0.05))
+        second = asyncio.create_task(channel.ask("s", "[user]:", timeout=1))
+        # The first ask times out while the second one still waits on the session's queue
+        assert await first is None
+        assert channel.waiting_sessions() == ["s"]
+        channel.submit("s", "horror")
+        assert await second == "horror"
+        assert channel.waiting_sessions() == []
+
+    asyncio.run(run())